@@ -0,0 +1,380 @@
+"""
+Benchmark dei componenti KobakPDF e dei documenti completi.
+
+Per ogni caso misura latenza (percentili), throughput e dimensione del PDF,
+a dimensione realistica e di stress. I risultati si salvano in JSON e si
+confrontano con una baseline: il processo esce con codice 1 se un caso
+peggiora oltre le soglie. Anche senza baseline esce con codice 1 se l'import
+a freddo del generatore contratti supera di oltre --import-budget ms quello
+di fpdf2 misurato nella stessa esecuzione.
+
+Uso:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --filter zebra --iterations 50
+    python benchmarks/run_benchmarks.py --save-baseline benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json --output risultati.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import fpdf
+
+from generators.base_pdf import KobakPDF
+from generators.fragment_cache import FRAGMENT_CACHE, SECTION_CACHE
+from generators.image_cache import IMAGE_CACHE
+from generators.kobak_contract_pdf import KobakContractPDF, sample_contract_data
+from generators.output_cache import PdfOutputCache
+from generators.text_metrics import TEXT_METRICS_CACHE
+
+# Soglie di regressione di default (rapporto rispetto alla baseline)
+DEFAULT_TIME_THRESHOLD = 0.15
+DEFAULT_SIZE_THRESHOLD = 0.05
+# Costo massimo dell'import del generatore contratti oltre l'import di fpdf2
+DEFAULT_IMPORT_BUDGET_MS = 40.0
+
+
+class BenchCase(NamedTuple):
+    """
+    Caso di benchmark: run() genera un documento completo e restituisce
+    la dimensione in byte del PDF prodotto.
+    """
+    name: str
+    size: str
+    run: Callable[[], int]
+
+
+# ==================== DATI DI PROVA ====================
+
+LOREM = ("Il CLIENTE si impegna a utilizzare i bagni chimici secondo le istruzioni "
+         "fornite da KOBAK e a consentire l'accesso ai mezzi per la manutenzione periodica")
+
+
+def _rows(n: int) -> List[tuple]:
+    return [(f"Campo {i}:", f"Valore di prova numero {i}") for i in range(n)]
+
+
+def _table_rows(n: int) -> List[List[str]]:
+    return [[f"Bagno chimico modello {i % 7}", str(i % 5 + 1), "mese",
+             f"{100 + i % 50},00", f"{(100 + i % 50) * (i % 5 + 1)},00"] for i in range(n)]
+
+
+def _clauses(n: int) -> List[str]:
+    return [f"(Clausola {i}). {LOREM} {LOREM[:i % 80]}" for i in range(n)]
+
+
+def _document(component: Callable[[KobakPDF], None]) -> Callable[[], int]:
+    """Documento KobakPDF con una pagina su cui esegue il componente"""
+    def run():
+        pdf = KobakPDF()
+        pdf.add_page()
+        component(pdf)
+        return len(pdf.output())
+    return run
+
+
+def _repeat(n: int, component: Callable[[KobakPDF], None]) -> Callable[[KobakPDF], None]:
+    def run(pdf):
+        for _ in range(n):
+            component(pdf)
+    return run
+
+
+# ==================== CASI ====================
+
+def _contract(contract_data: dict, profile: str = 'standard') -> Callable[[], int]:
+    def run():
+        pdf = KobakContractPDF()
+        pdf.set_output_profile(profile)
+        return len(pdf.generate_contract(contract_data, None))
+    return run
+
+
+def _edited_contract(contract_data: dict) -> Callable[[], int]:
+    # Stesso contratto con un solo campo diverso a ogni render: le altre sezioni arrivano dalla cache
+    edits = iter(range(10 ** 9))
+
+    def run():
+        edited = dict(contract_data, payment={'method': f"Bonifico bancario {next(edits)} gg"})
+        pdf = KobakContractPDF()
+        pdf.section_cache = SECTION_CACHE
+        return len(pdf.generate_contract(edited, None))
+    return run
+
+
+def _cached_contract(contract_data: dict) -> Callable[[], int]:
+    # Cartella temporanea per tutta l'esecuzione: dopo il riscaldamento ogni render è un hit
+    directory = tempfile.TemporaryDirectory()
+    cache = PdfOutputCache(directory.name)
+
+    def run():
+        return len(cache.render(KobakContractPDF, contract_data))
+    run.directory = directory  # rimossa quando il caso non serve più
+    return run
+
+
+def _esempio_completo() -> int:
+    # Lo script di esempio scrive su file e stampa: isolato in una cartella temporanea
+    import esempio_dinamico
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            esempio_dinamico.esempio_completo()
+            return os.path.getsize('esempio_completo.pdf')
+        finally:
+            os.chdir(cwd)
+
+
+def _cold_start(code: str) -> Callable[[], int]:
+    # Processo Python nuovo a ogni iterazione: import e primo render a freddo
+    def run():
+        result = subprocess.run([sys.executable, '-c', code], cwd=Path(__file__).parent.parent, check=True,
+                                capture_output=True, text=True)
+        return int(result.stdout.strip() or 0)
+    return run
+
+
+def build_cases() -> List[BenchCase]:
+    stress_contract = sample_contract_data()
+    stress_contract['service_items'] = _table_rows(300)
+    stress_contract['contract_terms'] = _clauses(120)
+
+    headers = ['DESCRIZIONE', 'QTÀ', 'UNITÀ', 'PREZZO UNIT.', 'TOTALE']
+    widths = [0.40, 0.10, 0.15, 0.17, 0.18]
+
+    def zebra(n):
+        return lambda pdf: pdf.add_zebra_table(headers, _table_rows(n), col_widths=widths)
+
+    def ensure_space(pdf, height):
+        # I componenti a blocco non gestiscono il salto pagina: lo fa il chiamante
+        if pdf.get_y() + height > pdf.page_break_trigger:
+            pdf.add_page()
+
+    def card(pdf):
+        ensure_space(pdf, 50)
+        y = pdf.get_y()
+        height = pdf.add_info_card("DATI DEL CLIENTE", _rows(8))
+        pdf.set_y(y + height + 4)
+
+    def boxes(pdf):
+        ensure_space(pdf, 70)
+        pdf.add_two_column_info_boxes("DATI DEL CLIENTE", _rows(10), "SEDE DI POSTA", _rows(3))
+
+    def row_fill(n, text):
+        def run(pdf):
+            for i in range(n):
+                ensure_space(pdf, 20)
+                pdf.add_table_row_with_fill([f"{text} {i}", f"EUR {i},00"], [0.65, 0.35],
+                                            fill=True, font_style='B', aligns=['L', 'R'])
+        return run
+
+    def header_footer(pages):
+        def run(pdf):
+            for _ in range(pages - 1):
+                pdf.add_page()
+        return run
+
+    return [
+        BenchCase('header_footer', 'realistic', _document(header_footer(1))),
+        BenchCase('header_footer', 'stress', _document(header_footer(50))),
+        BenchCase('add_zebra_table', 'realistic', _document(zebra(10))),
+        BenchCase('add_zebra_table', 'stress', _document(zebra(500))),
+        BenchCase('add_info_card', 'realistic', _document(card)),
+        BenchCase('add_info_card', 'stress', _document(_repeat(60, card))),
+        BenchCase('add_two_column_info_boxes', 'realistic', _document(boxes)),
+        BenchCase('add_two_column_info_boxes', 'stress', _document(_repeat(40, boxes))),
+        BenchCase('add_table_row_with_fill', 'realistic', _document(row_fill(4, "TOTALE IMPONIBILE"))),
+        BenchCase('add_table_row_with_fill', 'stress', _document(row_fill(400, LOREM))),
+        BenchCase('add_contract_terms', 'realistic', _document(lambda pdf: pdf.add_contract_terms(_clauses(15)))),
+        BenchCase('add_contract_terms', 'stress', _document(lambda pdf: pdf.add_contract_terms(_clauses(200)))),
+        BenchCase('generate_contract', 'realistic', _contract(sample_contract_data())),
+        BenchCase('generate_contract', 'stress', _contract(stress_contract)),
+        BenchCase('generate_contract_edit', 'realistic', _edited_contract(sample_contract_data())),
+        BenchCase('generate_contract_cached', 'realistic', _cached_contract(sample_contract_data())),
+        BenchCase('generate_contract_compact', 'realistic', _contract(sample_contract_data(), 'compact')),
+        BenchCase('generate_contract_compact', 'stress', _contract(stress_contract, 'compact')),
+        BenchCase('esempio_completo', 'realistic', _esempio_completo),
+        BenchCase('cold_import', 'fpdf', _cold_start("import fpdf")),
+        BenchCase('cold_import', 'package', _cold_start("import generators")),
+        BenchCase('cold_import', 'kobak_contract_pdf', _cold_start("import generators.kobak_contract_pdf")),
+        BenchCase('cold_start_contract', 'realistic', _cold_start(
+            "import generators as g; print(len(g.KobakContractPDF().generate_contract(g.sample_contract_data(), None)))")),
+    ]
+
+
+# ==================== MISURA ====================
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Percentile con interpolazione lineare su valori già ordinati"""
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    pos = (len(sorted_values) - 1) * pct / 100
+    low = math.floor(pos)
+    high = math.ceil(pos)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (pos - low)
+
+
+def clear_process_caches():
+    FRAGMENT_CACHE.clear()
+    SECTION_CACHE.clear()
+    IMAGE_CACHE.clear()
+    TEXT_METRICS_CACHE.clear()
+
+
+def measure(case: BenchCase, iterations: int, warmup: int, cold: bool) -> Dict[str, float]:
+    for _ in range(warmup):
+        if cold:
+            clear_process_caches()
+        case.run()
+
+    timings = []
+    size = 0
+    for _ in range(iterations):
+        if cold:
+            clear_process_caches()
+        start = time.perf_counter()
+        size = case.run()
+        timings.append(time.perf_counter() - start)
+
+    timings.sort()
+    mean = sum(timings) / len(timings)
+    return {
+        'iterations': iterations,
+        'mean_ms': mean * 1000,
+        'min_ms': timings[0] * 1000,
+        'p50_ms': percentile(timings, 50) * 1000,
+        'p90_ms': percentile(timings, 90) * 1000,
+        'p99_ms': percentile(timings, 99) * 1000,
+        'max_ms': timings[-1] * 1000,
+        'throughput_per_s': 1 / mean if mean else 0.0,
+        'size_bytes': size,
+    }
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict],
+            time_threshold: float, size_threshold: float) -> List[str]:
+    """
+    Confronta p50 e dimensione con la baseline.
+    Soglie per caso possono stare nella baseline ("time_threshold", "size_threshold").
+
+    Returns:
+        Lista di messaggi di regressione (vuota se tutto ok)
+    """
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        max_time = base.get('time_threshold', time_threshold)
+        max_size = base.get('size_threshold', size_threshold)
+        time_ratio = result['p50_ms'] / base['p50_ms'] - 1 if base['p50_ms'] else 0.0
+        size_ratio = result['size_bytes'] / base['size_bytes'] - 1 if base['size_bytes'] else 0.0
+        if time_ratio > max_time:
+            regressions.append(f"{key}: p50 {base['p50_ms']:.2f} -> {result['p50_ms']:.2f} ms "
+                               f"(+{time_ratio:.0%}, soglia {max_time:.0%})")
+        if size_ratio > max_size:
+            regressions.append(f"{key}: dimensione {base['size_bytes']} -> {result['size_bytes']} byte "
+                               f"(+{size_ratio:.0%}, soglia {max_size:.0%})")
+    return regressions
+
+
+def check_import_budget(results: Dict[str, dict], budget_ms: float) -> List[str]:
+    """
+    Confronta l'import a freddo del generatore contratti con quello di fpdf2,
+    misurato nella stessa esecuzione: il resto del package non deve costare
+    più di budget_ms. Non richiede una baseline salvata.
+
+    Returns:
+        Lista di messaggi di regressione (vuota se tutto ok o casi non eseguiti)
+    """
+    reference = results.get('cold_import[fpdf]')
+    result = results.get('cold_import[kobak_contract_pdf]')
+    if reference is None or result is None:
+        return []
+    overhead = result['p50_ms'] - reference['p50_ms']
+    if overhead > budget_ms:
+        return [f"cold_import[kobak_contract_pdf]: p50 {result['p50_ms']:.2f} ms, "
+                f"{overhead:+.2f} ms rispetto a fpdf2 (budget {budget_ms:.0f} ms)"]
+    return []
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark componenti KobakPDF")
+    parser.add_argument('--iterations', type=int, default=20, help="Misure per caso (default: 20)")
+    parser.add_argument('--warmup', type=int, default=2, help="Esecuzioni di riscaldamento (default: 2)")
+    parser.add_argument('--filter', default=None, help="Esegue solo i casi che contengono questo testo")
+    parser.add_argument('--cold', action='store_true', help="Svuota le cache di processo prima di ogni misura")
+    parser.add_argument('--output', default=None, help="Salva i risultati in JSON")
+    parser.add_argument('--baseline', default=None, help="Baseline JSON con cui confrontare")
+    parser.add_argument('--save-baseline', default=None, help="Salva i risultati come nuova baseline")
+    parser.add_argument('--time-threshold', type=float, default=DEFAULT_TIME_THRESHOLD,
+                        help="Peggioramento massimo di p50 (default: 0.15 = +15%%)")
+    parser.add_argument('--size-threshold', type=float, default=DEFAULT_SIZE_THRESHOLD,
+                        help="Aumento massimo della dimensione (default: 0.05 = +5%%)")
+    parser.add_argument('--import-budget', type=float, default=DEFAULT_IMPORT_BUDGET_MS,
+                        help="Costo massimo in ms dell'import del generatore oltre fpdf2 (default: 40)")
+    args = parser.parse_args(argv)
+
+    results: Dict[str, dict] = {}
+    print(f"{'caso':<42} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'doc/s':>8} {'byte':>9}")
+    for case in build_cases():
+        key = f"{case.name}[{case.size}]"
+        if args.filter and args.filter not in key:
+            continue
+        result = measure(case, args.iterations, args.warmup, args.cold)
+        results[key] = result
+        print(f"{key:<42} {result['p50_ms']:>9.2f} {result['p90_ms']:>9.2f} {result['p99_ms']:>9.2f} "
+              f"{result['throughput_per_s']:>8.1f} {result['size_bytes']:>9}")
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'fpdf2': fpdf.__version__,
+            'platform': platform.platform(),
+            'iterations': args.iterations,
+            'cold': args.cold,
+        },
+        'results': results,
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            print(f"\n💾 Risultati salvati in {path}")
+
+    status = 0
+    over_budget = check_import_budget(results, args.import_budget)
+    if over_budget:
+        print("\n❌ Import oltre il budget:")
+        for message in over_budget:
+            print(f"   - {message}")
+        status = 1
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.time_threshold, args.size_threshold)
+        if regressions:
+            print("\n❌ Regressioni rispetto alla baseline:")
+            for message in regressions:
+                print(f"   - {message}")
+            return 1
+        print("\n✅ Nessuna regressione rispetto alla baseline")
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
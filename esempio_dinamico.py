@@ -10,6 +10,7 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent))
 
 from generators.base_pdf import KobakPDF
+from generators.render_plan import compile_spec
 
 # ==================== ESEMPIO 1: Info Section Singola ====================
 def esempio_singola_colonna():
@@ -169,43 +170,44 @@ def esempio_da_json():
         }
     }
     
-    pdf = KobakPDF()
-    pdf.add_page()
-    
-    # Estrai e converti automaticamente
-    cliente = dati_api['cliente']
-    righe_cliente = [
-        ('Ragione Sociale:', cliente['ragione_sociale']),
-        ('Referente:', cliente['referente']),
-        ('Telefono:', cliente['contatti']['telefono']),
-        ('Mobile:', cliente['contatti']['mobile']),
-        ('Email:', cliente['contatti']['email']),
-        ('PEC:', cliente['contatti']['pec']),
-        ('Partita IVA:', cliente['fiscali']['partita_iva']),
-        ('Codice Fiscale:', cliente['fiscali']['codice_fiscale']),
-        ('Codice SDI:', cliente['fiscali']['codice_sdi'])
-    ]
-    
-    progetto = dati_api['progetto']
-    righe_progetto = [
-        ('Codice Progetto:', progetto['codice']),
-        ('Descrizione:', progetto['descrizione']),
-        ('Data Inizio:', progetto['data_inizio']),
-        ('Data Fine:', progetto['data_fine']),
-        ('Responsabile:', progetto['responsabile'])
-    ]
+    # Specifica dichiarativa: sezioni, componenti e percorsi dei campi.
+    # Potrebbe arrivare anche da un file JSON (load_spec)
+    spec = json.dumps({
+        "sections": [
+            {"name": "cliente_progetto", "components": [
+                {"component": "page"},
+                {"component": "info_section",
+                 "two_columns": True,
+                 "left_header": "CLIENTE",
+                 "left_rows": {"fields": [
+                     ["Ragione Sociale:", "cliente.ragione_sociale"],
+                     ["Referente:", "cliente.referente"],
+                     ["Telefono:", "cliente.contatti.telefono"],
+                     ["Mobile:", "cliente.contatti.mobile"],
+                     ["Email:", "cliente.contatti.email"],
+                     ["PEC:", "cliente.contatti.pec"],
+                     ["Partita IVA:", "cliente.fiscali.partita_iva"],
+                     ["Codice Fiscale:", "cliente.fiscali.codice_fiscale"],
+                     ["Codice SDI:", "cliente.fiscali.codice_sdi"]
+                 ]},
+                 "left_header_bg": "primary",
+                 "right_header": "PROGETTO",
+                 "right_rows": {"fields": [
+                     ["Codice Progetto:", "progetto.codice"],
+                     ["Descrizione:", "progetto.descrizione"],
+                     ["Data Inizio:", "progetto.data_inizio"],
+                     ["Data Fine:", "progetto.data_fine"],
+                     ["Responsabile:", "progetto.responsabile"]
+                 ]},
+                 "right_header_bg": "chip_gray",
+                 "col_ratio": 0.6}  # Cliente più largo
+            ]}
+        ]
+    })
     
-    # Layout completo con un colpo solo
-    pdf.add_info_section(
-        two_columns=True,
-        left_header='CLIENTE',
-        left_rows=righe_cliente,
-        left_header_bg='primary',
-        right_header='PROGETTO',
-        right_rows=righe_progetto,
-        right_header_bg='chip_gray',
-        col_ratio=0.6  # Cliente più largo
-    )
+    # Compila una volta, poi il piano si riusa per ogni record
+    plan = compile_spec(spec)
+    pdf = plan.build(dati_api)
     
     pdf.output('esempio_da_api.pdf')
     print("✓ PDF da dati API/DB creato!")
@@ -1 +1,76 @@
-# Generators per i PDF Kobak
+"""
+Generatori per i PDF Kobak.
+
+L'import del pacchetto non carica fpdf2: i generatori si importano al primo
+accesso (es. generators.KobakContractPDF, cioè al primo render), così i
+worker che non renderizzano subito non pagano l'avvio di fpdf2.
+
+    import generators
+    pdf_bytes = generators.KobakContractPDF().generate_contract(data, None)
+
+generators.preload() anticipa il caricamento (es. all'avvio di un worker
+prima di accettare richieste).
+"""
+import gc
+import importlib
+from contextlib import contextmanager
+
+# Nome pubblico -> modulo che lo definisce (caricato al primo accesso)
+_LAZY_ATTRIBUTES = {
+    'KobakPDF': 'generators.base_pdf',
+    'KobakContractPDF': 'generators.kobak_contract_pdf',
+    'generate_contracts_batch': 'generators.kobak_contract_pdf',
+    'sample_contract_data': 'generators.kobak_contract_pdf',
+    'AsyncRenderer': 'generators.async_render',
+    'render_contract': 'generators.async_render',
+    'compile_spec': 'generators.render_plan',
+    'load_spec': 'generators.render_plan',
+    'register_font': 'generators.fonts',
+    'PdfPool': 'generators.pdf_pool',
+    'append_pages': 'generators.incremental',
+    'render_sections': 'generators.parallel_render',
+    'ReportSection': 'generators.parallel_render',
+    'merge_pdfs': 'generators.assembly',
+    'PdfOutputCache': 'generators.output_cache',
+    'RenderServer': 'generators.render_server',
+}
+
+__all__ = sorted(_LAZY_ATTRIBUTES) + ['preload']
+
+
+@contextmanager
+def gc_paused():
+    """
+    Sospende il garbage collector: l'import di fpdf2 crea molti oggetti
+    longevi e le raccolte durante l'import li scandiscono senza liberare nulla.
+    All'uscita gc.freeze() li sposta nella generazione permanente, così le
+    raccolte successive (il resto degli import del package) non li ripercorrono.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.freeze()
+            gc.enable()
+
+
+def __getattr__(name):
+    module_name = _LAZY_ATTRIBUTES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module 'generators' has no attribute {name!r}")
+    with gc_paused():
+        value = getattr(importlib.import_module(module_name), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
+
+
+def preload():
+    """Carica subito fpdf2 e i generatori principali"""
+    for name in ('KobakPDF', 'KobakContractPDF'):
+        __getattr__(name)
@@ -0,0 +1,298 @@
+"""
+Concatenazione di PDF prodotti da KobakPDF in un unico documento.
+
+Gli oggetti di ogni PDF in ingresso vengono rinumerati e scritti subito
+sullo stream di uscita: in memoria restano solo la mappa degli offset e le
+impronte degli oggetti già scritti, e i file in ingresso si leggono con seek
+un oggetto alla volta. Gli oggetti identici fra ingressi diversi (font,
+immagini, form XObject, pagine statiche) vengono scritti una volta sola.
+
+    with open("report.pdf", "wb") as f:
+        assembler = PdfAssembler(f)
+        for chunk in chunks:
+            assembler.add(chunk)
+        assembler.close()
+
+    # Tiratura di stampa: un segnalibro per contratto
+    merge_pdfs(Path("contratti").glob("*.pdf"), "stampa.pdf")
+"""
+import hashlib
+import io
+import re
+from os import PathLike
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple, Union
+
+from generators.pdf_objects import PdfReader, ref, referenced, replace_refs, serialize_object
+
+_PARENT = re.compile(rb'/Parent\s+\d+ \d+ R\b\s*')
+_KIDS = re.compile(rb'/Kids\s*\[([^\]]*)\]')
+_MEDIABOX = re.compile(rb'/MediaBox\s*\[[^\]]*\]')
+_PAGES_TYPE = re.compile(rb'/Type\s*/Pages\b')
+_OPEN_ACTION = re.compile(rb'/OpenAction\s*\[\s*\d+ \d+ R\s*([^\]]*)\]')
+_CATALOG_NAMES = re.compile(rb'/(?:PageLayout|PageMode)\s*/\w+')
+_VERSION = re.compile(rb'%PDF-(\d\.\d)')
+
+# Numeri riservati: radice Pages e catalogo, scritti in close()
+_PAGES_NUM = 1
+_CATALOG_NUM = 2
+
+PdfSource = Union[str, PathLike, BinaryIO, bytes, bytearray]
+
+
+class MergeReport(NamedTuple):
+    """Esito di merge_pdfs"""
+    documents: int
+    pages: int
+    deduplicated: int
+    size: int
+
+    def summary(self) -> str:
+        return (f"{self.documents} documenti, {self.pages} pagine, "
+                f"{self.deduplicated} oggetti condivisi, {self.size / 1024:.1f} KB")
+
+
+class PdfAssembler:
+    """
+    Scrive su out un PDF con le pagine di tutti i documenti aggiunti,
+    nell'ordine. Ingressi prodotti da fpdf2 o dal profilo compatto (xref
+    stream e object stream), non cifrati.
+    """
+
+    def __init__(self, out: BinaryIO):
+        self.out = out
+        self.page_count = 0
+        self.document_count = 0
+        self.deduplicated = 0
+        self._position = 0
+        self._offsets: Dict[int, int] = {}
+        self._next_num = _CATALOG_NUM + 1
+        self._kids: List[int] = []
+        # Impronta (corpo rinumerato + stream) -> numero nel documento di uscita
+        self._digests: Dict[bytes, int] = {}
+        self._version: Optional[bytes] = None
+        self._catalog_entries: List[bytes] = []
+        self._info_num: Optional[int] = None
+        # Segnalibri: (titolo, numero della prima pagina del documento)
+        self._outline: List[Tuple[str, int]] = []
+        self._checksum = hashlib.md5()
+
+    def _write(self, data: bytes):
+        self.out.write(data)
+        self._position += len(data)
+        self._checksum.update(data)
+
+    def _reserve(self) -> int:
+        num = self._next_num
+        self._next_num += 1
+        return num
+
+    def _write_object(self, num: int, body: bytes, stream: Optional[bytes]):
+        self._offsets[num] = self._position
+        self._write(serialize_object(num, 0, body, stream))
+
+    # ==================== INGRESSI ====================
+
+    def add(self, source: PdfSource, title: Optional[str] = None) -> int:
+        """
+        Accoda le pagine di un PDF.
+
+        Args:
+            source: Percorso, byte del PDF o stream binario con seek
+            title: Se indicato, segnalibro alla prima pagina del documento
+
+        Returns:
+            Numero di pagine aggiunte
+        """
+        if isinstance(source, (str, PathLike)):
+            with open(source, 'rb') as f:
+                return self._add(f, title)
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = io.BytesIO(source)
+        return self._add(source, title)
+
+    def _add(self, source: BinaryIO, title: Optional[str]) -> int:
+        reader = PdfReader(source)
+        if b'/Encrypt' in reader.trailer:
+            raise ValueError("PDF cifrati non supportati")
+        version = _VERSION.match(reader.read(0, 16))
+        version = version.group(1) if version else b'1.3'
+        if self._version is None:
+            self._version = version
+            self._write(b'%PDF-' + version + b'\n%\xe9\xeb\xf1\xbf\n')
+        elif version > self._version:
+            self._version = version
+
+        catalog = reader.object(ref(reader.trailer, b'/Root')[0])
+        pages = self._leaf_pages(reader, ref(catalog.body, b'/Pages')[0], None)
+        mapping = {num: self._reserve() for num, _ in pages}
+        if not self.document_count:
+            self._first_document(reader, catalog.body, mapping)
+        self.document_count += 1
+        if title is not None and pages:
+            self._outline.append((title, mapping[pages[0][0]]))
+
+        for num, mediabox in pages:
+            obj = reader.object(num)
+            body = _PARENT.sub(b'', obj.body)
+            # Le pagine di fpdf2 ereditano il formato dalla radice: lo rendono esplicito
+            if mediabox and not _MEDIABOX.search(body):
+                body = body.replace(b'<<', b'<<\n' + mediabox, 1)
+            for child in referenced(body):
+                self._place(reader, child, mapping, set())
+            body = self._renumber(body, mapping).replace(b'<<', b'<<\n/Parent %d 0 R' % _PAGES_NUM, 1)
+            self._write_object(mapping[num], body, obj.stream)
+            self._kids.append(mapping[num])
+        self.page_count += len(pages)
+        return len(pages)
+
+    def _leaf_pages(self, reader: PdfReader, num: int, mediabox: Optional[bytes]) -> List[Tuple[int, Optional[bytes]]]:
+        """Pagine dell'albero Pages in ordine, con il MediaBox ereditato"""
+        node = reader.object(num)
+        own = _MEDIABOX.search(node.body)
+        mediabox = own.group(0) if own else mediabox
+        if not _PAGES_TYPE.search(node.body):
+            return [(num, mediabox)]
+        kids = _KIDS.search(node.body)
+        leaves = []
+        for kid in referenced(kids.group(1) if kids else b''):
+            leaves.extend(self._leaf_pages(reader, kid, mediabox))
+        return leaves
+
+    def _first_document(self, reader: PdfReader, catalog: bytes, mapping: Dict[int, int]):
+        """Info, layout di apertura e azione iniziale presi dal primo documento"""
+        self._catalog_entries.extend(_CATALOG_NAMES.findall(catalog))
+        open_action = _OPEN_ACTION.search(catalog)
+        if open_action and mapping:
+            first_page = min(mapping.values())
+            self._catalog_entries.append(b'/OpenAction [%d 0 R %s]' % (first_page, open_action.group(1).strip()))
+        if b'/Info' in reader.trailer:
+            self._info_num = self._place(reader, ref(reader.trailer, b'/Info')[0], {}, set())
+
+    def _renumber(self, body: bytes, mapping: Dict[int, int]) -> bytes:
+        return replace_refs(body, lambda num, gen: b'%d 0 R' % mapping[num])
+
+    def _place(self, reader: PdfReader, num: int, mapping: Dict[int, int], visiting: Set[int]) -> int:
+        """
+        Scrive l'oggetto num (dopo quelli che referenzia) e ne restituisce il
+        numero di uscita. Un oggetto identico a uno già scritto non viene
+        riscritto; gli oggetti in un ciclo di riferimenti ricevono un numero
+        in anticipo e non vengono deduplicati.
+        """
+        if num in mapping and num not in visiting:
+            return mapping[num]
+        obj = reader.object(num)
+        visiting.add(num)
+        for child in referenced(obj.body):
+            if child in visiting:
+                mapping.setdefault(child, self._reserve())
+            elif child not in mapping:
+                self._place(reader, child, mapping, visiting)
+        visiting.discard(num)
+
+        body = self._renumber(obj.body, mapping)
+        if num in mapping:
+            self._write_object(mapping[num], body, obj.stream)
+            return mapping[num]
+        digest = hashlib.sha256(body + b'\0' + (obj.stream or b'')).digest()
+        existing = self._digests.get(digest)
+        if existing is not None:
+            self.deduplicated += 1
+            mapping[num] = existing
+            return existing
+        mapping[num] = self._digests[digest] = self._reserve()
+        self._write_object(mapping[num], body, obj.stream)
+        return mapping[num]
+
+    # ==================== CHIUSURA ====================
+
+    def close(self) -> int:
+        """Scrive radice Pages, catalogo, xref e trailer; restituisce i byte scritti"""
+        if not self._kids:
+            raise ValueError("Nessuna pagina da scrivere")
+        self._write_object(_PAGES_NUM, b'<<\n/Type /Pages\n/Kids [%s]\n/Count %d\n>>' % (
+            b' '.join(b'%d 0 R' % num for num in self._kids), len(self._kids)), None)
+        entries = [b'/Type /Catalog', b'/Pages %d 0 R' % _PAGES_NUM] + self._catalog_entries
+        if self._outline:
+            entries.append(b'/Outlines %d 0 R' % self._write_outline())
+            entries = [entry for entry in entries if not entry.startswith(b'/PageMode')]
+            entries.append(b'/PageMode /UseOutlines')
+        if self._version > b'1.3':
+            entries.append(b'/Version /' + self._version)
+        self._write_object(_CATALOG_NUM, b'<<\n' + b'\n'.join(entries) + b'\n>>', None)
+
+        xref_offset = self._position
+        size = self._next_num
+        missing = [num for num in range(1, size) if num not in self._offsets]
+        if missing:
+            raise RuntimeError(f"Oggetti riservati ma non scritti: {missing[:10]}")
+        table = [b'xref\n0 %d\n0000000000 65535 f \n' % size]
+        table.extend(b'%010d 00000 n \n' % self._offsets[num] for num in range(1, size))
+        file_id = self._checksum.hexdigest().upper().encode()
+        trailer = [b'trailer\n<<\n/Size %d\n/Root %d 0 R\n' % (size, _CATALOG_NUM)]
+        if self._info_num is not None:
+            trailer.append(b'/Info %d 0 R\n' % self._info_num)
+        trailer.append(b'/ID [<%s><%s>]\n>>\nstartxref\n%d\n%%%%EOF\n' % (file_id, file_id, xref_offset))
+        self._write(b''.join(table) + b''.join(trailer))
+        return self._position
+
+    def _write_outline(self) -> int:
+        """Radice /Outlines con un segnalibro per documento (lista piatta)"""
+        root = self._reserve()
+        items = [self._reserve() for _ in self._outline]
+        for index, (num, (title, page)) in enumerate(zip(items, self._outline)):
+            entries = [b'/Title ' + _text_string(title), b'/Parent %d 0 R' % root,
+                       b'/Dest [%d 0 R /XYZ null null null]' % page]
+            if index > 0:
+                entries.append(b'/Prev %d 0 R' % items[index - 1])
+            if index < len(items) - 1:
+                entries.append(b'/Next %d 0 R' % items[index + 1])
+            self._write_object(num, b'<<\n' + b'\n'.join(entries) + b'\n>>', None)
+        self._write_object(root, b'<<\n/Type /Outlines\n/First %d 0 R\n/Last %d 0 R\n/Count %d\n>>'
+                           % (items[0], items[-1], len(items)), None)
+        return root
+
+
+def _text_string(text: str) -> bytes:
+    """Stringa di testo PDF in UTF-16BE esadecimale (qualsiasi carattere)"""
+    return b'<FEFF' + text.encode('utf-16-be').hex().upper().encode() + b'>'
+
+
+# ==================== UNIONE DI FILE ====================
+
+def merge_pdfs(sources: Iterable[Union[PdfSource, Tuple[str, PdfSource]]],
+               dest: Union[str, PathLike, BinaryIO],
+               outline: bool = True) -> MergeReport:
+    """
+    Unisce più PDF di KobakPDF (es. i contratti del giorno) in un solo file.
+
+    Gli ingressi vengono letti uno alla volta, anche da un generatore,
+    quindi la memoria non dipende dal numero di documenti.
+
+    Args:
+        sources: Percorsi, byte o stream dei PDF, nell'ordine; oppure
+            coppie (titolo del segnalibro, sorgente)
+        dest: Percorso o stream binario di uscita
+        outline: Se True aggiunge un segnalibro per documento (titolo
+            esplicito o nome del file senza estensione)
+
+    Returns:
+        MergeReport
+    """
+    if not hasattr(dest, 'write'):
+        with open(dest, 'wb') as f:
+            return merge_pdfs(sources, f, outline)
+
+    assembler = PdfAssembler(dest)
+    for index, source in enumerate(sources, 1):
+        title = None
+        if isinstance(source, tuple):
+            title, source = source
+        elif isinstance(source, (str, PathLike)):
+            title = Path(source).stem
+        if outline:
+            assembler.add(source, title or f"Documento {index}")
+        else:
+            assembler.add(source)
+    size = assembler.close()
+    return MergeReport(assembler.document_count, assembler.page_count, assembler.deduplicated, size)
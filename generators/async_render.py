@@ -0,0 +1,131 @@
+"""
+Front-end asyncio per il rendering dei PDF.
+
+Il rendering è CPU-bound: eseguirlo in un handler asincrono blocca l'event
+loop per tutta la durata. Qui i render girano su un executor limitato
+(processi di default, thread opzionali) e l'handler attende solo i byte:
+
+    pdf_bytes = await render_contract(contract_data, timeout=10)
+"""
+import asyncio
+import os
+import weakref
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from generators.kobak_contract_pdf import KobakContractPDF
+from generators.output_cache import render_document
+
+
+def _render_contract_bytes(pdf_class, contract_data) -> bytes:
+    """Eseguito nel worker: genera il contratto e restituisce i byte"""
+    return render_document(pdf_class, contract_data)
+
+
+class AsyncRenderer:
+    """
+    Esegue render su un executor limitato, con limite di concorrenza,
+    timeout e cancellazione.
+
+    Un render cancellato (o scaduto) viene tolto dalla coda se non è ancora
+    partito; se è già in esecuzione nel worker arriva comunque in fondo, e il
+    suo posto nel limite di concorrenza si libera solo a render terminato.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_concurrency: Optional[int] = None,
+                 use_processes: bool = True, pdf_class=KobakContractPDF):
+        """
+        Args:
+            max_workers: Worker dell'executor (default: numero di CPU)
+            max_concurrency: Render accettati contemporaneamente, in coda o in
+                esecuzione (default: max_workers); gli altri attendono
+            use_processes: Se True usa processi (rendering in parallelo reale),
+                altrimenti thread (niente avvio processi, ma limitati dal GIL)
+            pdf_class: Generatore usato da render_contract (importabile dai worker)
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_concurrency = max(1, max_concurrency or self.max_workers)
+        self.use_processes = use_processes
+        self.pdf_class = pdf_class
+        self._executor: Optional[Executor] = None
+        # Un semaforo per event loop (asyncio.Semaphore è legato al loop)
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = \
+            weakref.WeakKeyDictionary()
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            executor_class = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+            self._executor = executor_class(max_workers=self.max_workers)
+        return self._executor
+
+    def _semaphore(self, loop: asyncio.AbstractEventLoop) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    async def run(self, fn: Callable[..., Any], *args, timeout: Optional[float] = None) -> Any:
+        """
+        Esegue fn(*args) sull'executor senza bloccare l'event loop.
+        Con i processi fn e argomenti devono essere serializzabili (pickle).
+
+        Raises:
+            asyncio.TimeoutError: se il render non termina entro timeout secondi
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphore(loop)
+        await semaphore.acquire()
+        try:
+            future = self.executor.submit(fn, *args)
+        except BaseException:
+            semaphore.release()
+            raise
+
+        def release(_):
+            # Il posto si libera quando il worker ha davvero finito
+            try:
+                loop.call_soon_threadsafe(semaphore.release)
+            except RuntimeError:  # loop già chiuso
+                pass
+        future.add_done_callback(release)
+
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+
+    async def render_contract(self, contract_data: dict, timeout: Optional[float] = None) -> bytes:
+        """Genera un contratto e restituisce i byte del PDF"""
+        return await self.run(_render_contract_bytes, self.pdf_class, contract_data, timeout=timeout)
+
+    def shutdown(self, wait: bool = True, cancel_futures: bool = False):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+            self._executor = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        # Non blocca il loop in attesa dei worker
+        await asyncio.get_running_loop().run_in_executor(None, self.shutdown)
+
+
+_default_renderer: Optional[AsyncRenderer] = None
+
+
+def get_default_renderer() -> AsyncRenderer:
+    """Renderer condiviso dal processo, creato al primo utilizzo"""
+    global _default_renderer
+    if _default_renderer is None:
+        _default_renderer = AsyncRenderer()
+    return _default_renderer
+
+
+async def render_contract(contract_data: dict, timeout: Optional[float] = None) -> bytes:
+    """
+    Genera un contratto sul renderer di default e restituisce i byte del PDF.
+
+    Args:
+        contract_data: Dati del contratto (come per generate_contract)
+        timeout: Secondi massimi di attesa (None = nessun limite)
+    """
+    return await get_default_renderer().render_contract(contract_data, timeout=timeout)
@@ -1,7 +1,41 @@
-from typing import Literal, List, Dict, Any, Optional, Sequence, Tuple, Callable
-from fpdf import FPDF
-from fpdf.enums import XPos, YPos, Align, RenderStyle, TableCellFillMode
-from fpdf.fonts import FontFace
+import copy
+import hashlib
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from enum import Enum
+from itertools import islice
+from os import PathLike
+from pathlib import Path
+from typing import Literal, List, Dict, Any, Optional, Sequence, Tuple, Callable, Union, BinaryIO, Hashable, Iterable
+
+from generators import gc_paused
+
+# Primo import di fpdf2 (anche con import diretto del modulo): GC sospeso, avvio a freddo più rapido
+with gc_paused():
+    from fpdf import FPDF
+    from fpdf.enums import XPos, YPos, Align, RenderStyle, TableCellFillMode, PDFResourceType
+    from fpdf.errors import FPDFException
+    from fpdf.fonts import FontFace, TTFFont
+    from fpdf.image_datastructures import RasterImageInfo
+    from fpdf.line_break import TextLine
+    from fpdf.table import Table
+
+    try:
+        from fpdf.drawing_primitives import convert_to_device_color
+    except ImportError:  # versioni meno recenti di fpdf2
+        from fpdf.drawing import convert_to_device_color
+
+from generators.compact import CompactReport, compact_pdf
+from generators.compression import COMPRESSION_DEFAULT, ParallelOutputProducer
+from generators.fonts import FONT_REGISTRY, SubsetCacheOutputProducer
+from generators.fragment_cache import (
+    FRAGMENT_CACHE, FONT_OPERATOR, UNCACHEABLE_OPERATORS, FragmentCache, MultiPageFragment, PageFragment,
+)
+from generators.image_cache import IMAGE_CACHE, ImageInfoCache
+from generators.layout import CardLayout, CardRow, LineBox, Pagination
+from generators.tables import ContinuationTable, LayoutContinuationTable, LayoutTable
+from generators.text_metrics import TEXT_METRICS_CACHE, glyph_width_table, wrap_text
+from generators.tracing import install_tracing, uninstall_tracing
 
 
 # 📏 CONFIGURAZIONE FONT STANDARD KOBAK
@@ -13,6 +47,77 @@ FONT_CONFIG = {
     'small': {'size': 9, 'height': 11, 'style': 'I'},
 }
 
+# Attributi fpdf che descrivono lo stato grafico corrente
+GRAPHICS_STATE_ATTRS = (
+    'font_family', 'font_style', 'font_size_pt', 'underline', 'strikethrough',
+    'current_font', 'text_color', 'draw_color', 'fill_color', 'line_width',
+)
+
+
+class KobakOutputProducer(SubsetCacheOutputProducer, ParallelOutputProducer):
+    """Output di KobakPDF: subset condivisi dei font del registro e compressione configurabile"""
+
+
+# Profili di output (vedi set_output_profile)
+OUTPUT_PROFILES = ('standard', 'compact')
+
+# Ripristino dello stato iniziale (vedi KobakPDF.reset): come ricreare ogni attributo
+_SHARE, _COPY, _COPY_ITEMS, _NEW, _DEEPCOPY = range(5)
+_IMMUTABLE_TYPES = (type(None), bool, int, float, complex, str, bytes, Enum, frozenset, datetime)
+
+
+def _is_immutable(value) -> bool:
+    if isinstance(value, tuple):
+        return all(_is_immutable(item) for item in value)
+    return isinstance(value, _IMMUTABLE_TYPES)
+
+
+def _restore_mode(value) -> int:
+    """
+    Il modo più economico per riottenere value in un documento nuovo:
+    condiviso se immutabile, copia di un contenitore piatto, copia degli
+    elementi che sanno copiarsi (stack di stato grafico), nuova istanza
+    se il costruttore senza argomenti dà lo stesso stato, altrimenti deepcopy.
+    """
+    if _is_immutable(value):
+        return _SHARE
+    if isinstance(value, dict):
+        if all(_is_immutable(key) and _is_immutable(item) for key, item in value.items()):
+            return _COPY
+        return _DEEPCOPY
+    if isinstance(value, (list, set, bytearray)):
+        if all(_is_immutable(item) for item in value):
+            return _COPY
+        if isinstance(value, list) and all(callable(getattr(item, 'copy', None)) for item in value):
+            return _COPY_ITEMS
+        return _DEEPCOPY
+    import pickle  # solo per save_initial_state: fuori dall'avvio a freddo
+    try:
+        if pickle.dumps(type(value)()) == pickle.dumps(value):
+            return _NEW
+    except Exception:
+        pass
+    return _DEEPCOPY
+
+
+# Colori già convertiti da convert_to_device_color, per argomenti (r, g, b)
+_DEVICE_COLORS: Dict[Hashable, Any] = {}
+_DEVICE_COLORS_MAX = 1024
+
+
+def _device_color(r, g=-1, b=-1):
+    key = (r, g, b)
+    try:
+        return _DEVICE_COLORS[key]
+    except KeyError:
+        color = convert_to_device_color(r, g, b)
+        if len(_DEVICE_COLORS) < _DEVICE_COLORS_MAX:
+            _DEVICE_COLORS[key] = color
+        return color
+    except TypeError:  # argomenti non hashable (es. liste)
+        return convert_to_device_color(r, g, b)
+
+
 # 🎨 PALETTE KOBAK
 COLORS = {
     'primary': (249, 221, 0),
@@ -63,11 +168,277 @@ class KobakPDF(FPDF):
         self.set_title(f"Documento {company_name}")
         self.set_author(company_name)
         self.footer_note = "SERVIZIO EFFETTUATO IN CONFORMITA' CON LA UNI EN 16194"
+        # Chiamate di stato grafico saltate perché non cambiavano nulla
+        self.skipped_state_calls = 0
+        # Tracing dei componenti (None = disattivato, nessun costo)
+        self._tracer = None
+        # Dry-run e pagine occupate dalle sezioni (vedi section())
+        self.dry_run = False
+        self.section_pages: Dict[str, Tuple[int, int]] = {}
+        self._section_first_page: Optional[int] = None
+        self._page_setup_depth = 0
+        # Registrazione di un frammento in corso: parti già chiuse dai salti pagina e parte aperta
+        self._fragment_parts: Optional[List[PageFragment]] = None
+        self._fragment_part: Optional[tuple] = None
+        # Livelli di local_context già aperti all'inizio del frammento in registrazione
+        self._fragment_depth = 0
+        # Numerazione per pagine aggiunte a un documento esistente (vedi incremental.py)
+        self.page_number_offset = 0
+        self.total_pages: Optional[int] = None
+        # Compressione dei content stream in output: (livello, parallela), None = fpdf2
+        self.stream_compression: Optional[Tuple[int, bool]] = None
+        # Profilo di output ('standard' o 'compact') e confronto dimensioni dell'ultimo output compatto
+        self.output_profile = 'standard'
+        self.compact_report: Optional[CompactReport] = None
+        # Stato salvato da save_initial_state() per reset(): (valori condivisi, (nome, valore, modo) da ricreare)
+        self._initial_state: Optional[Tuple[Dict[str, Any], Tuple[Tuple[str, Any, int], ...]]] = None
 
     @property
     def content_width(self) -> float:
         return self.w - self.l_margin - self.r_margin
 
+    def output_to(self, dest: Union[str, PathLike, BinaryIO, None] = None):
+        """
+        Chiude il documento e lo invia alla destinazione richiesta.
+
+        Args:
+            dest: None per ottenere i byte del PDF, un oggetto binario con
+                write() (es. BytesIO, risposta HTTP) per scriverci direttamente,
+                oppure un percorso su disco
+
+        Returns:
+            I byte del PDF (bytearray, senza copie) se dest è None,
+            altrimenti dest stesso
+        """
+        if dest is None:
+            return self.output()
+        if hasattr(dest, 'write'):
+            dest.write(self.output())
+            return dest
+        self.output(dest)
+        return dest
+
+    def set_stream_compression(self, level: int = COMPRESSION_DEFAULT, parallel: bool = True):
+        """
+        Comprime i content stream delle pagine su un pool di thread in output().
+
+        Args:
+            level: Livello zlib, da COMPRESSION_FAST (1, bassa latenza)
+                a COMPRESSION_BEST (9); COMPRESSION_DEFAULT come fpdf2
+            parallel: False per comprimere nel thread corrente (solo livello)
+        """
+        self.stream_compression = (level, parallel)
+
+    def set_output_profile(self, profile: Literal['standard', 'compact']):
+        """
+        Profilo del file prodotto da output():
+        - 'standard': PDF di fpdf2
+        - 'compact': PDF 1.5 con object stream e xref stream, senza oggetti
+          inutilizzati né duplicati (archiviazione, PEC); il confronto delle
+          dimensioni resta in compact_report
+        """
+        if profile not in OUTPUT_PROFILES:
+            raise ValueError(f"Profilo di output sconosciuto: {profile!r} (validi: {', '.join(OUTPUT_PROFILES)})")
+        self.output_profile = profile
+
+    def output(self, name='', **kwargs):
+        kwargs.setdefault('output_producer_class', KobakOutputProducer)
+        if self.total_pages is not None and not self.buffer:
+            self._substitute_total_pages()
+        if self.output_profile != 'compact':
+            return super().output(name, **kwargs)
+
+        if self.compact_report is None:
+            compacted, self.compact_report = compact_pdf(super().output(**kwargs))
+            self.buffer = bytearray(compacted)
+        if not name:
+            return self.buffer
+        if isinstance(name, (str, PathLike)):
+            Path(name).write_bytes(self.buffer)
+        else:
+            name.write(self.buffer)
+        return None
+
+    # ==================== RIUSO DELL'ISTANZA ====================
+
+    def save_initial_state(self):
+        """
+        Salva lo stato attuale come punto di ripristino per reset().
+        Da chiamare subito dopo la creazione (lo fa PdfPool).
+        """
+        self._initial_state = None
+        # I riferimenti al documento stesso restano riferimenti al documento
+        state = copy.deepcopy(self.__dict__, {id(self): self})
+        modes = {key: _restore_mode(value) for key, value in state.items()}
+        self._initial_state = (
+            {key: value for key, value in state.items() if modes[key] == _SHARE},
+            tuple((key, value, modes[key]) for key, value in state.items() if modes[key] != _SHARE),
+        )
+
+    def reset(self):
+        """
+        Riporta il documento allo stato salvato da save_initial_state(),
+        pronto per un nuovo render: pagine, font, immagini, link, tracing e
+        impostazioni del render precedente vengono scartati. I byte già
+        restituiti da output() restano validi.
+        """
+        initial = self._initial_state
+        if initial is None:
+            raise RuntimeError("reset() richiede save_initial_state() dopo la creazione del documento")
+        shared, rebuilt = initial
+        state = dict(shared)
+        for key, value, mode in rebuilt:
+            if mode == _COPY:
+                state[key] = copy.copy(value)
+            elif mode == _COPY_ITEMS:
+                state[key] = [item.copy() for item in value]
+            elif mode == _NEW:
+                state[key] = type(value)()
+            else:
+                state[key] = copy.deepcopy(value, {id(self): self})
+        state['_initial_state'] = initial
+        state['creation_date'] = datetime.now(timezone.utc)
+        self.__dict__.clear()
+        self.__dict__.update(state)
+
+    # ==================== TRACING ====================
+
+    def enable_tracing(self, sink, document: Optional[str] = None,
+                       extra_methods: Sequence[str] = ()):
+        """
+        Attiva il tracing dei componenti add_* e di header/footer.
+
+        Args:
+            sink: MemorySink, JsonLinesSink, CallbackSink (o qualsiasi oggetto
+                con emit(span)), oppure una funzione che riceve gli span
+            document: Etichetta del documento riportata in ogni span
+            extra_methods: Altri metodi da tracciare (es. 'generate_contract')
+        """
+        return install_tracing(self, sink, document=document, extra_methods=extra_methods)
+
+    def disable_tracing(self):
+        uninstall_tracing(self)
+
+    # ==================== DRY-RUN E SEZIONI ====================
+
+    def enable_dry_run(self):
+        """
+        Modalità solo impaginazione: wrapping, salti pagina e add_page avvengono
+        normalmente, ma nessun operatore viene scritto nei content stream e le
+        tabelle non disegnano le celle. Da attivare prima di add_page;
+        il documento va poi letto con pagination(), non con output().
+        """
+        self.dry_run = True
+
+    def _out(self, s):
+        # Prima scrittura di una sezione, esclusi header/footer dei salti pagina
+        if self._section_first_page is None and not self._page_setup_depth:
+            self._section_first_page = self.page
+        if not self.dry_run:
+            super()._out(s)
+
+    def add_page(self, *args, **kwargs):
+        self._page_setup_depth += 1
+        try:
+            super().add_page(*args, **kwargs)
+        finally:
+            self._page_setup_depth -= 1
+
+    def _perform_page_break(self):
+        part = self._fragment_part
+        if part is None:
+            return super()._perform_page_break()
+        # Registrazione di un frammento: il salto chiude la parte sulla pagina corrente.
+        # I local_context aperti dal frammento si chiudono dentro la parte e si riaprono
+        # in cima alla successiva, così ogni parte ha q/Q bilanciati; quelli aperti
+        # prima del frammento li chiude e riapre fpdf2, fuori dalle parti
+        self._fragment_part = None
+        inner = []
+        while self._graphics_depth() > self._fragment_depth:
+            inner.append(self._pop_local_stack())
+            self._end_local_context()
+        closed = self._end_fragment_part(part)
+        if closed is None:
+            self._fragment_parts = None
+        else:
+            self._fragment_parts.append(closed)
+        super()._perform_page_break()
+        if self._fragment_parts is not None:
+            self._fragment_part = self._begin_fragment_part()
+        for state in reversed(inner):
+            self._push_local_stack()
+            state.current_font_is_set_on_page = False
+            self._start_local_context(**state.as_kwargs())
+
+    def _graphics_depth(self) -> int:
+        """Livelli dello stack degli stati grafici di fpdf2 (1 = nessun local_context aperto)"""
+        return len(self._GraphicsStateMixin__statestack)
+
+    @contextmanager
+    def section(self, name: str):
+        """
+        Sezione logica del documento: registra in section_pages le pagine
+        occupate e, se il tracing è attivo, apre lo span "section:<name>".
+        La prima pagina è quella del primo contenuto disegnato dalla sezione.
+        """
+        start_page = self.page
+        self._section_first_page = None
+        try:
+            if self._tracer is None:
+                yield
+            else:
+                with self._tracer.span(f"section:{name}"):
+                    yield
+        finally:
+            first_page = self._section_first_page or max(start_page, 1)
+            self.section_pages[name] = (min(first_page, self.page), self.page)
+
+    def pagination(self) -> Pagination:
+        """Numero di pagine e pagine di ogni sezione registrata"""
+        return Pagination(self.pages_count, dict(self.section_pages))
+
+    # ==================== STATO GRAFICO ====================
+    # I componenti reimpostano font, colori e spessori a ogni riga: qui le
+    # chiamate che non cambiano lo stato corrente vengono saltate prima di
+    # arrivare a fpdf (niente parsing degli argomenti né operatori duplicati).
+
+    def set_font(self, family=None, style='', size=0):
+        if (self.current_font is not None
+                and not self.underline and not self.strikethrough
+                and (not family or family == self.font_family)
+                and style == self.font_style
+                and (not size or size == self.font_size_pt)):
+            self.skipped_state_calls += 1
+            return
+        if family and FONT_REGISTRY.is_registered(family):
+            # Font TTF del registro di processo: tutti gli stili al primo utilizzo della famiglia
+            FONT_REGISTRY.install(self, family)
+        super().set_font(family, style, size)
+
+    def set_draw_color(self, r, g=-1, b=-1):
+        color = _device_color(r, g, b)
+        if color == self.draw_color:
+            self.skipped_state_calls += 1
+            return
+        super().set_draw_color(color)
+
+    def set_fill_color(self, r, g=-1, b=-1):
+        color = _device_color(r, g, b)
+        if color == self.fill_color:
+            self.skipped_state_calls += 1
+            return
+        super().set_fill_color(color)
+
+    def set_text_color(self, r, g=-1, b=-1):
+        self.text_color = _device_color(r, g, b)
+
+    def set_line_width(self, width: float):
+        # Confronto sul valore scritto nel PDF ("0.57 w"): 0.2 e 0.200025 coincidono
+        if self.page > 0 and f"{width * self.k:.2f}" == f"{self.line_width * self.k:.2f}":
+            self.skipped_state_calls += 1
+            return
+        super().set_line_width(width)
+
     def header(self):
         """Header con logo e informazioni aziendali al centro"""
         header_height = 32
@@ -80,7 +451,8 @@ class KobakPDF(FPDF):
 
         if self.logo_path:
             try:
-                self.image(self.logo_path, x=logo_x, y=logo_y, w=logo_width, h=15)
+                logo = self.preload_shared_image(self.logo_path)
+                self.image(logo, x=logo_x, y=logo_y, w=logo_width, h=15)
             except Exception:
                 self._draw_logo_placeholder(logo_x, logo_y, logo_width)
         else:
@@ -107,7 +479,26 @@ class KobakPDF(FPDF):
         right_width = self.content_width - left_width
         self.set_x(self.l_margin)
         self.cell(left_width, FONT_CONFIG['small']['height'], text=self.footer_note, align=Align.C)
-        self.cell(right_width, FONT_CONFIG['small']['height'], text=f"Pagina {self.page_no()} di {{nb}}", align=Align.R)
+        self.cell(right_width, FONT_CONFIG['small']['height'], text=f"Pagina {self.page_no()} di {self.total_pages_label()}", align=Align.R)
+
+    def page_no(self) -> int:
+        """Numero di pagina mostrato, spostato di page_number_offset"""
+        return self.page + self.page_number_offset
+
+    def total_pages_label(self) -> str:
+        """Totale pagine per il footer: alias {nb} (sostituito da fpdf in output) o totale fissato"""
+        return '{nb}' if self.total_pages is None else str(self.total_pages)
+
+    def _substitute_total_pages(self):
+        # Con il totale fissato (parte di un documento più grande) anche l'alias
+        # {nb} nel testo vale total_pages, non le pagine di questa istanza
+        total = str(self.total_pages)
+        for page in self.pages.values():
+            for item in page.get_text_substitutions():
+                page.contents = page.contents.replace(
+                    item.get_placeholder_string().encode('latin-1'),
+                    item.render_text_substitution(total).encode('latin-1'))
+            page._text_substitution_fragments.clear()
 
     def add_text(self, text, style='body', color='text_dark', align=Align.L, ln=True):
         """Aggiungi testo con stile predefinito"""
@@ -521,6 +912,42 @@ class KobakPDF(FPDF):
         self.line(self.l_margin, self.get_y(), self.w - self.r_margin, self.get_y())
         self.ln(3)
 
+    def preload_shared_image(self, source: Union[str, Path, bytes],
+                             cache: Optional[ImageInfoCache] = None):
+        """
+        Registra nel documento un'immagine presa dalla cache di processo,
+        così nuove istanze non devono decodificarla e ricomprimerla.
+
+        Args:
+            source: Percorso locale o byte dell'immagine raster
+            cache: Cache da usare (default: IMAGE_CACHE di processo)
+
+        Returns:
+            Il valore da passare a self.image() (SVG e URL restano invariati)
+        """
+        if isinstance(source, bytes):
+            name = hashlib.md5(source.strip()).hexdigest()  # stesso nome usato da fpdf
+        else:
+            name = str(source)
+            if name.endswith('.svg') or name.startswith(('http://', 'https://')):
+                return source
+        images = self.image_cache.images
+        if name in images:
+            return source
+
+        cache = cache if cache is not None else IMAGE_CACHE
+        info = RasterImageInfo(cache.get_info(source, self.image_cache.image_filter))
+        info['i'] = len(images) + 1
+        info['usages'] = 0
+        info['iccp_i'] = None
+        iccp = info.get('iccp')
+        if iccp is not None:
+            icc_profiles = self.image_cache.icc_profiles
+            info['iccp_i'] = icc_profiles.setdefault(iccp, len(icc_profiles))
+            info['iccp'] = None
+        images[name] = info
+        return source
+
     def _draw_logo_placeholder(self, x: float, y: float, width: float):
         height = 15
         self.set_draw_color(*COLORS['secondary_light'])
@@ -560,47 +987,134 @@ class KobakPDF(FPDF):
         self.set_text_color(*COLORS['text_dark'])
         self.cell(0, 5, text=f"{label}: {value}", new_x=XPos.LEFT, new_y=YPos.NEXT)
 
+    def _wrap_text_lines(self, text: str, width: float, line_height: float) -> Tuple[str, ...]:
+        """
+        Righe prodotte da multi_cell con il font corrente, memorizzate
+        nella cache di processo TEXT_METRICS_CACHE.
+        """
+        key = (self.font_family, self.font_style, self.font_size_pt, self.c_margin,
+               width, line_height, text)
+        lines = TEXT_METRICS_CACHE.get(key)
+        if lines is None:
+            lines = tuple(self.multi_cell(width, line_height, text, dry_run=True, output='LINES'))
+            TEXT_METRICS_CACHE.put(key, lines)
+        return lines
+
+    def _fast_wrap_lines(self, text: str, width: float) -> Tuple[str, ...]:
+        """
+        Righe di una cella larga width con il font corrente, misurate con le
+        tabelle delle larghezze dei glifi (senza multi_cell).
+        Con text shaping, stretching o spaziatura caratteri usa _wrap_text_lines.
+        """
+        font = self.current_font
+        if font is None or self.text_shaping or self.font_stretching != 100 or self.char_spacing:
+            return self._wrap_text_lines(text, width, self.font_size)
+
+        key = ('glyph_wrap', font.fontkey, self.font_size_pt, self.c_margin, width, text)
+        lines = TEXT_METRICS_CACHE.get(key)
+        if lines is None:
+            # Larghezza disponibile in millesimi di em, come le tabelle dei glifi
+            available = (width - 2 * self.c_margin) * self.k * 1000 / self.font_size_pt
+            lines = wrap_text(self.normalize_text(text), available, glyph_width_table(font))
+            TEXT_METRICS_CACHE.put(key, lines)
+        return lines
+
     def _measure_text_height(self, text: str, width: float, line_height: float) -> float:
         if not text:
             return line_height
-        lines = self.multi_cell(width, line_height, text, dry_run=True, output='LINES')
+        lines = self._wrap_text_lines(text, width, line_height)
         return max(line_height, len(lines) * line_height)
 
-    def add_info_card(
-        self,
-        title: Optional[str],
-        rows: List[Tuple[str, str]],
-        width: Optional[float] = None,
-        x: Optional[float] = None,
-        y: Optional[float] = None,
-        variant: Literal['gold', 'gray'] = 'gold',
-        label_width: float = 32,
-    ) -> float:
+    def layout_text_block(self, text: str, width: float, line_height: float,
+                          align: Align = Align.J, x: float = 0, y: float = 0) -> Tuple[LineBox, ...]:
+        """
+        Impagina un testo a capo automatico con il font corrente (layout pass).
+        Il wrapping passa dalla cache di processo delle metriche di testo.
+
+        Returns:
+            Tuple di LineBox con posizioni relative a (x, y)
+        """
+        align = Align.coerce(align)
+        boxes = []
+        paragraphs = text.split('\n') if '\n' in text else (text,)
+        for paragraph in paragraphs:
+            lines = self._wrap_text_lines(paragraph, width, line_height)
+            for idx, line in enumerate(lines):
+                # Come multi_cell: l'ultima riga di un paragrafo giustificato va a sinistra
+                line_align = Align.L if align == Align.J and idx == len(lines) - 1 else align
+                boxes.append(LineBox(line, x, y + len(boxes) * line_height, width, line_height, line_align))
+        return tuple(boxes)
+
+    def paint_text_block(self, boxes: Sequence[LineBox], x: float, y: float):
+        """
+        Disegna righe già impaginate con il font corrente (paint pass),
+        senza ripetere il wrapping. Equivale a multi_cell sulle stesse righe.
+        """
+        if not boxes:
+            return
+        self.set_xy(x + boxes[0].x, y + boxes[0].y)
+        for box in boxes:
+            text = self.normalize_text(box.text)
+            fragments = (
+                self._preload_bidirectional_text(text, False)
+                if self.text_shaping
+                else self._preload_font_styles(text, False)
+            )
+            self._render_styled_text_line(
+                TextLine(fragments, text_width=0, number_of_spaces=box.text.count(' '),
+                         align=box.align, height=box.height, max_width=box.width),
+                h=box.height, new_x=XPos.LEFT, new_y=YPos.NEXT,
+            )
+
+    def layout_info_card(self, title: Optional[str], rows: List[Tuple[str, str]],
+                         width: Optional[float] = None, label_width: float = 32) -> CardLayout:
+        """
+        Calcola il layout di una info card: ogni valore viene spezzato una
+        sola volta e le righe risultanti servono sia per l'altezza sia per il disegno.
+        """
         width = width or self.content_width
-        x = x if x is not None else self.l_margin
-        y = y if y is not None else self.get_y()
         padding = 4.5
         header_height = 9 if title else 0
         line_height = FONT_CONFIG['body']['height']
         text_width = width - (padding * 2 + label_width)
 
-        card_height = header_height + padding
+        # Misura con il font usato per disegnare i valori
+        self.set_font(self.font_family, '', FONT_CONFIG['body']['size'])
+
+        cursor_y = header_height + padding
+        card_rows = []
         for idx, (label, value) in enumerate(rows):
             text_value = value or '-'
-            text_area_width = text_width if label else width - padding * 2
-            card_height += self._measure_text_height(text_value, text_area_width, line_height)
+            if label:
+                value_x, value_width = padding + label_width, text_width
+            else:
+                value_x, value_width = padding, width - padding * 2
+            lines = self.layout_text_block(text_value, value_width, line_height, x=value_x, y=cursor_y)
+            row_height = max(line_height, len(lines) * line_height)
+            card_rows.append(CardRow(label, cursor_y, row_height, lines))
+            cursor_y += row_height
             if idx < len(rows) - 1:
-                card_height += 0.8
-        card_height += padding
+                cursor_y += 0.8
+
+        return CardLayout(title, width, cursor_y + padding, header_height, padding,
+                          label_width, line_height, tuple(card_rows))
+
+    def paint_info_card(self, layout: CardLayout, x: float, y: float,
+                        variant: Literal['gold', 'gray'] = 'gold'):
+        """Disegna una info card già impaginata con layout_info_card"""
+        width = layout.width
+        padding = layout.padding
+        header_height = layout.header_height
+        line_height = layout.line_height
 
         self.set_draw_color(*COLORS['secondary_light'])
         self.set_fill_color(*COLORS['bg_white'])
         try:
-            self.rounded_rect(x, y, width, card_height, 2.4, style='DF')
+            self.rounded_rect(x, y, width, layout.height, 2.4, style='DF')
         except AttributeError:
-            self.rect(x, y, width, card_height, style='DF')
+            self.rect(x, y, width, layout.height, style='DF')
 
-        if title:
+        if layout.title:
             chip_colors = {
                 'gold': (COLORS['primary'], COLORS['text_dark']),
                 'gray': (COLORS['chip_gray'], COLORS['text_white'])
@@ -614,38 +1128,41 @@ class KobakPDF(FPDF):
             self.set_xy(x + padding, y + 2)
             self.set_font(self.font_family, 'B', FONT_CONFIG['body']['size'])
             self.set_text_color(*text_color)
-            self.cell(width - padding * 2, header_height - 2, text=title.upper())
+            self.cell(width - padding * 2, header_height - 2, text=layout.title.upper())
 
-        cursor_y = y + header_height + padding
-        for idx, (label, value) in enumerate(rows):
-            text_value = value or '-'
+        for idx, row in enumerate(layout.rows):
             self.set_font(self.font_family, 'B', FONT_CONFIG['body']['size'])
             self.set_text_color(*COLORS['secondary_dark'])
+            if row.label:
+                self.set_xy(x + padding, y + row.y)
+                self.cell(layout.label_width, line_height, text=f"{row.label}:", align=Align.L)
 
-            if label:
-                row_height = self._measure_text_height(text_value, text_width, line_height)
-                self.set_xy(x + padding, cursor_y)
-                self.cell(label_width, line_height, text=f"{label}:", align=Align.L)
-
-                self.set_xy(x + padding + label_width, cursor_y)
-                self.set_font(self.font_family, '', FONT_CONFIG['body']['size'])
-                self.set_text_color(*COLORS['text_dark'])
-                self.multi_cell(text_width, line_height, text=text_value)
-            else:
-                row_height = self._measure_text_height(text_value, width - padding * 2, line_height)
-                self.set_xy(x + padding, cursor_y)
-                self.set_font(self.font_family, '', FONT_CONFIG['body']['size'])
-                self.set_text_color(*COLORS['text_dark'])
-                self.multi_cell(width - padding * 2, line_height, text=text_value)
+            self.set_font(self.font_family, '', FONT_CONFIG['body']['size'])
+            self.set_text_color(*COLORS['text_dark'])
+            self.paint_text_block(row.lines, x, y)
 
-            cursor_y += row_height
-            if idx < len(rows) - 1:
+            if idx < len(layout.rows) - 1:
+                separator_y = y + row.y + row.height
                 self.set_draw_color(*COLORS['secondary_light'])
-                self.line(x + padding, cursor_y, x + width - padding, cursor_y)
-                cursor_y += 0.8
+                self.line(x + padding, separator_y, x + width - padding, separator_y)
 
-        self.set_y(max(self.get_y(), y + card_height))
-        return card_height
+        self.set_y(max(self.get_y(), y + layout.height))
+
+    def add_info_card(
+        self,
+        title: Optional[str],
+        rows: List[Tuple[str, str]],
+        width: Optional[float] = None,
+        x: Optional[float] = None,
+        y: Optional[float] = None,
+        variant: Literal['gold', 'gray'] = 'gold',
+        label_width: float = 32,
+    ) -> float:
+        x = x if x is not None else self.l_margin
+        y = y if y is not None else self.get_y()
+        layout = self.layout_info_card(title, rows, width=width, label_width=label_width)
+        self.paint_info_card(layout, x, y, variant=variant)
+        return layout.height
 
     def add_details_table(self, rows: List[Dict[str, str]]):
         headers = ['DESCRIZIONE', 'QUANTITA', 'UNITA', 'PREZZO UNIT.', 'PREZZO TOTALE']
@@ -980,7 +1497,8 @@ class KobakPDF(FPDF):
             font_style: Stile font
             aligns: Lista allineamenti per cella ('L', 'C', 'R')
             corner_radius: Raggio angoli se fill=True
-            multiline: Se True, usa multi_cell per celle lunghe (auto-height)
+            multiline: Ignorato, mantenuto per compatibilità: ogni colonna va a capo
+                       automaticamente e la riga si adatta alla cella più alta
         """
         page_width = self.content_width
         
@@ -1000,18 +1518,15 @@ class KobakPDF(FPDF):
         self.set_x(self.l_margin)
         self.set_font(self.font_family, font_style, font_size)
         
-        # FASE 1: Calcola altezza massima necessaria
+        # FASE 1: Misura il wrapping di ogni colonna (tabelle glifi, in cache)
         y_start = self.get_y()
+        line_height = height * 0.8
+        cell_lines = [self._fast_wrap_lines(str(cell), width)
+                      for cell, width in zip(cells, normalized_widths)]
         max_height = height
-        
-        for i, (cell, width) in enumerate(zip(cells, normalized_widths)):
-            cell_text = str(cell)
-            # Prima colonna: controlla se serve wrapping
-            if i == 0 and len(cell_text) > 45:
-                # Calcola altezza necessaria senza disegnare
-                lines = len(cell_text) // 40 + 1
-                estimated_height = lines * height * 0.8
-                max_height = max(max_height, estimated_height)
+        for lines in cell_lines:
+            if len(lines) > 1:
+                max_height = max(max_height, len(lines) * line_height)
         
         # FASE 2: Disegna il fill con l'altezza corretta
         if fill:
@@ -1026,23 +1541,24 @@ class KobakPDF(FPDF):
         # FASE 3: Disegna il testo SOPRA il fill
         self.set_xy(self.l_margin, y_start)
         
-        for i, (cell, width, align) in enumerate(zip(cells, normalized_widths, aligns)):
-            cell_text = str(cell)
+        for lines, cell, width, align in zip(cell_lines, cells, normalized_widths, aligns):
             x_pos = self.get_x()
             
-            # Prima colonna: controlla se serve wrapping
-            if i == 0 and len(cell_text) > 45:
+            if len(lines) > 1:
                 # Disegna prima il bordo con l'altezza completa
                 if border:
                     self.rect(x_pos, y_start, width, max_height)
                 
-                # Poi usa multi_cell per wrapping SENZA bordo
-                self.multi_cell(width, height * 0.8, cell_text, border=0, align=align)
+                # Poi le righe già misurate, SENZA bordo
+                align = Align.coerce(align)
+                boxes = [LineBox(line, 0, i * line_height, width, line_height, align)
+                         for i, line in enumerate(lines)]
+                self.paint_text_block(boxes, x_pos, y_start)
                 # Torna all'inizio della riga e vai alla prossima colonna
                 self.set_xy(x_pos + width, y_start)
             else:
-                # Altre colonne: cell standard
-                self.cell(width, max_height, cell_text, border=border, align=align,
+                # Celle su una riga: cell standard
+                self.cell(width, max_height, str(cell), border=border, align=align,
                          fill=False,
                          new_x=XPos.RIGHT, new_y=YPos.TOP)
         
@@ -1270,7 +1786,7 @@ class KobakPDF(FPDF):
             # Griglia info
             self.add_info_grid(rows, label_width=label_width)
     
-    def add_zebra_table(self, headers: List[str], rows: List[List[str]],
+    def add_zebra_table(self, headers: List[str], rows: Iterable[Sequence[Any]],
                        col_widths: List[float] = None,
                        aligns: List[str] = None,
                        header_bg: str = 'bg_light',
@@ -1279,14 +1795,19 @@ class KobakPDF(FPDF):
                        row_font_size: int = 7,
                        header_height: float = 6,
                        row_height: float = 5,
-                       repeat_header_on_new_page: bool = True):
+                       repeat_header_on_new_page: bool = True,
+                       chunk_size: int = 64):
         """
         Tabella con zebra striping automatico usando table() nativo di fpdf2.
         Gestisce automaticamente page break e ripetizione header.
         
+        Le righe possono arrivare da qualsiasi iterabile (lista, generatore,
+        cursore DB): vengono disegnate a blocchi di chunk_size man mano che
+        arrivano, quindi la memoria non dipende dal numero di righe.
+        
         Args:
             headers: Lista intestazioni colonne
-            rows: Lista righe (ciascuna è lista di celle)
+            rows: Iterabile di righe (ciascuna è sequenza di celle)
             col_widths: Larghezze colonne (frazione di content_width, default equidistribuite)
             aligns: Allineamenti colonne (default L per prima, C per resto)
             header_bg: Colore background header
@@ -1296,6 +1817,7 @@ class KobakPDF(FPDF):
             header_height: Altezza header (ignorato, usa line_height)
             row_height: Altezza righe
             repeat_header_on_new_page: Se True, ripete l'header su ogni pagina
+            chunk_size: Righe tenute in memoria per blocco
         """
         # Default: colonne equidistribuite
         if col_widths is None:
@@ -1319,8 +1841,13 @@ class KobakPDF(FPDF):
             size_pt=header_font_size
         )
         
-        # Usa table() nativo con zebra striping
-        with self.table(
+        # Stili righe: due soli oggetti condivisi, alternati tra zebra_color e bianco
+        row_styles = (
+            FontFace(fill_color=COLORS[zebra_color], size_pt=row_font_size),
+            FontFace(fill_color=COLORS['bg_white'], size_pt=row_font_size),
+        )
+        
+        table_options = dict(
             col_widths=absolute_widths,
             text_align=text_align,
             line_height=row_height * 1.4,  # Converti altezza in line_height
@@ -1330,23 +1857,38 @@ class KobakPDF(FPDF):
             first_row_as_headings=True,
             repeat_headings='ON_TOP_OF_EVERY_PAGE' if repeat_header_on_new_page else 0,
             borders_layout='ALL'
-        ) as table:
-            # Header row
+        )
+        
+        rows = iter(rows)
+        chunk = list(islice(rows, chunk_size))
+        # In dry-run solo altezze righe e salti pagina, senza disegnare le celle
+        table_class = LayoutTable if self.dry_run else Table
+        idx = 0
+        while True:
+            # Un blocco di righe per volta: i blocchi successivi proseguono la tabella
+            table = table_class(self, **table_options)
+            
+            # Header row (ridisegnato solo in cima alle nuove pagine)
             header_row = table.row()
             for header in headers:
                 header_row.cell(header)
             
             # Data rows - colora manualmente per zebra con due colori
             self.set_font_size(row_font_size)
-            for idx, row_data in enumerate(rows):
-                # Alterna tra zebra_color e bianco, senza bold
-                row_style = FontFace(
-                    fill_color=COLORS[zebra_color] if idx % 2 == 0 else COLORS['bg_white'],
-                    size_pt=row_font_size
-                )
+            for row_data in chunk:
+                row_style = row_styles[idx % 2]
+                idx += 1
                 data_row = table.row()
                 for datum in row_data:
                     data_row.cell(str(datum), style=row_style)
+            table.render()
+            
+            if len(chunk) < chunk_size:
+                break
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            table_class = LayoutContinuationTable if self.dry_run else ContinuationTable
     
     def draw_horizontal_line(self, color: Tuple[int, int, int] = None, width: float = 0.5, 
                             x_start: float = None, x_end: float = None, y: float = None):
@@ -1378,3 +1920,186 @@ class KobakPDF(FPDF):
         self.set_draw_color(0, 0, 0)
         self.set_line_width(old_width)
 
+    # ==================== CACHE FRAMMENTI STATICI ====================
+
+    def render_cached_fragment(self, key: Hashable, render_fn: Callable[[], Any],
+                               cache: Optional[FragmentCache] = None) -> bool:
+        """
+        Disegna un frammento statico riusando il layout già calcolato
+        da un documento precedente dello stesso processo.
+
+        Al primo utilizzo render_fn viene eseguita normalmente e il content
+        stream prodotto viene registrato; le volte successive il frammento
+        viene reinserito traslato alla Y corrente, senza rifare wrapping e
+        layout. Se il frammento non entra nella pagina corrente viene
+        disegnato normalmente. Un frammento che attraversa salti pagina
+        automatici (es. tabella lunga, anche dentro local_context) viene
+        riusato solo se inizia alla stessa Y, dove i salti cadono negli
+        stessi punti.
+
+        Args:
+            key: Chiave che identifica il contenuto (es. testo delle clausole)
+            render_fn: Funzione senza argomenti che disegna il frammento su self
+            cache: Cache da usare (default: FRAGMENT_CACHE di processo)
+
+        Returns:
+            True se il frammento è stato servito dalla cache
+        """
+        cache = cache if cache is not None else FRAGMENT_CACHE
+        state = self._graphics_snapshot()
+        state['current_font'] = state['current_font'] and state['current_font'].fontkey
+        full_key = (
+            type(self), key, self.w, self.h, self.k,
+            self.l_margin, self.r_margin, self.b_margin, round(self.x, 3),
+            tuple(state.values()),
+        )
+        fragment = cache.get(full_key)
+        if fragment is not None and self._replay_cached(fragment):
+            return True
+
+        if self.dry_run:
+            # Nessun content stream da registrare
+            render_fn()
+            return False
+
+        fragment = self._record_fragment(render_fn)
+        if fragment is not None:
+            cache.put(full_key, fragment)
+        return False
+
+    def _replay_cached(self, fragment: Union[PageFragment, MultiPageFragment]) -> bool:
+        if isinstance(fragment, PageFragment):
+            return self.y + fragment.height <= self.page_break_trigger and self._replay_fragment(fragment)
+        if abs(self.y - fragment.origin_y) > 1e-6 or not self._replay_fragment(fragment.parts[0]):
+            return False
+        for part in fragment.parts[1:]:
+            # Header e footer dal vivo, poi la parte successiva dove l'aveva lasciata il salto
+            self._perform_page_break()
+            self._replay_fragment(part)
+        return True
+
+    def _graphics_snapshot(self) -> Dict[str, Any]:
+        return {attr: getattr(self, attr) for attr in GRAPHICS_STATE_ATTRS}
+
+    def _graphics_preamble(self) -> bytes:
+        """Operatori PDF che riproducono lo stato grafico corrente"""
+        ops = []
+        if self.draw_color is not None:
+            ops.append(self.draw_color.serialize().upper())
+        if self.fill_color is not None:
+            ops.append(self.fill_color.serialize().lower())
+        ops.append(f"{self.line_width * self.k:.2f} w")
+        if self.current_font is not None and self.current_font_is_set_on_page:
+            ops.append(f"BT /F{self.current_font.i} {self.font_size_pt:.2f} Tf ET")
+        return ("\n".join(ops) + "\n").encode("latin1")
+
+    def _record_fragment(self, render_fn: Callable[[], Any]) -> Union[PageFragment, MultiPageFragment, None]:
+        page = self.pages.get(self.page) if self.page else None
+        if page is None or not isinstance(page.contents, bytearray) or self._fragment_part is not None:
+            # Niente content stream, oppure frammento dentro un altro in registrazione
+            render_fn()
+            return None
+
+        self._fragment_parts = []
+        self._fragment_part = self._begin_fragment_part()
+        self._fragment_depth = self._graphics_depth()
+        try:
+            render_fn()
+            parts, part = self._fragment_parts, self._fragment_part
+        finally:
+            self._fragment_parts = self._fragment_part = None
+
+        # part è None se una parte non era registrabile
+        last = self._end_fragment_part(part) if part is not None else None
+        if last is None:
+            return None
+        if not parts:
+            return last
+        return MultiPageFragment(tuple(parts) + (last,))
+
+    def _begin_fragment_part(self) -> tuple:
+        """Stato all'inizio di una parte del frammento (una per pagina)"""
+        page = self.pages[self.page]
+        return (self.page, len(page.contents), self.y, len(page.annots),
+                len(page._text_substitution_fragments), self._graphics_snapshot(), self._graphics_preamble())
+
+    def _end_fragment_part(self, part: tuple) -> Optional[PageFragment]:
+        page_no, start, start_y, annots, substitutions, before, preamble = part
+        page = self.pages[page_no]
+        # Salto pagina non automatico (add_page esplicito), link o alias {nb} nel frammento
+        if (self.page != page_no or len(page.annots) != annots
+                or len(page._text_substitution_fragments) != substitutions):
+            return None
+        body = bytes(page.contents[start:])
+        if UNCACHEABLE_OPERATORS.search(body):
+            return None
+
+        end_state = self._graphics_snapshot()
+        end_x, end_y = self.x, self.y
+        content = preamble + body
+        fonts = {}
+        for match in FONT_OPERATOR.finditer(content):
+            index = int(match.group(1))
+            for font in self.fonts.values():
+                if font.i == index:
+                    if isinstance(font, TTFFont):
+                        # I codici dei glifi TTF dipendono dal subset del documento
+                        return None
+                    style = font.emphasis.style
+                    family = font.fontkey[:len(font.fontkey) - len(style)] if style else font.fontkey
+                    fonts[index] = (family, style)
+                    break
+            else:
+                return None
+
+        # Isola il frammento in un blocco q/Q: lo stato grafico dopo il
+        # frammento è identico sia nel documento sorgente sia nei replay
+        page.contents[start:] = b"q\n" + content + b"Q\n"
+        self._restore_after_fragment(before, end_state, end_x, end_y)
+        return PageFragment(content, fonts, start_y, end_y - start_y, end_x, end_state)
+
+    def _replay_fragment(self, fragment: PageFragment) -> bool:
+        before = self._graphics_snapshot()
+        remap = {}
+        try:
+            for index, (family, style) in fragment.fonts.items():
+                self.set_font(family, style)
+                remap[index] = self.current_font.i
+        except FPDFException:
+            # Font non registrato in questo documento (es. TTF): disegna dal vivo
+            for attr, value in before.items():
+                setattr(self, attr, value)
+            self.current_font_is_set_on_page = False
+            return False
+
+        content = FONT_OPERATOR.sub(
+            lambda m: b"/F%d%s" % (remap[int(m.group(1))], m.group(2)), fragment.content
+        )
+        dy = (self.y - fragment.origin_y) * self.k
+        self._out(b"q\n1 0 0 1 0 %.2f cm\n" % -dy + content + b"Q")
+        for index in remap.values():
+            self._resource_catalog.add(PDFResourceType.FONT, index, self.page)
+
+        self._restore_after_fragment(before, fragment.end_state, fragment.end_x, self.y + fragment.height)
+        return True
+
+    def _restore_after_fragment(self, before: Dict[str, Any], end_state: Dict[str, Any],
+                                end_x: float, end_y: float):
+        # Il Q finale ha ripristinato lo stato PDF precedente al frammento
+        for attr, value in before.items():
+            setattr(self, attr, value)
+        self.current_font_is_set_on_page = False
+
+        # Riporta lo stato fpdf a quello di fine frammento (emette solo le differenze)
+        if end_state['current_font'] is not None:
+            style = end_state['font_style']
+            style += 'U' if end_state['underline'] else ''
+            style += 'S' if end_state['strikethrough'] else ''
+            self.set_font(end_state['font_family'], style, end_state['font_size_pt'])
+        if end_state['draw_color'] is not None:
+            self.set_draw_color(end_state['draw_color'])
+        if end_state['fill_color'] is not None:
+            self.set_fill_color(end_state['fill_color'])
+        self.text_color = end_state['text_color']
+        self.set_line_width(end_state['line_width'])
+        self.set_xy(end_x, end_y)
@@ -0,0 +1,207 @@
+"""
+Profilo di output compatto per l'archiviazione e l'invio via PEC.
+
+Riscrive il PDF prodotto da fpdf2 in formato PDF 1.5:
+- oggetti non-stream raccolti in object stream compressi
+- cross-reference stream compresso (con predittore PNG) al posto della tabella xref
+- oggetti non raggiungibili e /ProcSet (obsoleto, ignorato dai lettori) rimossi
+- oggetti piccoli identici deduplicati
+- stream FlateDecode ricompressi al livello massimo, se ne guadagnano
+
+    pdf.set_output_profile('compact')
+    pdf.generate_contract(data, "contratto.pdf")
+    print(pdf.compact_report.summary())
+"""
+import re
+import zlib
+from io import BytesIO
+from typing import Dict, List, NamedTuple, Tuple
+
+from generators.pdf_objects import PdfObject, PdfReader, ref, referenced, replace_refs, serialize_object, xref_stream
+
+# Oggetti più grandi non vengono confrontati per la deduplicazione
+SMALL_OBJECT_SIZE = 2048
+# Oggetti per object stream
+OBJECTS_PER_STREAM = 200
+
+_PROCSET = re.compile(rb'/ProcSet\s*\[[^\]]*\]\s*')
+_LENGTH = re.compile(rb'/Length\s+\d+(?:\s+\d+ R\b)?')
+_PAGE_TYPE = re.compile(rb'/Type\s*/Page\b')
+_VERSION = re.compile(rb'%PDF-(\d\.\d)')
+
+
+class CompactReport(NamedTuple):
+    """Confronto tra il PDF di fpdf2 e quello compatto"""
+    original_size: int
+    compact_size: int
+    objects_before: int
+    objects_after: int
+    deduplicated: int
+    unused_removed: int
+    streams_recompressed: int
+
+    @property
+    def saved_bytes(self) -> int:
+        return self.original_size - self.compact_size
+
+    @property
+    def saved_ratio(self) -> float:
+        return self.saved_bytes / self.original_size if self.original_size else 0.0
+
+    def summary(self) -> str:
+        return (f"{self.original_size / 1024:.1f} KB -> {self.compact_size / 1024:.1f} KB "
+                f"(-{self.saved_ratio:.1%}), oggetti {self.objects_before} -> {self.objects_after}, "
+                f"{self.deduplicated} duplicati, {self.unused_removed} inutilizzati")
+
+
+# ==================== TRASFORMAZIONI ====================
+
+def _recompress(body: bytes, stream: bytes) -> Tuple[bytes, bytes, bool]:
+    """Ricomprime uno stream FlateDecode semplice al livello massimo, se più piccolo"""
+    if b'/FlateDecode' not in body or b'/DecodeParms' in body or re.search(rb'/Filter\s*\[', body):
+        return body, stream, False
+    try:
+        compressed = zlib.compress(zlib.decompress(stream), 9)
+    except zlib.error:
+        return body, stream, False
+    if len(compressed) >= len(stream):
+        return body, stream, False
+    return body, compressed, True
+
+
+def _with_length(body: bytes, length: int) -> bytes:
+    # Lunghezza sempre diretta: l'eventuale oggetto /Length indiretto diventa inutilizzato
+    return _LENGTH.sub(b'/Length %d' % length, body, 1)
+
+
+def _reachable(objects: Dict[int, PdfObject], roots: List[int]) -> List[int]:
+    seen = set()
+    stack = list(roots)
+    while stack:
+        num = stack.pop()
+        if num in seen or num not in objects:
+            continue
+        seen.add(num)
+        stack.extend(referenced(objects[num].body))
+    return sorted(seen)
+
+
+def _deduplicate(objects: Dict[int, PdfObject]) -> Dict[int, int]:
+    """
+    Mappa dei duplicati (num -> num canonico) fra gli oggetti piccoli.
+    Ripete finché la sostituzione dei riferimenti rende identici altri oggetti.
+    Le pagine restano distinte anche se identiche (comparirebbero due volte in /Kids).
+    """
+    duplicates: Dict[int, int] = {}
+
+    def canonical(num, gen):
+        return b'%d %d R' % (duplicates.get(num, num), gen)
+
+    while True:
+        seen: Dict[Tuple[bytes, bytes], int] = {}
+        found = False
+        for num, obj in objects.items():
+            if num in duplicates or len(obj.body) + len(obj.stream or b'') > SMALL_OBJECT_SIZE:
+                continue
+            if _PAGE_TYPE.search(obj.body):
+                continue
+            key = (replace_refs(obj.body, canonical), obj.stream or b'')
+            if key in seen:
+                duplicates[num] = seen[key]
+                found = True
+            else:
+                seen[key] = num
+        if not found:
+            return duplicates
+
+
+# ==================== SCRITTURA ====================
+
+def compact_pdf(data: bytes) -> Tuple[bytes, CompactReport]:
+    """
+    Riscrive un PDF generato da fpdf2 nel profilo compatto.
+
+    Returns:
+        (byte del PDF compatto, CompactReport)
+
+    Raises:
+        ValueError: per PDF cifrati (gli stream non si possono riscrivere)
+    """
+    reader = PdfReader(BytesIO(data))
+    trailer = reader.trailer
+    if b'/Encrypt' in trailer:
+        raise ValueError("Il profilo compatto non supporta PDF cifrati")
+    objects = reader.objects()
+    objects_before = len(objects)
+
+    recompressed = 0
+    for num, obj in objects.items():
+        body = _PROCSET.sub(b'', obj.body)
+        stream = obj.stream
+        if stream is not None:
+            body, stream, changed = _recompress(body, stream)
+            recompressed += changed
+            body = _with_length(body, len(stream))
+        objects[num] = obj._replace(body=body, stream=stream)
+
+    roots = [ref(trailer, b'/Root')[0]]
+    if b'/Info' in trailer:
+        roots.append(ref(trailer, b'/Info')[0])
+    kept = _reachable(objects, roots)
+    unused = len(objects) - len(kept)
+    objects = {num: objects[num] for num in kept}
+
+    duplicates = _deduplicate(objects)
+    numbers = {old: new for new, old in enumerate((num for num in objects if num not in duplicates), 1)}
+
+    def renumber(num, gen):
+        return b'%d 0 R' % numbers[duplicates.get(num, num)]
+
+    # Oggetti con stream scritti direttamente, gli altri negli object stream
+    version = max(_VERSION.match(data).group(1), b'1.5')
+    out = bytearray(b'%PDF-' + version + b'\n%\xe9\xeb\xf1\xbf\n')
+    total = len(numbers)
+    entries: Dict[int, Tuple[int, int, int]] = {}
+    compressible: List[Tuple[int, bytes]] = []
+    for old, new in numbers.items():
+        obj = objects[old]
+        body = replace_refs(obj.body, renumber)
+        if obj.stream is None:
+            compressible.append((new, body))
+        else:
+            entries[new] = (1, len(out), 0)
+            out += serialize_object(new, 0, body, obj.stream)
+
+    for start in range(0, len(compressible), OBJECTS_PER_STREAM):
+        chunk = compressible[start:start + OBJECTS_PER_STREAM]
+        total += 1
+        stream_num = total
+        header, bodies, offset = [], [], 0
+        for index, (num, body) in enumerate(chunk):
+            header.append(b'%d %d' % (num, offset))
+            bodies.append(body)
+            offset += len(body) + 1
+            entries[num] = (2, stream_num, index)
+        first = b' '.join(header) + b'\n'
+        content = zlib.compress(first + b'\n'.join(bodies) + b'\n', 9)
+        entries[stream_num] = (1, len(out), 0)
+        out += serialize_object(stream_num, 0, b'<<\n/Type /ObjStm\n/N %d\n/First %d\n/Filter /FlateDecode\n/Length %d\n>>'
+                                % (len(chunk), len(first), len(content)), content)
+
+    total += 1
+    xref_num = total
+    xref_offset = len(out)
+    entries[xref_num] = (1, xref_offset, 0)
+    trailer_keys = [b'/Root ' + renumber(*ref(trailer, b'/Root'))]
+    if b'/Info' in trailer:
+        trailer_keys.append(b'/Info ' + renumber(*ref(trailer, b'/Info')))
+    file_id = re.search(rb'/ID\s*\[[^\]]*\]', trailer)
+    if file_id:
+        trailer_keys.append(file_id.group(0))
+    xref_entries = [(0, 0, 0xFFFF)] + [entries[num] for num in range(1, total + 1)]
+    out += xref_stream(xref_num, xref_entries, b'\n'.join(trailer_keys))
+    out += b'startxref\n%d\n%%%%EOF\n' % xref_offset
+
+    report = CompactReport(len(data), len(out), objects_before, total,
+                           len(duplicates), unused, recompressed)
+    return bytes(out), report
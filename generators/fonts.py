@@ -0,0 +1,273 @@
+"""
+Registro dei font TTF condiviso dal processo.
+
+FPDF.add_font analizza il file TTF a ogni documento (cmap, metriche, tabelle).
+Qui ogni file viene analizzato una volta per processo: i documenti ricevono
+una copia leggera del font con stato proprio (indice, subset dei glifi usati,
+TTFont da ridurre in output). I subset già calcolati si riusano fra documenti
+che usano gli stessi glifi, e le analisi possono persistere su disco per
+evitare il costo all'avvio dei worker.
+
+    register_font("DejaVu", "fonts/DejaVuSans.ttf", bold="fonts/DejaVuSans-Bold.ttf")
+    pdf = KobakPDF(font="DejaVu")   # testo Unicode: "Élysées", "Τηλέφωνο"...
+
+La cache su disco (FONT_REGISTRY.enable_disk_cache o variabile d'ambiente
+KOBAK_FONT_CACHE) usa pickle: la cartella deve essere fidata.
+"""
+import copy
+import hashlib
+import os
+import tempfile
+import threading
+from collections import defaultdict
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import fpdf
+from fontTools import ttLib
+from fpdf import FPDF
+from fpdf.enums import TextEmphasis
+from fpdf.font_type_3 import get_color_font_object
+from fpdf.fonts import SubsetMap, TTFFont
+from fpdf.output import OutputProducer
+
+from generators.lru_cache import LRUCache
+
+# Subset già ridotti: (digest del font, glifi usati) -> TTFont ridotto (mai modificato)
+SUBSET_CACHE = LRUCache(max_entries=64)
+
+# Attributi legati al documento: esclusi dalla copia condivisa e dalla cache su disco
+_PER_DOCUMENT = ('i', 'fontkey', 'subset', 'missing_glyphs', 'biggest_size_pt',
+                 'color_font', 'ttfont', '_hbfont')
+# Versione del formato su disco: cambia se cambia lo stato salvato
+_DISK_FORMAT = 1
+
+
+class ParsedFont:
+    """
+    Font TTF analizzato una volta: metriche condivise (cw, cmap, glyph_ids,
+    descrittore) e byte SFNT da cui ogni documento apre il proprio TTFont.
+    """
+    __slots__ = ('template', 'sfnt', 'digest')
+
+    def __init__(self, template: TTFFont, sfnt: bytes, digest: str):
+        self.template = template
+        self.sfnt = sfnt
+        self.digest = digest
+
+    def instantiate(self, pdf: FPDF, fontkey: str, style: str) -> TTFFont:
+        """Copia per un documento: stato per documento nuovo, metriche condivise"""
+        font = copy.copy(self.template)
+        font.i = len(pdf.fonts) + 1
+        font.fontkey = fontkey
+        font.emphasis = TextEmphasis.coerce(style)
+        font.biggest_size_pt = 0
+        font.missing_glyphs = []
+        font._hbfont = None
+        # fpdf2 assegna id, nome e stream del font al descrittore durante l'output
+        font.desc = copy.copy(self.template.desc)
+        # Aperto in modo lazy: le tabelle si leggono solo se servono (subset in output)
+        font.ttfont = ttLib.TTFont(BytesIO(self.sfnt), recalcTimestamp=False, lazy=True)
+        font.subset = SubsetMap(font)
+        font.color_font = (get_color_font_object(pdf, font, font.palette_index)
+                           if pdf.render_color_fonts else None)
+        return font
+
+
+# ==================== SERIALIZZAZIONE SU DISCO ====================
+
+def _template_state(template: TTFFont) -> dict:
+    state = {name: getattr(template, name) for name in TTFFont.__slots__
+             if name not in _PER_DOCUMENT and hasattr(template, name)}
+    # cw è un defaultdict con lambda (non serializzabile): si salva come dict
+    state['cw'] = dict(template.cw)
+    return state
+
+
+def _template_from_state(state: dict) -> TTFFont:
+    template = TTFFont.__new__(TTFFont)
+    for name, value in state.items():
+        setattr(template, name, value)
+    default_width = template.desc.missing_width
+    template.cw = defaultdict(lambda: default_width, state['cw'])
+    for name in _PER_DOCUMENT:
+        setattr(template, name, None)
+    return template
+
+
+# ==================== REGISTRO ====================
+
+class FontRegistry:
+    """
+    Famiglie TTF registrate e font analizzati, condivisi dai documenti
+    del processo. Thread-safe.
+    """
+
+    def __init__(self, cache_dir: Union[str, os.PathLike, None] = None):
+        self._families: Dict[str, Dict[str, Path]] = {}
+        self._parsed: Dict[Tuple[str, int, int], ParsedFont] = {}
+        self._lock = threading.Lock()
+        self.cache_dir: Optional[Path] = None
+        self.parsed_count = 0
+        self.disk_hits = 0
+        if cache_dir:
+            self.enable_disk_cache(cache_dir)
+
+    def enable_disk_cache(self, directory: Union[str, os.PathLike]):
+        """Salva le analisi dei font in directory (creata se manca)"""
+        self.cache_dir = Path(directory)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def register(self, family: str, regular: Union[str, os.PathLike],
+                 bold: Union[str, os.PathLike, None] = None,
+                 italic: Union[str, os.PathLike, None] = None,
+                 bold_italic: Union[str, os.PathLike, None] = None):
+        """
+        Registra una famiglia. Gli stili senza file usano il più vicino
+        disponibile (es. grassetto corsivo -> grassetto -> normale),
+        senza simulare grassetto o corsivo.
+        """
+        files = {'': Path(regular)}
+        for style, path in (('B', bold), ('I', italic), ('BI', bold_italic)):
+            if path is not None:
+                files[style] = Path(path)
+        for path in files.values():
+            if not path.is_file():
+                raise FileNotFoundError(f"Font non trovato: {path}")
+        files.setdefault('BI', files.get('B', files.get('I', files[''])))
+        files.setdefault('B', files[''])
+        files.setdefault('I', files[''])
+        with self._lock:
+            self._families[family.lower()] = files
+
+    def is_registered(self, family: Optional[str]) -> bool:
+        return bool(family) and family.lower() in self._families
+
+    def families(self) -> List[str]:
+        return sorted(self._families)
+
+    def parsed(self, path: Path) -> ParsedFont:
+        """Font analizzato, dalla memoria, dal disco o analizzando il file"""
+        stat = path.stat()
+        key = (str(path.resolve()), stat.st_mtime_ns, stat.st_size)
+        parsed = self._parsed.get(key)
+        if parsed is not None:
+            return parsed
+        with self._lock:
+            parsed = self._parsed.get(key)
+            if parsed is None:
+                parsed = self._parsed[key] = self._load(path)
+        return parsed
+
+    def _load(self, path: Path) -> ParsedFont:
+        raw = path.read_bytes()
+        digest = hashlib.sha256(raw).hexdigest()
+        cache_file = None
+        if self.cache_dir is not None:
+            import pickle  # solo con la cache su disco
+            cache_file = self.cache_dir / f"{digest[:32]}-fpdf{fpdf.__version__}.pickle"
+            try:
+                with open(cache_file, 'rb') as f:
+                    stored = pickle.load(f)
+                if stored['format'] == _DISK_FORMAT and stored['digest'] == digest:
+                    template = _template_from_state(stored['state'])
+                    template.ttffile = path
+                    self.disk_hits += 1
+                    return ParsedFont(template, stored['sfnt'] or raw, digest)
+            except (OSError, pickle.UnpicklingError, EOFError, KeyError, AttributeError):
+                pass
+
+        # Analisi completa con fpdf2, su un documento di appoggio
+        template = TTFFont(FPDF(), path, path.stem, '')
+        self.parsed_count += 1
+        # fpdf2 modifica il TTFont solo per WOFF e per il glifo .notdef mancante:
+        # in quei casi i byte da usare sono quelli del font modificato
+        sfnt = None
+        if template.is_compressed or '.notdef' not in ttLib.TTFont(BytesIO(raw), lazy=True).getGlyphOrder():
+            buffer = BytesIO()
+            template.ttfont.save(buffer)
+            sfnt = buffer.getvalue()
+        for name in _PER_DOCUMENT:
+            setattr(template, name, None)
+
+        if cache_file is not None:
+            state = {'format': _DISK_FORMAT, 'digest': digest, 'state': _template_state(template), 'sfnt': sfnt}
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, cache_file)
+            except OSError:
+                os.unlink(tmp)
+        return ParsedFont(template, sfnt or raw, digest)
+
+    def install(self, pdf: FPDF, family: str):
+        """
+        Aggiunge al documento tutti gli stili della famiglia, se non ci sono già.
+        fpdf2 cerca alcuni stili in pdf.fonts prima di qualsiasi set_font (es.
+        Table per le intestazioni in grassetto): aggiungerli solo al primo
+        set_font dello stile non basta.
+        """
+        family = family.lower()
+        if family in pdf.fonts:
+            return
+        files = self._families[family]
+        sources = pdf.__dict__.setdefault('_registry_fonts', {})
+        for style in ('', 'B', 'I', 'BI'):
+            fontkey = f"{family}{style}"
+            parsed = self.parsed(files[style])
+            font = pdf.fonts[fontkey] = parsed.instantiate(pdf, fontkey, style)
+            if font.is_cff and font.is_cid_keyed:
+                pdf._set_min_pdf_version("1.6")
+            sources[fontkey] = parsed
+
+    def preload(self):
+        """Analizza subito tutte le famiglie registrate (avvio dei worker)"""
+        for files in list(self._families.values()):
+            for path in set(files.values()):
+                self.parsed(path)
+
+    def stats(self) -> dict:
+        return {
+            'families': len(self._families),
+            'parsed_fonts': len(self._parsed),
+            'parsed_from_file': self.parsed_count,
+            'loaded_from_disk': self.disk_hits,
+            'subsets': SUBSET_CACHE.stats(),
+        }
+
+
+FONT_REGISTRY = FontRegistry(os.environ.get('KOBAK_FONT_CACHE') or None)
+
+
+def register_font(family: str, regular, bold=None, italic=None, bold_italic=None):
+    """Registra una famiglia TTF nel registro di processo (vedi FontRegistry.register)"""
+    FONT_REGISTRY.register(family, regular, bold, italic, bold_italic)
+
+
+# ==================== SUBSET IN OUTPUT ====================
+
+class SubsetCacheOutputProducer(OutputProducer):
+    """
+    OutputProducer che riusa i subset dei font del registro: se un documento
+    usa gli stessi glifi di uno precedente parte dal TTFont già ridotto
+    (fpdf2 lo riduce di nuovo, ma su pochi glifi); altrimenti conserva il
+    TTFont ridotto da fpdf2 per i documenti successivi.
+    """
+
+    def bufferize(self):
+        pending = []
+        for fontkey, parsed in getattr(self.fpdf, '_registry_fonts', {}).items():
+            font = self.fpdf.fonts[fontkey]
+            key = (parsed.digest, tuple(sorted(font.subset.get_all_glyph_names())))
+            reduced = SUBSET_CACHE.get(key)
+            if reduced is not None:
+                font.ttfont = copy.deepcopy(reduced)
+            else:
+                pending.append((key, font))
+        buffer = super().bufferize()
+        # Dopo bufferize il TTFont ridotto non serve più al documento
+        for key, font in pending:
+            SUBSET_CACHE.put(key, font.ttfont)
+        return buffer
@@ -0,0 +1,74 @@
+"""
+Cache di frammenti statici condivisa tra tutti i documenti del processo.
+
+Un frammento (es. pagina "CONDIZIONI CONTRATTUALI", blocco di approvazione
+art. 1341) viene impaginato una sola volta: il content stream prodotto da
+fpdf viene registrato e poi rieseguito nei documenti successivi come un
+blocco autonomo `q ... Q`, traslato alla posizione corrente.
+Così wrapping e layout di multi_cell non vengono ripetuti per ogni contratto.
+"""
+import re
+from typing import Dict, Tuple
+
+from generators.lru_cache import LRUCache
+
+# Selezione font nel content stream: "/F3 6.50 Tf"
+FONT_OPERATOR = re.compile(rb"/F(\d+)(\s+[-+]?\d+(?:\.\d+)?\s+Tf)")
+
+# Operatori che referenziano risorse per-documento non rimappabili
+# (immagini, ExtGState, pattern): i frammenti che li usano non vengono salvati
+UNCACHEABLE_OPERATORS = re.compile(rb"/I\d+ Do|/GS\d+ gs|/P\d+ (?:scn|SCN)")
+
+
+class PageFragment:
+    """
+    Frammento registrato su una singola pagina.
+
+    content: byte del content stream (stato grafico iniziale incluso)
+    fonts: mappa indice font nel documento sorgente -> (family, style)
+    origin_y: Y di partenza nel documento sorgente
+    height: spostamento verticale del cursore prodotto dal frammento
+    end_x: posizione X del cursore a fine frammento
+    end_state: stato grafico fpdf a fine frammento (font, colori, spessore linea)
+    """
+    __slots__ = ('content', 'fonts', 'origin_y', 'height', 'end_x', 'end_state')
+
+    def __init__(self, content: bytes, fonts: Dict[int, Tuple[str, str]], origin_y: float,
+                 height: float, end_x: float, end_state: dict):
+        self.content = content
+        self.fonts = fonts
+        self.origin_y = origin_y
+        self.height = height
+        self.end_x = end_x
+        self.end_state = end_state
+
+
+class MultiPageFragment:
+    """
+    Frammento che attraversa salti pagina automatici: un PageFragment per
+    pagina, con header e footer esclusi (ridisegnati dal salto pagina).
+    Le posizioni dei salti dipendono dalla Y di partenza: viene riusato
+    solo quando il frammento inizia alla stessa Y del documento sorgente.
+    """
+    __slots__ = ('parts',)
+
+    def __init__(self, parts: Tuple[PageFragment, ...]):
+        self.parts = parts
+
+    @property
+    def origin_y(self) -> float:
+        return self.parts[0].origin_y
+
+
+class FragmentCache(LRUCache):
+    """
+    Cache LRU thread-safe di PageFragment (e MultiPageFragment), condivisa a livello di processo.
+    """
+
+
+# Cache di default usata da KobakPDF.render_cached_fragment
+FRAGMENT_CACHE = FragmentCache()
+
+# Sezioni dei piani di rendering, per valore dei campi letti (vedi RenderPlan.render):
+# separata perché le voci variano con i dati e non devono scalzare i frammenti statici
+SECTION_CACHE = FragmentCache(max_entries=1024)
@@ -0,0 +1,55 @@
+"""
+Cache di processo delle immagini già decodificate (es. logo nell'header).
+
+fpdf deduplica le immagini solo all'interno della stessa istanza FPDF:
+qui i dati decodificati e ricompressi vengono condivisi tra tutti i documenti
+del processo, con chiave percorso + mtime oppure hash del contenuto.
+"""
+import hashlib
+import os
+from pathlib import Path
+from typing import Hashable, Optional, Tuple, Union
+
+from fpdf.image_datastructures import RasterImageInfo
+from fpdf.image_parsing import get_img_info
+
+from generators.lru_cache import LRUCache
+
+
+class ImageInfoCache(LRUCache):
+    """
+    Cache LRU thread-safe di RasterImageInfo decodificati.
+    Le info restituite sono condivise: vanno copiate prima di usarle in un documento.
+    """
+
+    def __init__(self, max_entries: int = 32):
+        super().__init__(max_entries)
+
+    @staticmethod
+    def key_for(source: Union[str, Path, bytes], image_filter: str = 'AUTO',
+                dims: Optional[Tuple[float, float]] = None) -> Hashable:
+        if isinstance(source, bytes):
+            return ('sha1', hashlib.sha1(source).hexdigest(), image_filter, dims)
+        stat = os.stat(source)
+        return ('path', os.path.realpath(source), stat.st_mtime_ns, stat.st_size, image_filter, dims)
+
+    def get_info(self, source: Union[str, Path, bytes], image_filter: str = 'AUTO',
+                 dims: Optional[Tuple[float, float]] = None) -> RasterImageInfo:
+        key = self.key_for(source, image_filter, dims)
+        info = self.get(key)
+        if info is not None:
+            return info
+
+        # Decodifica fuori dal lock: con accessi concorrenti la stessa immagine
+        # può essere decodificata più volte, ma nessun thread resta bloccato
+        if isinstance(source, bytes):
+            info = get_img_info('shared_image', source, image_filter, dims)
+        else:
+            info = get_img_info(str(source), None, image_filter, dims)
+
+        self.put(key, info)
+        return info
+
+
+# Cache di default usata da KobakPDF.preload_shared_image
+IMAGE_CACHE = ImageInfoCache()
@@ -0,0 +1,209 @@
+"""
+Aggiornamento incrementale di PDF generati da KobakPDF.
+
+Per aggiungere pagine a un contratto già emesso (firma, stato) non serve
+rigenerarlo: le nuove pagine vengono renderizzate da sole e accodate al file
+come aggiornamento incrementale PDF (nuovi oggetti, albero Pages aggiornato,
+nuova sezione xref collegata con /Prev). I byte originali restano intatti e il
+costo è proporzionale alle sole pagine aggiunte.
+
+    def firma(pdf):
+        pdf.add_page()
+        pdf.add_status_badge("FIRMATO", 'accepted')
+
+    append_pages("contratto.pdf", firma)            # accoda al file
+    aggiornato = append_pages(pdf_bytes, firma)     # originale + aggiornamento
+
+Le pagine originali non cambiano: il loro footer "Pagina X di N" resta quello
+dell'emissione, le nuove proseguono la numerazione con il totale aggiornato.
+"""
+import hashlib
+import io
+import re
+from os import PathLike
+from typing import BinaryIO, Callable, Dict, List, Tuple, Union
+
+from generators.base_pdf import KobakPDF
+from generators.pdf_objects import (
+    PdfObject, PdfReader, ref, referenced, replace_refs, serialize_object, xref_stream,
+)
+
+_KIDS = re.compile(rb'/Kids\s*\[([^\]]*)\]')
+_COUNT = re.compile(rb'/Count (\d+)')
+_MEDIABOX = re.compile(rb'/MediaBox\s*\[[^\]]*\]')
+_ID = re.compile(rb'/ID\s*\[\s*<([0-9A-Fa-f]*)>')
+
+
+def _subsections(entries: List[Tuple[int, int, int]]) -> List[List[Tuple[int, int, int]]]:
+    """Voci (num, offset, gen) ordinate e raggruppate per numeri consecutivi"""
+    entries = sorted(entries)
+    groups = []
+    for entry in entries:
+        if groups and entry[0] == groups[-1][-1][0] + 1:
+            groups[-1].append(entry)
+        else:
+            groups.append([entry])
+    return groups
+
+
+def _xref_section(entries: List[Tuple[int, int, int]]) -> bytes:
+    """Tabella xref classica con una sottosezione per gruppo di numeri consecutivi"""
+    out = [b'xref\n']
+    for group in _subsections(entries):
+        out.append(b'%d %d\n' % (group[0][0], len(group)))
+        out.extend(b'%010d %05d n \n' % (offset, gen) for _, offset, gen in group)
+    return b''.join(out)
+
+
+def _xref_stream_section(num: int, entries: List[Tuple[int, int, int]], trailer: bytes) -> bytes:
+    """Sezione xref stream (originale nel profilo compatto): voci di tipo 1 e /Index"""
+    groups = _subsections(entries)
+    index = [value for group in groups for value in (group[0][0], len(group))]
+    rows = [(1, offset, gen) for group in groups for _, offset, gen in group]
+    return xref_stream(num, rows, trailer, index, size=num + 1)
+
+
+# ==================== RENDER DELLE NUOVE PAGINE ====================
+
+def _render_new_pages(render_fn: Callable[[KobakPDF], None], first_page: int,
+                      pdf_class, pdf_kwargs) -> bytes:
+    """
+    Renderizza le pagine da aggiungere in un documento a sé, numerate a
+    partire da first_page. Un primo passaggio in dry-run conta le pagine,
+    così i footer mostrano già il totale aggiornato.
+    """
+    layout = pdf_class(**pdf_kwargs)
+    layout.enable_dry_run()
+    render_fn(layout)
+    if layout.pages_count == 0:
+        raise ValueError("render_fn non ha aggiunto pagine")
+
+    pdf = pdf_class(**pdf_kwargs)
+    pdf.page_number_offset = first_page - 1
+    pdf.total_pages = first_page - 1 + layout.pages_count
+    render_fn(pdf)
+    return bytes(pdf.output())
+
+
+# ==================== AGGIORNAMENTO INCREMENTALE ====================
+
+def incremental_update(original: BinaryIO, render_fn: Callable[[KobakPDF], None],
+                       pdf_class=KobakPDF, **pdf_kwargs) -> bytes:
+    """
+    Costruisce l'aggiornamento incrementale che aggiunge in coda al PDF
+    original le pagine prodotte da render_fn.
+
+    Args:
+        original: PDF originale, stream binario con seek (file aperto o BytesIO)
+        render_fn: Funzione che riceve un'istanza di pdf_class e aggiunge le
+            pagine (add_page compreso). Viene chiamata due volte (dry-run e
+            render), quindi non deve consumare iteratori o avere effetti collaterali
+        pdf_class, pdf_kwargs: Generatore delle nuove pagine
+
+    Returns:
+        I soli byte da accodare al file originale
+    """
+    reader = PdfReader(original)
+    root = ref(reader.trailer, b'/Root')
+    pages_num = ref(reader.object(root[0]).body, b'/Pages')[0]
+    pages = reader.object(pages_num)
+    old_count = int(_COUNT.search(pages.body).group(1))
+    next_num = int(re.search(rb'/Size (\d+)', reader.trailer).group(1))
+
+    new = PdfReader(io.BytesIO(_render_new_pages(render_fn, old_count + 1, pdf_class, pdf_kwargs)))
+    new_pages_num = ref(new.object(ref(new.trailer, b'/Root')[0]).body, b'/Pages')[0]
+    new_root = new.object(new_pages_num)
+    new_kids = referenced(_KIDS.search(new_root.body).group(1))
+    mediabox = _MEDIABOX.search(new_root.body)
+
+    # Oggetti raggiungibili dalle nuove pagine (risorse, font, immagini, annotazioni):
+    # il catalogo, la radice Pages (il /Parent delle pagine) e le info del documento nuovo non servono
+    objects: Dict[int, PdfObject] = {}
+    stack = list(new_kids)
+    while stack:
+        num = stack.pop()
+        if num in objects or num == new_pages_num:
+            continue
+        obj = objects[num] = new.object(num)
+        stack.extend(referenced(obj.body))
+    mapping = {old: next_num + i for i, old in enumerate(sorted(objects))}
+
+    # Le nuove pagine diventano figlie della radice Pages originale
+    parent_ref = b'%d %d R' % (pages_num, pages.gen)
+
+    def renumber(num, gen):
+        if num == new_pages_num:
+            return parent_ref
+        return b'%d 0 R' % mapping[num]
+
+    separator = b'' if reader.read(reader.size - 1, 1) in (b'\n', b'\r') else b'\n'
+    out = io.BytesIO()
+    out.write(separator)
+    entries: List[Tuple[int, int, int]] = []
+
+    def write(num, gen, body, stream):
+        entries.append((num, reader.size + out.tell(), gen))
+        out.write(serialize_object(num, gen, body, stream))
+
+    # Radice Pages aggiornata: nuovi figli in coda e conteggio
+    kids = _KIDS.search(pages.body)
+    added = b' '.join(b'%d 0 R' % mapping[num] for num in new_kids)
+    body = pages.body[:kids.start(1)] + (kids.group(1).strip() + b' ' + added).strip() + pages.body[kids.end(1):]
+    write(pages_num, pages.gen, _COUNT.sub(b'/Count %d' % (old_count + len(new_kids)), body, 1), None)
+
+    new_pages = set(new_kids)
+    for num in sorted(objects):
+        obj = objects[num]
+        body = replace_refs(obj.body, renumber)
+        # Le pagine di fpdf2 ereditano il formato dalla radice: lo rendono esplicito
+        if num in new_pages and mediabox and not _MEDIABOX.search(body):
+            body = body.replace(b'<<', b'<<\n' + mediabox.group(0), 1)
+        write(mapping[num], 0, body, obj.stream)
+
+    xref_offset = reader.size + out.tell()
+    keys = [b'/Root %d %d R' % root]
+    info = re.search(rb'/Info\s+\d+ \d+ R', reader.trailer)
+    if info:
+        keys.append(info.group(0))
+    file_id = _ID.search(reader.trailer)
+    if file_id:
+        # Primo ID invariato (stesso documento), secondo ID nuovo (nuova revisione)
+        revision = hashlib.md5(out.getvalue()).hexdigest().upper().encode()
+        keys.append(b'/ID [<%s><%s>]' % (file_id.group(1), revision))
+    keys.append(b'/Prev %d' % reader.startxref)
+    size = next_num + len(objects)
+    if reader.xref_stream:
+        # Dopo un xref stream la sezione nuova deve esserlo anch'essa (PDF 1.5)
+        entries.append((size, xref_offset, 0))
+        out.write(_xref_stream_section(size, entries, b'\n'.join(keys)))
+    else:
+        out.write(_xref_section(entries))
+        out.write(b'trailer\n<<\n/Size %d\n%s\n>>\n' % (size, b'\n'.join(keys)))
+    out.write(b'startxref\n%d\n%%%%EOF\n' % xref_offset)
+    return out.getvalue()
+
+
+def append_pages(source: Union[str, PathLike, bytes, bytearray], render_fn: Callable[[KobakPDF], None],
+                 pdf_class=KobakPDF, **pdf_kwargs) -> Union[bytes, int]:
+    """
+    Aggiunge pagine a un PDF esistente senza rigenerarlo.
+
+    Args:
+        source: Percorso del PDF (l'aggiornamento viene accodato al file)
+            oppure i suoi byte
+        render_fn: Funzione che aggiunge le pagine (vedi incremental_update)
+        pdf_class, pdf_kwargs: Generatore delle nuove pagine
+
+    Returns:
+        Con un percorso, il numero di byte accodati al file;
+        con dei byte, il documento aggiornato (originale + aggiornamento)
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        original = bytes(source)
+        return original + incremental_update(io.BytesIO(original), render_fn, pdf_class, **pdf_kwargs)
+
+    with open(source, 'r+b') as f:
+        update = incremental_update(f, render_fn, pdf_class, **pdf_kwargs)
+        f.seek(0, io.SEEK_END)
+        f.write(update)
+    return len(update)
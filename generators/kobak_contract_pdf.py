@@ -1,19 +1,20 @@
-from pathlib import Path
-import sys
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional, Union
 import os
 
-# Aggiungi la directory parent al path
-sys.path.insert(0, str(Path(__file__).parent.parent))
-
 from generators.base_pdf import KobakPDF, COLORS
+from generators.fragment_cache import FragmentCache
+from generators.render_plan import compile_spec
 from fpdf.enums import XPos, YPos, Align
-from datetime import datetime
 
 class KobakContractPDF(KobakPDF):
     """
     Generatore PDF per contratti Kobak.
     Eredita componenti riutilizzabili da KobakPDF (base_pdf.py).
     """
+
+    # Sezioni dati già disegnate, riusate se i loro campi non cambiano.
+    # Opzionale: None (default) = sempre dal vivo, SECTION_CACHE per attivarla
+    section_cache: Optional[FragmentCache] = None
     
     def __init__(self, orientation='P', format='A4', font='Helvetica'):
         super().__init__(
@@ -65,7 +66,7 @@ class KobakContractPDF(KobakPDF):
                  align=Align.L, new_x=XPos.RIGHT)
         
         # Numero pagina
-        self.cell(0, 5, f"Pagina {self.page_no()}/{{nb}}", align=Align.R)
+        self.cell(0, 5, f"Pagina {self.page_no()}/{self.total_pages_label()}", align=Align.R)
     
     def add_section_header(self, text, color='primary', width=None):
         """
@@ -254,164 +255,16 @@ class KobakContractPDF(KobakPDF):
             self.multi_cell(0, 3.5, term)
             self.ln(1)
     
-    def generate_contract(self, contract_data, output_path="contratto_kobak.pdf"):
-        """Genera il contratto completo"""
-        self.add_page()
-        
-        # SEZIONE OFFERTA
-        self.add_section_header("OFFERTA")
-        page_width = self.w - self.l_margin - self.r_margin
-        
+    def add_offer_line(self, label, value, label_width):
+        """Riga dell'offerta: label in grassetto e valore fino al margine destro"""
         self.set_x(self.l_margin)
         self.set_font(self.font_family, 'B', 7)
-        self.cell(25, 4, "Offerta n.", new_x=XPos.RIGHT)
+        self.cell(label_width, 4, label, new_x=XPos.RIGHT)
         self.set_font(self.font_family, '', 7)
-        self.cell(page_width - 25, 4, f"{contract_data['order_number']} - {contract_data['sede']} del {contract_data['rental_start_date']}", new_x=XPos.LEFT, new_y=YPos.NEXT)
-        
-        self.set_x(self.l_margin)
-        self.set_font(self.font_family, 'B', 7)
-        self.cell(40, 4, "Validità offerta gg:", new_x=XPos.RIGHT)
-        self.set_font(self.font_family, '', 7)
-        self.cell(page_width - 40, 4, str(contract_data['rental_days']), new_x=XPos.LEFT, new_y=YPos.NEXT)
-        self.ln(3)
-        
-        # SEZIONE DATI CLIENTE + SEDE DI POSTA (due colonne)
-        client = contract_data['client']
-        post_office = contract_data['post_office']
-        
-        # Prepara dati cliente
-        client_rows = [
-            ('Azienda:', client['company_name']),
-            ('Indirizzo:', client['address']),
-            ('CAP/Città:', f"{client['postal_code']} {client['city']}"),
-            ('Tel.:', client['phone']),
-            ('Fax:', client['fax']),
-            ('Mail:', client['email']),
-            ('PEC:', client['pec']),
-            ('Partita IVA:', client['vat_number']),
-            ('Codice Fiscale:', client['tax_code']),
-            ('IPA/SDI:', client['ipa_sdi'])
-        ]
-        
-        # Prepara dati sede
-        post_rows = [
-            ('Indirizzo:', post_office['address']),
-            ('Indirizzo 2:', post_office['address2']),
-            ('Indirizzo 3:', post_office['address3'])
-        ]
-        
-        # Usa componente base per layout a due colonne
-        self.add_two_column_info_boxes(
-            left_header='DATI DEL CLIENTE',
-            left_rows=client_rows,
-            right_header='SEDE DI POSTA',
-            right_rows=post_rows,
-            left_header_bg='primary',
-            right_header_bg='chip_gray'
-        )
-        
-        self.ln(3)
-        
-        # SPEDIZIONE FATTURE
-        self.add_gray_header("SPEDIZIONE FATTURE")
-        self.set_font(self.font_family, '', 7)
-        self.multi_cell(0, 3.5, "Barrare il metodo alternativo scelto per la spedizione delle fatture:")
-        self.ln(1)
-        
-        # Usa componente base per checkbox
-        self.add_form_checkboxes([
-            "Solo Fattura Elettronica",
-            "Anche Posta Cartacea",
-            "Anche Mail o PEC al seguente indirizzo:"
-        ], spacing=1)
-        
-        # Linea per indirizzo email
-        self.cell(0, 4, "........................................................................", new_x=XPos.LEFT, new_y=YPos.NEXT)
-        self.ln(3)
-        
-        # SEZIONE ESECUTORE SERVIZI
-        self.add_section_header("ESECUTORE DEI SERVIZI")
-        executor = contract_data['executor']
-        
-        # Prepara dati esecutore
-        executor_rows = [
-            ('Azienda:', executor['company_name']),
-            ('Indirizzo:', executor['address']),
-            ('CAP/Città:', f"{executor['postal_code']} {executor['city']}")
-        ]
-        
-        # Prepara dati contatti
-        contact_rows = [
-            ('Tel.:', executor['phone']),
-            ('Fax:', executor['fax']),
-            ('Mail:', executor['email'])
-        ]
-        
-        # Layout a due colonne (60/40)
-        def left_fn():
-            self.add_info_grid(executor_rows, label_width=25)
-        
-        def right_fn():
-            self.add_info_grid(contact_rows, label_width=15)
-        
-        self.add_two_columns_with_callbacks(
-            left_fn=left_fn,
-            right_fn=right_fn,
-            col_ratio=0.6,
-            gutter=3
-        )
-        
-        self.ln(3)
-        
-        # SEZIONE SERVIZI OFFERTI
-        self.add_section_header("SERVIZI OFFERTI")
-        self.add_gray_header("UBICAZIONE BAGNI")
-        
-        services = contract_data['services']
-        self.add_info_grid([
-            ('Ubicazione Bagni:', services['location']),
-            ('Indirizzo:', services['address']),
-            ('Responsabile:', services['manager'])
-        ], label_width=38)
-        
-        self.ln(3)
-        
-        # SEZIONE DETTAGLI SERVIZI
-        self.add_section_header("DETTAGLI SERVIZI")
-        self.add_services_table(contract_data['service_items'])
-        
-        # SEZIONE TOTALI (attaccata alla tabella)
-        self.add_totals_section(contract_data['totals'])
-        
-        # Nuova pagina per pagamento e firme
-        self.add_page()
-        
-        # SEZIONE PAGAMENTO
-        self.add_gray_header("PAGAMENTO")
-        payment = contract_data['payment']
-        self.add_info_grid([('Metodo:', payment['method'])], label_width=38)
-        self.ln(5)
-        
-        # SEZIONE BANCA
-        self.add_gray_header("BANCA")
-        bank = contract_data['bank']
-        self.add_info_grid([
-            ('Nome:', bank['name']),
-            ('Sede:', bank['branch']),
-            ('IBAN:', bank['iban']),
-            ('ABI:', bank['abi']),
-            ('CAB:', bank['cab'])
-        ], label_width=38)
-        self.ln(10)
-        
-        # SEZIONE FIRME
-        self.add_signature_section("PER ACCETTAZIONE", "PER DISDETTA")
-        
-        # SEZIONE CONDIZIONI CONTRATTUALI
-        self.add_page()
-        self.add_contract_terms(contract_data['contract_terms'])
-        
-        # FIRMA FINALE
+        self.cell(self.content_width - label_width, 4, value, new_x=XPos.LEFT, new_y=YPos.NEXT)
+    
+    def add_approval_block(self):
+        """Firme finali e approvazione clausole (art. 1341 Cod. Civ.)"""
         self.ln(10)
         self.set_font(self.font_family, 'B', 9)
         self.multi_cell(0, 6, "LETTO CONFERMATO E SOTTOSCRITTO")
@@ -444,18 +297,291 @@ class KobakContractPDF(KobakPDF):
         self.ln(10)
         
         self.cell(0, 1, "", border='B')
+    
+    def generate_contract(self, contract_data, output_path="contratto_kobak.pdf", dry_run=False):
+        """
+        Genera il contratto completo.
+
+        output_path può essere un percorso, uno stream binario (BytesIO,
+        risposta HTTP...) oppure None per ricevere direttamente i byte del PDF.
+
+        Con dry_run=True il contratto viene solo impaginato (nessun PDF
+        prodotto) e viene restituita la Pagination: numero di pagine e
+        pagine occupate da ogni sezione.
+        """
+        if dry_run:
+            self.enable_dry_run()
+        
+        # Sezioni dati (piano compilato una volta da CONTRACT_SPEC): con section_cache
+        # cambiando un campo si ridisegna solo la sezione che lo legge
+        CONTRACT_PLAN.render(self, contract_data, cache=self.section_cache)
         
-        # Salva il PDF
-        self.output(output_path)
-        return output_path
+        # SEZIONE CONDIZIONI CONTRATTUALI (frammenti statici in cache di processo)
+        with self.section('condizioni'):
+            self.add_page()
+            terms = tuple(contract_data['contract_terms'])
+            self.render_cached_fragment(('contract_terms', terms), lambda: self.add_contract_terms(terms))
+        
+        # FIRMA FINALE
+        with self.section('approvazione'):
+            self.render_cached_fragment('approval_block', self.add_approval_block)
+        
+        if self.dry_run:
+            return self.pagination()
+        
+        # Salva il PDF (file, stream o byte)
+        return self.output_to(output_path)
+
+
+# ==================== SPECIFICA CONTRATTO ====================
+# Sezioni dati del contratto: quali componenti, in che ordine e con quali
+# campi di contract_data. Compilata una volta in CONTRACT_PLAN.
+
+CONTRACT_SPEC = {
+    "sections": [
+        {"name": "offerta", "components": [
+            {"component": "page"},
+            {"component": "section_header", "args": ["OFFERTA"]},
+            {"component": "offer_line", "label": "Offerta n.", "label_width": 25,
+             "value": {"template": "{order_number} - {sede} del {rental_start_date}"}},
+            {"component": "offer_line", "label": "Validità offerta gg:", "label_width": 40,
+             "value": {"template": "{rental_days}"}},
+            {"component": "ln", "args": [3]},
+        ]},
+        {"name": "cliente", "components": [
+            {"component": "two_column_info_boxes",
+             "left_header": "DATI DEL CLIENTE",
+             "left_rows": {"fields": [
+                 ["Azienda:", "client.company_name"],
+                 ["Indirizzo:", "client.address"],
+                 ["CAP/Città:", "{client.postal_code} {client.city}"],
+                 ["Tel.:", "client.phone"],
+                 ["Fax:", "client.fax"],
+                 ["Mail:", "client.email"],
+                 ["PEC:", "client.pec"],
+                 ["Partita IVA:", "client.vat_number"],
+                 ["Codice Fiscale:", "client.tax_code"],
+                 ["IPA/SDI:", "client.ipa_sdi"],
+             ]},
+             "right_header": "SEDE DI POSTA",
+             "right_rows": {"fields": [
+                 ["Indirizzo:", "post_office.address"],
+                 ["Indirizzo 2:", "post_office.address2"],
+                 ["Indirizzo 3:", "post_office.address3"],
+             ]},
+             "left_header_bg": "primary",
+             "right_header_bg": "chip_gray"},
+            {"component": "ln", "args": [3]},
+        ]},
+        {"name": "spedizione_fatture", "components": [
+            {"component": "gray_header", "args": ["SPEDIZIONE FATTURE"]},
+            {"component": "set_font", "style": "", "size": 7},
+            {"component": "multi_cell", "args": [0, 3.5, "Barrare il metodo alternativo scelto per la spedizione delle fatture:"]},
+            {"component": "ln", "args": [1]},
+            {"component": "form_checkboxes", "options": [
+                "Solo Fattura Elettronica",
+                "Anche Posta Cartacea",
+                "Anche Mail o PEC al seguente indirizzo:",
+            ], "spacing": 1},
+            # Linea per indirizzo email
+            {"component": "cell", "args": [0, 4, "........................................................................"],
+             "new_x": "LEFT", "new_y": "NEXT"},
+            {"component": "ln", "args": [3]},
+        ]},
+        {"name": "esecutore", "components": [
+            {"component": "section_header", "args": ["ESECUTORE DEI SERVIZI"]},
+            # Layout a due colonne (60/40)
+            {"component": "two_columns_with_callbacks",
+             "left_fn": [{"component": "info_grid", "label_width": 25, "rows": {"fields": [
+                 ["Azienda:", "executor.company_name"],
+                 ["Indirizzo:", "executor.address"],
+                 ["CAP/Città:", "{executor.postal_code} {executor.city}"],
+             ]}}],
+             "right_fn": [{"component": "info_grid", "label_width": 15, "rows": {"fields": [
+                 ["Tel.:", "executor.phone"],
+                 ["Fax:", "executor.fax"],
+                 ["Mail:", "executor.email"],
+             ]}}],
+             "col_ratio": 0.6,
+             "gutter": 3},
+            {"component": "ln", "args": [3]},
+        ]},
+        {"name": "servizi", "components": [
+            {"component": "section_header", "args": ["SERVIZI OFFERTI"]},
+            {"component": "gray_header", "args": ["UBICAZIONE BAGNI"]},
+            {"component": "info_grid", "label_width": 38, "rows": {"fields": [
+                ["Ubicazione Bagni:", "services.location"],
+                ["Indirizzo:", "services.address"],
+                ["Responsabile:", "services.manager"],
+            ]}},
+            {"component": "ln", "args": [3]},
+        ]},
+        {"name": "dettagli_servizi", "components": [
+            {"component": "section_header", "args": ["DETTAGLI SERVIZI"]},
+            {"component": "services_table", "args": [{"field": "service_items"}]},
+            # Totali attaccati alla tabella
+            {"component": "totals_section", "args": [{"field": "totals"}]},
+        ]},
+        {"name": "pagamento", "components": [
+            # Nuova pagina per pagamento e firme
+            {"component": "page"},
+            {"component": "gray_header", "args": ["PAGAMENTO"]},
+            {"component": "info_grid", "label_width": 38, "rows": {"fields": [
+                ["Metodo:", "payment.method"],
+            ]}},
+            {"component": "ln", "args": [5]},
+        ]},
+        {"name": "banca", "components": [
+            {"component": "gray_header", "args": ["BANCA"]},
+            {"component": "info_grid", "label_width": 38, "rows": {"fields": [
+                ["Nome:", "bank.name"],
+                ["Sede:", "bank.branch"],
+                ["IBAN:", "bank.iban"],
+                ["ABI:", "bank.abi"],
+                ["CAB:", "bank.cab"],
+            ]}},
+            {"component": "ln", "args": [10]},
+        ]},
+        {"name": "firme", "components": [
+            {"component": "signature_section", "args": ["PER ACCETTAZIONE", "PER DISDETTA"]},
+        ]},
+    ]
+}
+
+CONTRACT_PLAN = compile_spec(CONTRACT_SPEC, KobakContractPDF)
+
+
+# ==================== GENERAZIONE IN BATCH ====================
+
+class BatchResult(NamedTuple):
+    """Esito di un singolo contratto generato in batch"""
+    index: int
+    output_path: Optional[str]
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _render_contract_job(pdf_class, index, contract_data, output_path):
+    """
+    Eseguito nel processo worker: genera un contratto e cattura gli errori,
+    così un record non valido non interrompe l'intero batch.
+    """
+    # Cache su disco e pool di istanze solo nei worker: non pesano sull'import del modulo
+    from generators.output_cache import render_document
+    try:
+        # Istanze riusate fra i contratti dello stesso worker (e PDF già pronti se c'è KOBAK_PDF_CACHE)
+        render_document(pdf_class, contract_data, output_path)
+        return BatchResult(index, output_path)
+    except Exception as e:
+        return BatchResult(index, None, f"{type(e).__name__}: {e}")
+
+
+def generate_contracts_batch(
+    contracts: Iterable[dict],
+    output_path: Union[str, Callable[[int, dict], str]] = "contratto_{index:05d}.pdf",
+    max_workers: Optional[int] = None,
+    max_in_flight: Optional[int] = None,
+    ordered: bool = True,
+    pdf_class=KobakContractPDF,
+) -> Iterator[BatchResult]:
+    """
+    Genera molti contratti in parallelo su un pool di processi.
+
+    I contratti vengono letti dall'iterabile man mano che si libera spazio,
+    quindi anche input enormi (generatori, cursori DB) non riempiono la RAM.
+
+    Args:
+        contracts: Iterabile di dict contract_data
+        output_path: Pattern del file di output (formattato con `index` e
+            `order_number`) oppure funzione (index, contract_data) -> path
+        max_workers: Numero di processi (default: numero di CPU)
+        max_in_flight: Massimo di contratti in coda/in lavorazione
+            (default: 2 * max_workers)
+        ordered: Se True i risultati arrivano nell'ordine di input,
+            altrimenti appena completati
+        pdf_class: Classe generatore (deve essere importabile dai worker)
+
+    Yields:
+        BatchResult per ogni contratto (con `error` valorizzato se fallito,
+        anche quando il worker termina o i dati non arrivano al worker)
+    """
+    # multiprocessing solo per i batch: non pesa sull'avvio dei worker che non lo usano
+    from concurrent.futures import Future, ProcessPoolExecutor, FIRST_COMPLETED, wait
+    from concurrent.futures.process import BrokenProcessPool
+
+    max_workers = max_workers or os.cpu_count() or 1
+    max_in_flight = max(1, max_in_flight or max_workers * 2)
+
+    def resolve_path(index, contract_data):
+        if callable(output_path):
+            return output_path(index, contract_data)
+        return output_path.format(index=index, order_number=contract_data.get('order_number', index))
+
+    executor = ProcessPoolExecutor(max_workers=max_workers)
+    # Lavori in corso in ordine di input: future -> (index, pool che lo esegue)
+    pending = {}
+
+    def replace_pool(broken):
+        nonlocal executor
+        if executor is broken:
+            broken.shutdown(wait=False, cancel_futures=True)
+            executor = ProcessPoolExecutor(max_workers=max_workers)
+
+    def submit(index, contract_data):
+        try:
+            path = resolve_path(index, contract_data)
+        except Exception as e:  # record senza i campi del pattern, errore di output_path
+            # Esito già pronto, restituito nell'ordine di input come gli altri
+            future = Future()
+            future.set_result(BatchResult(index, None, f"{type(e).__name__}: {e}"))
+            pending[future] = (index, None)
+            return
+        job = (_render_contract_job, pdf_class, index, contract_data, path)
+        try:
+            future = executor.submit(*job)
+        except BrokenProcessPool:
+            replace_pool(executor)
+            future = executor.submit(*job)
+        pending[future] = (index, executor)
+
+    def collect(future):
+        index, pool = pending.pop(future)
+        try:
+            return future.result()
+        except BrokenProcessPool as e:
+            # Un worker è terminato (es. memoria esaurita): falliscono i contratti
+            # in lavorazione su quel pool, i successivi vanno su un pool nuovo
+            replace_pool(pool)
+            return BatchResult(index, None, f"{type(e).__name__}: {e}")
+        except Exception as e:  # es. dati non serializzabili verso il worker
+            return BatchResult(index, None, f"{type(e).__name__}: {e}")
+
+    def next_results():
+        if ordered:
+            return [collect(next(iter(pending)))]
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        return [collect(future) for future in done]
+
+    try:
+        for index, contract_data in enumerate(contracts):
+            submit(index, contract_data)
+            if len(pending) >= max_in_flight:
+                yield from next_results()
+
+        # Svuota i lavori rimasti
+        while pending:
+            yield from next_results()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
 
 
 # ESEMPIO DI UTILIZZO
-def create_sample_contract():
-    """Crea un contratto di esempio"""
-    
-    # Dati di esempio
-    contract_data = {
+def sample_contract_data():
+    """Dati di un contratto di esempio (usati anche dai benchmark)"""
+    return {
         'order_number': 'OFF-2024-001',
         'sede': 'Sede Principale',
         'rental_start_date': '20/01/2024',
@@ -533,6 +659,11 @@ def create_sample_contract():
             "(Obblighi e divieti del cliente). Il CLIENTE deve pagare il canone di noleggio nei termini indicati...",
         ]
     }
+
+
+def create_sample_contract():
+    """Crea un contratto di esempio"""
+    contract_data = sample_contract_data()
     
     # Crea il PDF
     pdf = KobakContractPDF()
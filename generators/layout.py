@@ -0,0 +1,52 @@
+"""
+Strutture di layout riutilizzabili: il risultato dell'impaginazione
+(wrapping, altezze, posizioni relative) separato dal disegno.
+
+Un componente calcola il layout una volta sola (layout pass) e poi lo
+disegna (paint pass) senza rifare il wrapping del testo; lo stesso layout
+può essere misurato, riusato o disegnato da altri componenti.
+"""
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from fpdf.enums import Align
+
+
+class LineBox(NamedTuple):
+    """Riga di testo già spezzata, con posizione relativa all'origine del blocco"""
+    text: str
+    x: float
+    y: float
+    width: float
+    height: float
+    align: Align
+
+
+class CardRow(NamedTuple):
+    """Riga label/valore di una card: y e altezza relative al bordo superiore"""
+    label: Optional[str]
+    y: float
+    height: float
+    lines: Tuple[LineBox, ...]
+
+
+class CardLayout(NamedTuple):
+    """Layout completo di una info card, pronto per essere disegnato"""
+    title: Optional[str]
+    width: float
+    height: float
+    header_height: float
+    padding: float
+    label_width: float
+    line_height: float
+    rows: Tuple[CardRow, ...]
+
+
+class Pagination(NamedTuple):
+    """
+    Risultato dell'impaginazione di un documento (dry-run).
+
+    page_count: pagine totali
+    sections: nome sezione -> (prima pagina, ultima pagina), numerate da 1
+    """
+    page_count: int
+    sections: Dict[str, Tuple[int, int]]
@@ -0,0 +1,331 @@
+"""
+Cache su disco dei PDF già generati, indirizzata per contenuto.
+
+Lo stesso contratto viene spesso rigenerato (nuovo download del cliente,
+retry del client): qui i byte del PDF sono salvati in una cartella locale
+con chiave sha256 di dati, classe del documento, metodo di render, argomenti
+del costruttore e versione della libreria (fpdf2 + sorgenti dei generatori).
+Le richieste ripetute leggono il file invece di renderizzare.
+
+    cache = PdfOutputCache("/var/cache/kobak-pdf", max_bytes=512 * 1024 * 1024)
+    pdf_bytes = cache.render(KobakContractPDF, contract_data)           # generate_contract
+    cache.render(MyDocumentPDF, data, method='generate', dest=response)  # generate(data, None)
+
+Il PDF servito dalla cache è identico al primo render, data di creazione
+inclusa. I file referenziati per percorso nei dati o negli argomenti (es.
+logo_path) entrano nella chiave col percorso, non col contenuto.
+
+Con la variabile d'ambiente KOBAK_PDF_CACHE (cartella) i render dei batch e
+del rendering asincrono passano da OUTPUT_CACHE, condivisa dai worker.
+"""
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, time as dtime
+from decimal import Decimal
+from enum import Enum
+from os import PathLike
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple, Union
+
+import fpdf
+
+from generators.pdf_pool import default_pool
+
+# Versione del formato della chiave: da incrementare se cambia la canonicalizzazione
+_KEY_FORMAT = 1
+# Dopo una pulizia la cache scende a questa frazione di max_bytes (evita una pulizia a ogni scrittura)
+_EVICT_TARGET = 0.9
+# File temporanei rimasti da processi interrotti: rimossi dalla pulizia dopo questo tempo (secondi)
+_STALE_TMP_AGE = 3600
+
+# Versione della libreria per classe documento (vedi library_version)
+_versions: Dict[type, str] = {}
+
+
+def _canonical(value: Any):
+    """Valori non JSON in forma stabile (json.dumps default)"""
+    if isinstance(value, (date, dtime)):  # anche datetime
+        return ['datetime', value.isoformat()]
+    if isinstance(value, Decimal):
+        return ['decimal', str(value)]
+    if isinstance(value, Enum):
+        return ['enum', type(value).__qualname__, value.value]
+    if isinstance(value, (set, frozenset)):
+        return ['set', sorted(_dumps(item) for item in value)]
+    if isinstance(value, (bytes, bytearray)):
+        return ['bytes', hashlib.sha256(value).hexdigest()]
+    if isinstance(value, PathLike):
+        return ['path', os.fspath(value)]
+    raise TypeError(f"Valore non supportato nella chiave della cache: {type(value).__name__}")
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=_canonical)
+
+
+def _source_digest(paths) -> str:
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        digest.update(Path(path).read_bytes())
+    return digest.hexdigest()
+
+
+def library_version(pdf_class=None) -> str:
+    """
+    Versione usata nella chiave: fpdf2, sorgenti del pacchetto generators e
+    dei moduli da cui deriva pdf_class. Una modifica al codice invalida i PDF
+    salvati con la versione precedente.
+    """
+    version = _versions.get(pdf_class)
+    if version is None:
+        paths = {str(path) for path in Path(__file__).parent.glob('*.py')}
+        for cls in (pdf_class or object).__mro__:
+            path = getattr(sys.modules.get(cls.__module__), '__file__', None)
+            if path and not cls.__module__.startswith('fpdf'):
+                paths.add(path)
+        version = _versions[pdf_class] = f"fpdf{fpdf.__version__}-{_source_digest(paths)[:16]}"
+    return version
+
+
+def _deliver(pdf_bytes: bytes, dest: Union[str, PathLike, BinaryIO, None]):
+    """Come KobakPDF.output_to: byte se dest è None, altrimenti scrive su stream o file"""
+    if dest is None:
+        return pdf_bytes
+    if hasattr(dest, 'write'):
+        dest.write(pdf_bytes)
+        return dest
+    Path(dest).write_bytes(pdf_bytes)
+    return dest
+
+
+class PdfOutputCache:
+    """
+    PDF su disco con limite di dimensione: oltre max_bytes vengono rimossi
+    i file usati meno di recente (la data di modifica segna l'ultimo uso).
+    Thread-safe; più processi possono condividere la stessa cartella.
+    """
+
+    def __init__(self, directory: Union[str, PathLike], max_bytes: int = 256 * 1024 * 1024):
+        """
+        Args:
+            directory: Cartella della cache (creata se manca), su disco locale
+            max_bytes: Spazio massimo occupato dai PDF salvati
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Render in corso per chiave: le richieste uguali attendono il primo invece di renderizzare
+        self._inflight: Dict[str, List] = {}
+        # Byte su disco stimati dal processo (ricalcolati a ogni pulizia)
+        self._size: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    # ==================== CHIAVI ====================
+
+    def key_for(self, pdf_class, data: Any, method: str = 'generate_contract',
+                pdf_kwargs: Optional[Dict[str, Any]] = None) -> str:
+        """Chiave sha256 (hex) del PDF prodotto da pdf_class(**pdf_kwargs).method(data, None)"""
+        canonical = _dumps([
+            _KEY_FORMAT,
+            f"{pdf_class.__module__}.{pdf_class.__qualname__}",
+            method,
+            pdf_kwargs or {},
+            library_version(pdf_class),
+            data,
+        ])
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.pdf"
+
+    # ==================== LETTURA / SCRITTURA ====================
+
+    def _read(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            pdf_bytes = path.read_bytes()
+        except OSError:
+            return None
+        if not pdf_bytes.startswith(b'%PDF-'):
+            return None
+        try:
+            os.utime(path)  # ultimo uso, per l'ordine LRU
+        except OSError:  # rimosso nel frattempo da un altro processo
+            pass
+        return pdf_bytes
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Byte del PDF salvato con key, None se assente"""
+        pdf_bytes = self._read(key)
+        with self._lock:
+            if pdf_bytes is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return pdf_bytes
+
+    def put(self, key: str, pdf_bytes: bytes):
+        """Salva il PDF: scrittura su file temporaneo e rename atomico"""
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(pdf_bytes)
+            os.replace(tmp, path)
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self.stores += 1
+            if self._size is not None:
+                self._size += len(pdf_bytes)
+        if self._disk_size() > self.max_bytes:
+            self.evict()
+
+    # ==================== RENDER ====================
+
+    @contextmanager
+    def _single_flight(self, key: str):
+        with self._lock:
+            entry = self._inflight.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._inflight[key]
+
+    def render(self, pdf_class, data: Any, method: str = 'generate_contract',
+               pdf_kwargs: Optional[Dict[str, Any]] = None,
+               dest: Union[str, PathLike, BinaryIO, None] = None):
+        """
+        PDF di pdf_class(**pdf_kwargs).method(data, None), dalla cache o
+        renderizzato (su un'istanza del pool di processo) e salvato.
+
+        Args:
+            dest: Come KobakPDF.output_to: None per i byte, stream o percorso
+
+        Returns:
+            I byte del PDF se dest è None, altrimenti dest
+        """
+        pdf_kwargs = pdf_kwargs or {}
+        key = self.key_for(pdf_class, data, method, pdf_kwargs)
+        pdf_bytes = self.get(key)
+        if pdf_bytes is None:
+            with self._single_flight(key):
+                # Un'altra richiesta uguale potrebbe averlo appena salvato
+                pdf_bytes = self._read(key)
+                if pdf_bytes is None:
+                    with default_pool(pdf_class, **pdf_kwargs).document() as pdf:
+                        pdf_bytes = bytes(getattr(pdf, method)(data, None))
+                    self.put(key, pdf_bytes)
+                else:
+                    with self._lock:
+                        self.misses -= 1
+                        self.hits += 1
+        return _deliver(pdf_bytes, dest)
+
+    # ==================== PULIZIA ====================
+
+    def _scan(self) -> List[Tuple[float, int, str]]:
+        entries = []
+        now = time.time()
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    stat = entry.stat()
+                    if entry.name.endswith('.pdf'):
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    elif entry.name.endswith('.tmp') and now - stat.st_mtime > _STALE_TMP_AGE:
+                        os.unlink(entry.path)
+                except OSError:  # rimosso da un altro processo
+                    continue
+        return entries
+
+    def _disk_size(self) -> int:
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._scan())
+        return self._size
+
+    def evict(self, target_bytes: Optional[int] = None) -> int:
+        """
+        Rimuove i PDF usati meno di recente finché la cache non scende
+        sotto target_bytes (default: 90% di max_bytes).
+
+        Returns:
+            Numero di file rimossi
+        """
+        if target_bytes is None:
+            target_bytes = int(self.max_bytes * _EVICT_TARGET)
+        entries = sorted(self._scan())
+        size = sum(entry[1] for entry in entries)
+        removed = 0
+        for _, file_size, path in entries:
+            if size <= target_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            size -= file_size
+            removed += 1
+        with self._lock:
+            self._size = size
+            self.evictions += removed
+        return removed
+
+    def clear(self):
+        """Svuota la cartella e azzera i contatori"""
+        self.evict(0)
+        with self._lock:
+            self.hits = self.misses = self.stores = self.evictions = 0
+
+    def stats(self) -> dict:
+        entries = self._scan()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(entries),
+                'bytes': sum(entry[1] for entry in entries),
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stores': self.stores,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Cache di default dei worker (batch, rendering asincrono): attiva con KOBAK_PDF_CACHE
+OUTPUT_CACHE: Optional[PdfOutputCache] = (
+    PdfOutputCache(os.environ['KOBAK_PDF_CACHE']) if os.environ.get('KOBAK_PDF_CACHE') else None
+)
+
+
+def render_document(pdf_class, data: Any, dest: Union[str, PathLike, BinaryIO, None] = None,
+                    method: str = 'generate_contract'):
+    """Render su un'istanza del pool di processo, passando da OUTPUT_CACHE se attiva"""
+    if OUTPUT_CACHE is not None:
+        return OUTPUT_CACHE.render(pdf_class, data, method, dest=dest)
+    with default_pool(pdf_class).document() as pdf:
+        result = getattr(pdf, method)(data, dest)
+        return bytes(result) if dest is None else result
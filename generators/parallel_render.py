@@ -0,0 +1,157 @@
+"""
+Rendering parallelo di documenti lunghi, per intervalli di pagine.
+
+Un report con centinaia di pagine di tabelle è un unico documento FPDF e
+viene renderizzato da un solo core. Qui il documento è descritto come una
+sequenza di sezioni, ciascuna su pagine proprie: le sezioni si impaginano
+in dry-run nei worker (numero di pagine), si raggruppano in intervalli di
+pagine bilanciati, si renderizzano in parallelo con la numerazione giusta
+(footer "Pagina X di N" e alias {nb}) e si uniscono in un solo PDF, con
+font e immagini identici scritti una volta sola.
+
+    def mese(pdf, righe):                       # importabile dai worker
+        pdf.add_zebra_table(INTESTAZIONI, righe)
+
+    sezioni = [ReportSection(f"mese_{m}", mese, (righe_del_mese(m),)) for m in range(1, 13)]
+    report = render_sections(sezioni, max_workers=4)
+"""
+import io
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from os import PathLike
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, List, NamedTuple, Optional, Sequence, Union
+
+from generators.assembly import PdfAssembler
+from generators.base_pdf import KobakPDF
+
+
+class ReportSection(NamedTuple):
+    """
+    Sezione di un documento renderizzabile in parallelo: inizia sempre su
+    una pagina nuova (add_page lo fa il renderer) e render(pdf, *args) ne
+    disegna il contenuto. render e args devono essere serializzabili
+    (funzione a livello di modulo, dati semplici).
+    """
+    name: str
+    render: Callable[..., None]
+    args: tuple = ()
+
+
+def _run_sections(pdf: KobakPDF, sections: Sequence[ReportSection]):
+    for section in sections:
+        pdf.add_page()
+        with pdf.section(section.name):
+            section.render(pdf, *section.args)
+
+
+def _count_pages(pdf_class, pdf_kwargs: Dict[str, Any], sections: Sequence[ReportSection]) -> List[int]:
+    """Eseguito nel worker: pagine occupate da ogni sezione (dry-run)"""
+    pdf = pdf_class(**pdf_kwargs)
+    pdf.enable_dry_run()
+    counts = []
+    for section in sections:
+        start = pdf.page
+        _run_sections(pdf, (section,))
+        counts.append(pdf.page - start)
+    return counts
+
+
+def _render_range(pdf_class, pdf_kwargs: Dict[str, Any], sections: Sequence[ReportSection],
+                  first_page: int, total_pages: int) -> bytes:
+    """Eseguito nel worker: renderizza le sezioni come pagine first_page.. di total_pages"""
+    pdf = pdf_class(**pdf_kwargs)
+    pdf.page_number_offset = first_page - 1
+    pdf.total_pages = total_pages
+    _run_sections(pdf, sections)
+    return bytes(pdf.output())
+
+
+def split_page_ranges(page_counts: Sequence[int], parts: int) -> List[range]:
+    """
+    Divide le sezioni (con le loro pagine) in al più parts gruppi consecutivi
+    con un numero di pagine il più possibile uguale.
+
+    Returns:
+        Indici delle sezioni di ogni gruppo
+    """
+    total = sum(page_counts)
+    groups = []
+    start = done = 0
+    for index, count in enumerate(page_counts):
+        done += count
+        # Chiude il gruppo quando raggiunge la sua quota del totale
+        if done * parts >= total * (len(groups) + 1) and len(groups) < parts - 1:
+            groups.append(range(start, index + 1))
+            start = index + 1
+    if start < len(page_counts):
+        groups.append(range(start, len(page_counts)))
+    return groups
+
+
+def render_sections(sections: Sequence[ReportSection], pdf_class=KobakPDF,
+                    pdf_kwargs: Optional[Dict[str, Any]] = None,
+                    max_workers: Optional[int] = None,
+                    executor: Optional[Executor] = None,
+                    dest: Union[str, PathLike, BinaryIO, None] = None):
+    """
+    Renderizza un documento di più sezioni su un pool di processi.
+
+    Args:
+        sections: Sezioni del documento, nell'ordine
+        pdf_class, pdf_kwargs: Generatore (importabile dai worker) e argomenti
+        max_workers: Intervalli di pagine renderizzati in parallelo
+            (default: numero di CPU); con 1 il documento si renderizza qui
+        executor: Pool di processi già avviato (altrimenti ne crea uno)
+        dest: Come KobakPDF.output_to: None per i byte, stream o percorso
+
+    Returns:
+        I byte del PDF se dest è None, altrimenti dest
+    """
+    sections = list(sections)
+    pdf_kwargs = pdf_kwargs or {}
+    max_workers = max_workers or os.cpu_count() or 1
+    if max_workers == 1 or len(sections) < 2:
+        pdf = pdf_class(**pdf_kwargs)
+        _run_sections(pdf, sections)
+        return pdf.output_to(dest)
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+    try:
+        # 1. Impaginazione in dry-run: pagine di ogni sezione
+        layouts = [executor.submit(_count_pages, pdf_class, pdf_kwargs, sections[group.start:group.stop])
+                   for group in split_page_ranges([1] * len(sections), max_workers)]
+        counts = [count for layout in layouts for count in layout.result()]
+
+        # 2. Render degli intervalli di pagine, già numerati sul totale
+        total_pages = sum(counts)
+        futures = []
+        first_page = 1
+        for group in split_page_ranges(counts, max_workers):
+            futures.append(executor.submit(_render_range, pdf_class, pdf_kwargs,
+                                           sections[group.start:group.stop], first_page, total_pages))
+            first_page += sum(counts[group.start:group.stop])
+
+        # 3. Unione nell'ordine, man mano che gli intervalli sono pronti
+        if dest is None:
+            out = io.BytesIO()
+            _assemble(futures, out)
+            return out.getvalue()
+        if hasattr(dest, 'write'):
+            _assemble(futures, dest)
+            return dest
+        with open(Path(dest), 'wb') as f:
+            _assemble(futures, f)
+        return dest
+    finally:
+        if own_executor:
+            executor.shutdown(cancel_futures=True)
+
+
+def _assemble(futures, out: BinaryIO):
+    assembler = PdfAssembler(out)
+    for future in futures:
+        assembler.add(future.result())
+    assembler.close()
@@ -0,0 +1,296 @@
+"""
+Lettura e scrittura a basso livello degli oggetti PDF prodotti da fpdf2.
+
+Usato dai post-processori che lavorano sul file già generato (aggiornamento
+incrementale, profilo compatto, unione): legge trailer, xref (tabelle
+classiche o xref stream del profilo compatto) e singoli oggetti con seek,
+senza caricare il file in memoria e senza dipendenze esterne.
+"""
+import io
+import re
+import zlib
+from typing import BinaryIO, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+# Byte letti dalla fine del file per trovare startxref
+_TAIL_SIZE = 2048
+_BLOCK_SIZE = 4096
+
+_BODY_END = re.compile(rb'\bstream\r?\n|\bendobj\b')
+_STARTXREF = re.compile(rb'startxref')
+_OBJ_HEADER = re.compile(rb'\s*(\d+) (\d+) obj\s*')
+# Stringhe letterali (fpdf2 esegue l'escape delle parentesi) o riferimenti indiretti
+_STRING_OR_REF = re.compile(rb'(\((?:\\.|[^\\)])*\))|(\d+) (\d+) R\b', re.S)
+_PREDICTOR = re.compile(rb'/Predictor\s+(\d+)')
+_COLUMNS = re.compile(rb'/Columns\s+(\d+)')
+
+
+class PdfObject(NamedTuple):
+    """Oggetto indiretto: dizionario/valore e, se presente, stream grezzo (già compresso)"""
+    num: int
+    gen: int
+    body: bytes
+    stream: Optional[bytes]
+
+
+class PdfReader:
+    """
+    Lettore minimo per PDF come quelli prodotti da fpdf2 (tabelle xref
+    classiche) e dal profilo compatto (xref stream e object stream).
+    Legge solo trailer, xref e gli oggetti richiesti (seek), senza caricare
+    il file in memoria.
+    """
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+        stream.seek(0, io.SEEK_END)
+        self.size = stream.tell()
+        self.startxref = self._read_startxref()
+        # num -> (offset, gen); None per gli oggetti liberati
+        self.offsets: Dict[int, Optional[Tuple[int, int]]] = {}
+        # num -> (object stream che lo contiene, posizione nello stream)
+        self.compressed: Dict[int, Tuple[int, int]] = {}
+        # True se la sezione xref più recente è un xref stream
+        self.xref_stream = False
+        self._object_streams: Dict[int, Dict[int, bytes]] = {}
+        self.trailer = self._read_xref(self.startxref)
+
+    def read(self, offset: int, length: int) -> bytes:
+        self.stream.seek(offset)
+        return self.stream.read(length)
+
+    def _read_until(self, offset: int, pattern) -> Tuple[bytes, re.Match]:
+        data = b''
+        while True:
+            block = self.read(offset + len(data), _BLOCK_SIZE)
+            if not block:
+                raise ValueError(f"PDF troncato: fine inattesa dopo l'offset {offset}")
+            data += block
+            match = pattern.search(data)
+            if match:
+                return data, match
+
+    def _read_startxref(self) -> int:
+        start = max(0, self.size - _TAIL_SIZE)
+        tail = self.read(start, self.size - start)
+        pos = tail.rfind(b'startxref')
+        if pos < 0:
+            raise ValueError("PDF non valido: startxref mancante")
+        return int(tail[pos + len(b'startxref'):].split()[0])
+
+    def _add_entry(self, num: int, offset: Optional[Tuple[int, int]] = None,
+                   compressed: Optional[Tuple[int, int]] = None):
+        # Le sezioni si leggono dalla più recente: vince la prima voce trovata
+        if num in self.offsets or num in self.compressed:
+            return
+        if compressed is not None:
+            self.compressed[num] = compressed
+        else:
+            self.offsets[num] = offset
+
+    def _read_xref(self, offset: Optional[int]) -> bytes:
+        """Legge la catena di sezioni xref (/Prev); vince la voce più recente"""
+        trailer = None
+        while offset is not None:
+            if self.read(offset, 4) == b'xref':
+                section_trailer = self._read_xref_table(offset)
+            else:
+                section_trailer = self._read_xref_stream(offset)
+                self.xref_stream = self.xref_stream or trailer is None
+            if trailer is None:
+                trailer = section_trailer
+            prev = re.search(rb'/Prev (\d+)', section_trailer)
+            offset = int(prev.group(1)) if prev else None
+        return trailer
+
+    def _read_xref_table(self, offset: int) -> bytes:
+        data, end = self._read_until(offset, _STARTXREF)
+        table, _, section_trailer = data[:end.start()].partition(b'trailer')
+        tokens = table.split()[1:]
+        i = 0
+        while i < len(tokens):
+            start, count = int(tokens[i]), int(tokens[i + 1])
+            i += 2
+            for num in range(start, start + count):
+                entry_offset, gen, kind = tokens[i:i + 3]
+                i += 3
+                self._add_entry(num, (int(entry_offset), int(gen)) if kind == b'n' else None)
+        return section_trailer
+
+    def _read_xref_stream(self, offset: int) -> bytes:
+        """Sezione xref stream (PDF 1.5): il dizionario fa da trailer"""
+        obj = self._read_object(offset)
+        if obj.stream is None or not re.search(rb'/Type\s*/XRef\b', obj.body):
+            raise ValueError(f"PDF non valido: nessuna sezione xref all'offset {offset}")
+        widths = [int(w) for w in re.search(rb'/W\s*\[([^\]]*)\]', obj.body).group(1).split()]
+        index = re.search(rb'/Index\s*\[([^\]]*)\]', obj.body)
+        if index:
+            bounds = [int(value) for value in index.group(1).split()]
+        else:
+            bounds = [0, resolve_int(self, obj.body, b'/Size')]
+        data = decode_stream(obj.body, obj.stream)
+        row_size = sum(widths)
+        position = 0
+        for start, count in zip(bounds[::2], bounds[1::2]):
+            for num in range(start, start + count):
+                fields = []
+                for width in widths:
+                    fields.append(int.from_bytes(data[position:position + width], 'big'))
+                    position += width
+                kind = fields[0] if widths[0] else 1
+                if kind == 1:
+                    self._add_entry(num, (fields[1], fields[2]))
+                elif kind == 2:
+                    self._add_entry(num, compressed=(fields[1], fields[2]))
+                else:
+                    self._add_entry(num)
+        if position > len(data) or len(data) % row_size:
+            raise ValueError("PDF non valido: xref stream di lunghezza inattesa")
+        return obj.body
+
+    def _read_object(self, offset: int) -> PdfObject:
+        data, end = self._read_until(offset, _BODY_END)
+        header = _OBJ_HEADER.match(data)
+        body = data[header.end():end.start()].rstrip()
+        stream = None
+        if end.group(0) != b'endobj':
+            length = resolve_int(self, body, b'/Length')
+            stream = self.read(offset + end.end(), length)
+        return PdfObject(int(header.group(1)), int(header.group(2)), body, stream)
+
+    def _object_stream(self, num: int) -> Dict[int, bytes]:
+        """Oggetti contenuti in un object stream (decompresso una volta sola)"""
+        objects = self._object_streams.get(num)
+        if objects is None:
+            container = self.object(num)
+            data = decode_stream(container.body, container.stream)
+            first = resolve_int(self, container.body, b'/First')
+            header = [int(value) for value in data[:first].split()]
+            starts = header[1::2] + [len(data) - first]
+            objects = self._object_streams[num] = {
+                obj_num: data[first + start:first + end].strip()
+                for obj_num, start, end in zip(header[::2], starts, starts[1:])
+            }
+        return objects
+
+    def object(self, num: int) -> PdfObject:
+        compressed = self.compressed.get(num)
+        if compressed is not None:
+            body = self._object_stream(compressed[0]).get(num)
+            if body is None:
+                raise ValueError(f"Oggetto {num} non presente nell'object stream {compressed[0]}")
+            return PdfObject(num, 0, body, None)
+        entry = self.offsets.get(num)
+        if entry is None:
+            raise ValueError(f"Oggetto {num} non presente nella xref")
+        offset, gen = entry
+        return self._read_object(offset)._replace(num=num, gen=gen)
+
+    def objects(self) -> Dict[int, PdfObject]:
+        """Tutti gli oggetti in uso, per numero"""
+        numbers = [num for num, entry in self.offsets.items() if entry and num] + list(self.compressed)
+        return {num: self.object(num) for num in sorted(numbers)}
+
+
+def decode_stream(body: bytes, stream: bytes) -> bytes:
+    """Stream decompresso: nessun filtro o FlateDecode, con predittore PNG opzionale"""
+    filters = re.search(rb'/Filter\s*(\[[^\]]*\]|/\w+)', body)
+    names = re.findall(rb'/(\w+)', filters.group(1)) if filters else []
+    if any(name != b'FlateDecode' for name in names):
+        raise ValueError(f"Filtro non supportato: {b' '.join(names).decode()}")
+    data = zlib.decompress(stream) if names else stream
+    predictor = _PREDICTOR.search(body)
+    if predictor is None or int(predictor.group(1)) < 10:
+        return data
+    columns = _COLUMNS.search(body)
+    return _png_unpredict(data, int(columns.group(1)) if columns else 1)
+
+
+def _png_unpredict(data: bytes, columns: int) -> bytes:
+    """Annulla i predittori PNG (un byte per campione, come negli xref stream)"""
+    out = bytearray()
+    previous = bytearray(columns)
+    for start in range(0, len(data), columns + 1):
+        kind, row = data[start], bytearray(data[start + 1:start + 1 + columns])
+        for i in range(len(row)):
+            left = row[i - 1] if i else 0
+            up = previous[i]
+            if kind == 1:
+                row[i] = (row[i] + left) & 0xFF
+            elif kind == 2:
+                row[i] = (row[i] + up) & 0xFF
+            elif kind == 3:
+                row[i] = (row[i] + (left + up) // 2) & 0xFF
+            elif kind == 4:
+                corner = previous[i - 1] if i else 0
+                estimate = left + up - corner
+                distances = (abs(estimate - left), abs(estimate - up), abs(estimate - corner))
+                row[i] = (row[i] + (left, up, corner)[distances.index(min(distances))]) & 0xFF
+        out += row
+        previous = row
+    return bytes(out)
+
+
+def ref(body: bytes, key: bytes) -> Tuple[int, int]:
+    """Riferimento indiretto (num, gen) associato a key nel dizionario"""
+    match = re.search(re.escape(key) + rb'\s+(\d+) (\d+) R\b', body)
+    if match is None:
+        raise ValueError(f"Riferimento {key.decode()} non trovato")
+    return int(match.group(1)), int(match.group(2))
+
+
+def resolve_int(reader: PdfReader, body: bytes, key: bytes) -> int:
+    """Valore intero di key, diretto o tramite riferimento indiretto"""
+    match = re.search(re.escape(key) + rb'\s+(\d+)(?:\s+(\d+) R\b)?', body)
+    if match is None:
+        raise ValueError(f"Chiave {key.decode()} mancante")
+    if match.group(2) is None:
+        return int(match.group(1))
+    return int(reader.object(int(match.group(1))).body)
+
+
+def replace_refs(body: bytes, replace: Callable[[int, int], bytes]) -> bytes:
+    """Sostituisce i riferimenti indiretti fuori dalle stringhe letterali"""
+    def sub(match):
+        if match.group(1):
+            return match.group(1)
+        return replace(int(match.group(2)), int(match.group(3)))
+    return _STRING_OR_REF.sub(sub, body)
+
+
+def referenced(body: bytes):
+    """Numeri degli oggetti referenziati dal corpo (stringhe escluse)"""
+    return [int(match.group(2)) for match in _STRING_OR_REF.finditer(body) if not match.group(1)]
+
+
+def serialize_object(num: int, gen: int, body: bytes, stream: Optional[bytes]) -> bytes:
+    parts = [b'%d %d obj\n' % (num, gen), body, b'\n']
+    if stream is not None:
+        parts += [b'stream\n', stream, b'\nendstream\n']
+    parts.append(b'endobj\n')
+    return b''.join(parts)
+
+
+def xref_stream(num: int, entries: List[Tuple[int, int, int]], trailer: bytes,
+                index: Optional[List[int]] = None, size: Optional[int] = None) -> bytes:
+    """
+    Cross-reference stream: voci (tipo, campo 2, campo 3), compresse con
+    predittore PNG Up (righe simili tra loro). Senza index le voci sono gli
+    oggetti 0..n-1; index ([primo, quanti, ...]) e size servono per le
+    sezioni parziali degli aggiornamenti incrementali.
+    """
+    width = max(1, (max(field for _, field, _ in entries).bit_length() + 7) // 8)
+    row_size = 1 + width + 2
+    rows = [kind.to_bytes(1, 'big') + field.to_bytes(width, 'big') + extra.to_bytes(2, 'big')
+            for kind, field, extra in entries]
+    encoded = bytearray()
+    previous = bytes(row_size)
+    for row in rows:
+        encoded.append(2)
+        encoded.extend((a - b) & 0xFF for a, b in zip(row, previous))
+        previous = row
+    data = zlib.compress(bytes(encoded), 9)
+    index_entry = b'/Index [%s]\n' % b' '.join(b'%d' % value for value in index) if index else b''
+    body = (b'<<\n/Type /XRef\n/Size %d\n/W [1 %d 2]\n%s%s\n/Filter /FlateDecode\n'
+            b'/DecodeParms <</Columns %d /Predictor 12>>\n/Length %d\n>>'
+            % (size if size is not None else len(entries), width, index_entry, trailer, row_size, len(data)))
+    return serialize_object(num, 0, body, data)
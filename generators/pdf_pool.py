@@ -0,0 +1,88 @@
+"""
+Pool di istanze KobakPDF riutilizzabili.
+
+Invece di creare un documento nuovo per ogni richiesta, il pool restituisce
+un'istanza già inizializzata e, al rilascio, la riporta allo stato salvato
+dopo __init__ (KobakPDF.reset): niente nuova istanza, margini, metadati e
+oggetti interni di fpdf2 ricreati solo dove serve.
+
+    pool = PdfPool(KobakContractPDF, size=8)
+    with pool.document() as pdf:
+        pdf_bytes = bytes(pdf.generate_contract(contract_data, None))
+
+I byte restituiti da output() restano validi dopo il rilascio; il documento
+invece non va più usato fuori dal blocco with.
+"""
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+from generators.base_pdf import KobakPDF
+
+
+class PdfPool:
+    """Istanze di pdf_class (stessi argomenti) riusate fra render. Thread-safe."""
+
+    def __init__(self, pdf_class=KobakPDF, size: int = 4, **pdf_kwargs):
+        """
+        Args:
+            pdf_class: Sottoclasse di KobakPDF
+            size: Istanze libere conservate al massimo (le altre vengono scartate)
+            pdf_kwargs: Argomenti del costruttore, uguali per tutte le istanze
+        """
+        self.pdf_class = pdf_class
+        self.size = size
+        self.pdf_kwargs = pdf_kwargs
+        self._idle: List[KobakPDF] = []
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self) -> KobakPDF:
+        """Documento pronto per un nuovo render (da restituire con release)"""
+        with self._lock:
+            if self._idle:
+                self.reused += 1
+                return self._idle.pop()
+            self.created += 1
+        pdf = self.pdf_class(**self.pdf_kwargs)
+        pdf.save_initial_state()
+        return pdf
+
+    def release(self, pdf: KobakPDF):
+        """Riporta il documento allo stato iniziale e lo rimette nel pool"""
+        pdf.reset()
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(pdf)
+
+    @contextmanager
+    def document(self):
+        pdf = self.acquire()
+        try:
+            yield pdf
+        finally:
+            self.release(pdf)
+
+    def stats(self) -> dict:
+        total = self.created + self.reused
+        return {
+            'created': self.created,
+            'reused': self.reused,
+            'idle': len(self._idle),
+            'reuse_rate': self.reused / total if total else 0.0,
+        }
+
+
+_pools: Dict[Tuple[type, tuple], PdfPool] = {}
+_pools_lock = threading.Lock()
+
+
+def default_pool(pdf_class=KobakPDF, **pdf_kwargs) -> PdfPool:
+    """Pool condiviso dal processo per pdf_class e argomenti (es. nei worker dei batch)"""
+    key = (pdf_class, tuple(sorted(pdf_kwargs.items())))
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(key, PdfPool(pdf_class, **pdf_kwargs))
+    return pool
@@ -0,0 +1,334 @@
+"""
+Specifiche dichiarative dei documenti compilate in piani di rendering.
+
+Una specifica (dict o JSON) elenca le sezioni del documento, i componenti
+di ciascuna sezione e da quali campi dei dati leggere i valori:
+
+    {
+        "sections": [
+            {"name": "cliente", "components": [
+                {"component": "info_section", "header": "CLIENTE",
+                 "rows": {"fields": [["Azienda:", "cliente.ragione_sociale"],
+                                     ["Città:", "{cliente.cap} {cliente.citta}"]]}}
+            ]}
+        ]
+    }
+
+Valori degli argomenti:
+    {"field": "a.b.0"}                  valore letto dai dati (chiavi e indici)
+    {"template": "{a.b} - {c:>5}"}     stringa formattata con campi dei dati
+    {"fields": [[label, campo], ...]}   righe (label, valore); il campo è un
+                                        percorso o un template se contiene "{"
+    {"each": "percorso", "row": [...]}  una riga per elemento della lista,
+                                        con campi relativi all'elemento
+    [passi...] per argomenti *_fn       sotto-piano usato come callback
+    qualsiasi altro valore              costante
+
+Il componente "x" chiama pdf.add_x(...) se esiste, altrimenti pdf.x(...).
+La specifica viene compilata una sola volta (metodi risolti, accessor e
+costanti precalcolati); il piano si esegue poi su molti record di dati.
+
+Con una FragmentCache (es. SECTION_CACHE) ogni sezione viene registrata come
+frammento indipendente dalla posizione, con chiave i valori dei campi che
+legge: cambiando un solo campo viene ridisegnata solo la sezione che lo usa.
+
+    plan.render(pdf, record, cache=SECTION_CACHE)
+"""
+import json
+from operator import itemgetter
+from pathlib import Path
+from string import Formatter
+from typing import Any, Callable, Dict, Hashable, List, NamedTuple, Optional, Tuple, Union
+
+from generators.base_pdf import KobakPDF
+from generators.fragment_cache import FragmentCache
+
+# Getter compilato: (pdf, data) -> valore
+Getter = Callable[[Any, Any], Any]
+
+
+class RenderStep(NamedTuple):
+    """Chiamata di un componente con argomenti già compilati"""
+    component: str
+    method: str
+    args: Tuple[Any, ...]
+    kwargs: Dict[str, Any]
+    dynamic_args: Tuple[Tuple[int, Getter], ...]
+    dynamic_kwargs: Tuple[Tuple[str, Getter], ...]
+
+
+class RenderSection(NamedTuple):
+    name: str
+    steps: Tuple[RenderStep, ...]
+    # Accessor dei campi letti dalla sezione (chiave del frammento in cache)
+    inputs: Tuple[Callable[[Any], Any], ...] = ()
+
+
+def _compile_path(path: str) -> Callable[[Any], Any]:
+    keys = [int(key) if key.isdigit() else key for key in path.split('.')]
+    if len(keys) == 1:
+        return itemgetter(keys[0])
+
+    def get(data):
+        for key in keys:
+            data = data[key]
+        return data
+    return get
+
+
+def _compile_template(template: str) -> Callable[[Any], str]:
+    parts = []
+    for literal, field, format_spec, conversion in Formatter().parse(template):
+        if conversion:
+            raise ValueError(f"Conversione !{conversion} non supportata nel template: {template}")
+        parts.append((literal, _compile_path(field) if field is not None else None, format_spec or ''))
+
+    def render(data):
+        out = []
+        for literal, get, format_spec in parts:
+            out.append(literal)
+            if get is not None:
+                out.append(format(get(data), format_spec))
+        return ''.join(out)
+    return render
+
+
+def _compile_field(value: str) -> Callable[[Any], Any]:
+    """Percorso ("a.b") oppure template ("{a} {b}") se contiene graffe"""
+    return _compile_template(value) if '{' in value else _compile_path(value)
+
+
+def _compile_row(row: List[Any]) -> Callable[[Any], list]:
+    """Riga di celle relative a un elemento: stringhe = campi, altro = costanti"""
+    cells = [_compile_field(cell) if isinstance(cell, str) else (lambda item, cell=cell: cell)
+             for cell in row]
+    return lambda item: [get(item) for get in cells]
+
+
+def _compile_value(key: str, value: Any, pdf_class) -> Tuple[bool, Any]:
+    """
+    Compila il valore di un argomento.
+
+    Returns:
+        (dinamico, valore): se dinamico è True il valore è un Getter,
+        altrimenti è la costante da passare così com'è
+    """
+    if key.endswith('_fn') and isinstance(value, list):
+        steps = _compile_steps(value, pdf_class)
+        return True, lambda pdf, data: (lambda: _run_steps(steps, pdf, data))
+
+    if isinstance(value, dict):
+        if set(value) == {'field'}:
+            get = _compile_path(value['field'])
+            return True, lambda pdf, data: get(data)
+        if set(value) == {'template'}:
+            render = _compile_template(value['template'])
+            return True, lambda pdf, data: render(data)
+        if set(value) == {'fields'}:
+            rows = [(label, _compile_field(field)) for label, field in value['fields']]
+            return True, lambda pdf, data: [(label, get(data)) for label, get in rows]
+        if set(value) == {'each', 'row'}:
+            get_items = _compile_path(value['each'])
+            make_row = _compile_row(value['row'])
+            return True, lambda pdf, data: [make_row(item) for item in get_items(data)]
+
+        compiled = {k: _compile_value(k, v, pdf_class) for k, v in value.items()}
+        if not any(dynamic for dynamic, _ in compiled.values()):
+            return False, {k: v for k, (_, v) in compiled.items()}
+        return True, lambda pdf, data: {
+            k: v(pdf, data) if dynamic else v for k, (dynamic, v) in compiled.items()
+        }
+
+    if isinstance(value, list):
+        compiled = [_compile_value(key, v, pdf_class) for v in value]
+        if not any(dynamic for dynamic, _ in compiled):
+            return False, [v for _, v in compiled]
+        return True, lambda pdf, data: [v(pdf, data) if dynamic else v for dynamic, v in compiled]
+
+    return False, value
+
+
+def _compile_step(spec: Dict[str, Any], pdf_class) -> RenderStep:
+    spec = dict(spec)
+    component = spec.pop('component')
+    method = f"add_{component}" if hasattr(pdf_class, f"add_{component}") else component
+    if not callable(getattr(pdf_class, method, None)):
+        raise ValueError(f"Componente sconosciuto per {pdf_class.__name__}: {component}")
+
+    args, dynamic_args = [], []
+    for i, value in enumerate(spec.pop('args', ())):
+        dynamic, compiled = _compile_value('', value, pdf_class)
+        args.append(None if dynamic else compiled)
+        if dynamic:
+            dynamic_args.append((i, compiled))
+
+    kwargs, dynamic_kwargs = {}, []
+    for key, value in spec.items():
+        dynamic, compiled = _compile_value(key, value, pdf_class)
+        if dynamic:
+            dynamic_kwargs.append((key, compiled))
+        else:
+            kwargs[key] = compiled
+
+    return RenderStep(component, method, tuple(args), kwargs, tuple(dynamic_args), tuple(dynamic_kwargs))
+
+
+def _compile_steps(specs: List[Dict[str, Any]], pdf_class) -> Tuple[RenderStep, ...]:
+    return tuple(_compile_step(spec, pdf_class) for spec in specs)
+
+
+def _template_fields(template: str) -> List[str]:
+    return [field for _, field, _, _ in Formatter().parse(template) if field]
+
+
+def _value_fields(key: str, value: Any) -> List[str]:
+    """Percorsi dei dati letti da un argomento (vedi _compile_value)"""
+    if key.endswith('_fn') and isinstance(value, list):
+        return _spec_fields(value)
+    if isinstance(value, dict):
+        if set(value) == {'field'}:
+            return [value['field']]
+        if set(value) == {'template'}:
+            return _template_fields(value['template'])
+        if set(value) == {'fields'}:
+            return [path for _, field in value['fields']
+                    for path in (_template_fields(field) if '{' in field else [field])]
+        if set(value) == {'each', 'row'}:
+            return [value['each']]
+        return [path for k, v in value.items() for path in _value_fields(k, v)]
+    if isinstance(value, list):
+        return [path for v in value for path in _value_fields(key, v)]
+    return []
+
+
+def _spec_fields(specs: List[Dict[str, Any]]) -> List[str]:
+    paths = []
+    for spec in specs:
+        for value in spec.get('args', ()):
+            paths += _value_fields('', value)
+        for key, value in spec.items():
+            if key not in ('component', 'args'):
+                paths += _value_fields(key, value)
+    return paths
+
+
+def _freeze(value: Any) -> Hashable:
+    """
+    Valore dei dati come chiave hashable (dict e liste annidati). Gli scalari
+    portano il tipo: 30, 30.0 e True sono uguali per Python ma si stampano
+    diversi ("30", "30.0", "True") e non devono condividere il frammento.
+    """
+    if isinstance(value, dict):
+        return ('dict', tuple(sorted((_freeze(key), _freeze(item)) for key, item in value.items())))
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__, tuple(_freeze(item) for item in value))
+    if isinstance(value, (set, frozenset)):
+        return ('set', frozenset(_freeze(item) for item in value))
+    return (type(value).__name__, value)
+
+
+def _run_steps(steps: Tuple[RenderStep, ...], pdf, data):
+    for step in steps:
+        args = step.args
+        if step.dynamic_args:
+            args = list(args)
+            for i, get in step.dynamic_args:
+                args[i] = get(pdf, data)
+        kwargs = step.kwargs
+        if step.dynamic_kwargs:
+            kwargs = dict(kwargs)
+            for key, get in step.dynamic_kwargs:
+                kwargs[key] = get(pdf, data)
+        # Risolto per nome sull'istanza: le sottoclassi possono ridefinire i componenti
+        getattr(pdf, step.method)(*args, **kwargs)
+
+
+class RenderPlan:
+    """
+    Piano di rendering compilato da una specifica dichiarativa.
+    È immutabile e riutilizzabile: compilarlo una volta, eseguirlo per ogni record.
+    """
+
+    def __init__(self, sections: Tuple[RenderSection, ...], pdf_class=KobakPDF):
+        self.sections = sections
+        self.pdf_class = pdf_class
+        # Identità del piano nelle chiavi dei frammenti (sezioni omonime di piani diversi)
+        self._fragment_token = object()
+
+    def render(self, pdf: KobakPDF, data: Any, sections: Optional[List[str]] = None,
+               cache: Optional[FragmentCache] = None):
+        """
+        Esegue il piano su un documento già creato.
+
+        Args:
+            pdf: Documento di destinazione (istanza di pdf_class)
+            data: Record di dati (dict annidati / liste)
+            sections: Nomi delle sezioni da eseguire (default: tutte)
+            cache: Se indicata, ogni sezione viene riusata dalla cache quando i
+                campi che legge hanno gli stessi valori (vedi _render_cached)
+        """
+        for section in self.sections:
+            if sections is None or section.name in sections:
+                # Registra le pagine della sezione (e lo span, se il tracing è attivo)
+                with pdf.section(section.name):
+                    if cache is None:
+                        _run_steps(section.steps, pdf, data)
+                    else:
+                        self._render_cached(pdf, section, data, cache)
+
+    def _render_cached(self, pdf: KobakPDF, section: RenderSection, data: Any, cache: FragmentCache):
+        steps = section.steps
+        # Le nuove pagine restano fuori dal frammento: header e footer dipendono dal numero di pagina
+        live = 0
+        while live < len(steps) and steps[live].method == 'add_page':
+            live += 1
+        _run_steps(steps[:live], pdf, data)
+        steps = steps[live:]
+        try:
+            key = (self._fragment_token, section.name, tuple(_freeze(get(data)) for get in section.inputs))
+            hash(key)
+        except (LookupError, TypeError):
+            # Campo mancante (l'errore arriva dal render) o valore non hashable
+            _run_steps(steps, pdf, data)
+            return
+        # Sezioni su più pagine o con immagini/link non vengono salvate: si disegnano dal vivo
+        pdf.render_cached_fragment(key, lambda: _run_steps(steps, pdf, data), cache)
+
+    def build(self, data: Any, **pdf_kwargs) -> KobakPDF:
+        """Crea un nuovo documento pdf_class ed esegue il piano sui dati"""
+        pdf = self.pdf_class(**pdf_kwargs)
+        self.render(pdf, data)
+        return pdf
+
+    @property
+    def section_names(self) -> List[str]:
+        return [section.name for section in self.sections]
+
+
+def compile_spec(spec: Union[Dict[str, Any], str], pdf_class=KobakPDF) -> RenderPlan:
+    """
+    Compila una specifica (dict o stringa JSON) in un RenderPlan.
+
+    Le sezioni possono essere dict {"name", "components"} oppure, per
+    documenti semplici, la specifica può avere direttamente "components".
+    """
+    if isinstance(spec, str):
+        spec = json.loads(spec)
+
+    raw_sections = spec.get('sections')
+    if raw_sections is None:
+        raw_sections = [{'name': 'main', 'components': spec.get('components', [])}]
+
+    sections = tuple(
+        RenderSection(section.get('name', f"section_{i}"),
+                      _compile_steps(section.get('components', []), pdf_class),
+                      tuple(_compile_path(path) for path in dict.fromkeys(_spec_fields(section.get('components', [])))))
+        for i, section in enumerate(raw_sections)
+    )
+    return RenderPlan(sections, pdf_class)
+
+
+def load_spec(path: Union[str, Path], pdf_class=KobakPDF) -> RenderPlan:
+    """Legge una specifica JSON da file e la compila"""
+    with open(path, encoding='utf-8') as f:
+        return compile_spec(json.load(f), pdf_class)
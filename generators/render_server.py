@@ -0,0 +1,314 @@
+"""
+Server HTTP di rendering, solo libreria standard.
+
+Riceve contract_data in JSON e risponde con il PDF. Il rendering gira su un
+pool di processi worker già avviati e riscaldati (fpdf2 importato, font,
+frammenti e sezioni in cache), mai nel thread della richiesta. Le richieste
+oltre la capacità (worker + coda) ricevono subito 503 invece di accumularsi.
+
+    python -m generators.render_server --port 8080 --workers 4 --queue 8
+    curl --data @contratto.json http://127.0.0.1:8080/render -o contratto.pdf
+
+Endpoint:
+    POST /render    corpo JSON contract_data -> application/pdf
+    GET  /health    stato, worker, richieste in corso e capacità
+    GET  /stats     esiti e latenze (p50/p90/p99) delle ultime richieste
+
+Connessioni keep-alive (HTTP/1.1). Con KOBAK_PDF_CACHE i worker servono i
+PDF già generati dalla cache su disco (vedi output_cache.py).
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from generators.kobak_contract_pdf import KobakContractPDF, sample_contract_data
+from generators.output_cache import render_document
+
+# Risposta di render: (stato HTTP, corpo, content type, header aggiuntivi)
+Response = Tuple[int, bytes, str, Dict[str, str]]
+
+
+def _warm_worker(pdf_class, warmup_data: Optional[dict]):
+    """Eseguito all'avvio di ogni worker: primo render fuori dalle richieste"""
+    if warmup_data is not None:
+        render_document(pdf_class, warmup_data)
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+class RenderStats:
+    """Esiti delle richieste e latenze dei render riusciti (ultime window). Thread-safe."""
+
+    OUTCOMES = ('ok', 'rejected', 'timeout', 'render_error', 'bad_request')
+
+    def __init__(self, window: int = 2048):
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.counts = dict.fromkeys(self.OUTCOMES, 0)
+        self.bytes_sent = 0
+        self.started = time.monotonic()
+
+    def record(self, outcome: str, seconds: Optional[float] = None, size: int = 0):
+        with self._lock:
+            self.counts[outcome] += 1
+            self.bytes_sent += size
+            if seconds is not None:
+                self._latencies.append(seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            counts = dict(self.counts)
+            bytes_sent = self.bytes_sent
+        uptime = time.monotonic() - self.started
+        return {
+            'uptime_s': round(uptime, 1),
+            'requests': sum(counts.values()),
+            **counts,
+            'bytes_sent': bytes_sent,
+            'latency_ms': {
+                'samples': len(latencies),
+                'p50': round(_percentile(latencies, 50) * 1000, 2),
+                'p90': round(_percentile(latencies, 90) * 1000, 2),
+                'p99': round(_percentile(latencies, 99) * 1000, 2),
+                'max': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+            },
+            'renders_per_s': round(counts['ok'] / uptime, 2) if uptime else 0.0,
+        }
+
+
+class RenderServer(ThreadingHTTPServer):
+    """
+    Server HTTP con pool di worker e coda limitata: al massimo
+    workers + queue_size render accettati (in coda o in esecuzione).
+    """
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], workers: Optional[int] = None,
+                 queue_size: Optional[int] = None, render_timeout: float = 30.0,
+                 max_body: int = 2 * 1024 * 1024, pdf_class=KobakContractPDF,
+                 warmup_data: Optional[dict] = None, verbose: bool = False):
+        """
+        Args:
+            address: (host, porta); 127.0.0.1 per il solo uso locale
+            workers: Processi di rendering (default: numero di CPU)
+            queue_size: Richieste in attesa oltre quelle in esecuzione (default: 2 * workers)
+            render_timeout: Secondi massimi di attesa di un render (poi 504)
+            max_body: Dimensione massima del JSON in ingresso (poi 413)
+            pdf_class: Generatore con generate_contract (importabile dai worker)
+            warmup_data: Dati del render di riscaldamento dei worker (default: contratto di esempio)
+            verbose: Log di ogni richiesta su stderr
+        """
+        super().__init__(address, RenderRequestHandler)
+        self.workers = workers or os.cpu_count() or 1
+        self.capacity = self.workers + (queue_size if queue_size is not None else 2 * self.workers)
+        self.render_timeout = render_timeout
+        self.max_body = max_body
+        self.pdf_class = pdf_class
+        self.warmup_data = warmup_data if warmup_data is not None else sample_contract_data()
+        self.verbose = verbose
+        self.stats = RenderStats()
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._pool_lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._start_pool()
+
+    # ==================== POOL DI WORKER ====================
+
+    def _start_pool(self):
+        executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_worker,
+                                       initargs=(self.pdf_class, self.warmup_data))
+        # Avvia subito i worker: il riscaldamento non pesa sulle prime richieste
+        for future in [executor.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+        self._executor = executor
+
+    def _restart_pool(self, broken: ProcessPoolExecutor):
+        with self._pool_lock:
+            if self._executor is not broken:
+                return  # già riavviato da un'altra richiesta
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._start_pool()
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def render(self, contract_data: Any) -> Response:
+        """Rende il contratto su un worker; 503 subito se la coda è piena"""
+        if not self._slots.acquire(blocking=False):
+            self.stats.record('rejected')
+            return _json_response(HTTPStatus.SERVICE_UNAVAILABLE, {'error': "server saturo, riprovare"},
+                                  {'Retry-After': '1'})
+        with self._lock:
+            self._in_flight += 1
+        start = time.perf_counter()
+        executor = self._executor
+        try:
+            future = executor.submit(render_document, self.pdf_class, contract_data)
+        except BrokenProcessPool:
+            self._release()
+            self._restart_pool(executor)
+            self.stats.record('render_error')
+            return _json_response(HTTPStatus.SERVICE_UNAVAILABLE, {'error': "worker riavviati, riprovare"},
+                                  {'Retry-After': '1'})
+        # Il posto si libera quando il worker ha davvero finito (anche dopo un timeout)
+        future.add_done_callback(self._release)
+
+        try:
+            pdf_bytes = future.result(timeout=self.render_timeout)
+        except FutureTimeout:
+            future.cancel()
+            self.stats.record('timeout')
+            return _json_response(HTTPStatus.GATEWAY_TIMEOUT, {'error': "render oltre il tempo massimo"})
+        except BrokenProcessPool:
+            self._restart_pool(executor)
+            self.stats.record('render_error')
+            return _json_response(HTTPStatus.INTERNAL_SERVER_ERROR, {'error': "worker terminato durante il render"})
+        except Exception as e:
+            # Dati non validi (campo mancante, tipo errato...)
+            self.stats.record('render_error')
+            return _json_response(HTTPStatus.UNPROCESSABLE_ENTITY, {'error': f"{type(e).__name__}: {e}"})
+        self.stats.record('ok', time.perf_counter() - start, len(pdf_bytes))
+        return HTTPStatus.OK, pdf_bytes, 'application/pdf', {}
+
+    # ==================== STATO ====================
+
+    def health(self) -> dict:
+        with self._lock:
+            in_flight = self._in_flight
+        return {
+            'status': 'saturated' if in_flight >= self.capacity else 'ok',
+            'workers': self.workers,
+            'in_flight': in_flight,
+            'capacity': self.capacity,
+        }
+
+    def server_close(self):
+        super().server_close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+def _json_response(status: int, payload: dict, headers: Optional[Dict[str, str]] = None) -> Response:
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    return status, body, 'application/json; charset=utf-8', headers or {}
+
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    """Richieste HTTP/1.1 con keep-alive: ogni risposta ha Content-Length"""
+    protocol_version = 'HTTP/1.1'
+    server_version = 'KobakRender/1.0'
+    # Connessioni keep-alive inattive chiuse dopo questi secondi
+    timeout = 30
+    server: RenderServer
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path == '/health':
+            self._send(*_json_response(HTTPStatus.OK, self.server.health()))
+        elif path == '/stats':
+            self._send(*_json_response(HTTPStatus.OK, {**self.server.stats.snapshot(), **self.server.health()}))
+        else:
+            self._send(*_json_response(HTTPStatus.NOT_FOUND, {'error': f"percorso sconosciuto: {path}"}))
+
+    def do_POST(self):
+        path = self.path.split('?', 1)[0]
+        if path != '/render':
+            self._discard_body()
+            self._send(*_json_response(HTTPStatus.NOT_FOUND, {'error': f"percorso sconosciuto: {path}"}))
+            return
+
+        length = self.headers.get('Content-Length')
+        if length is None or not length.isdigit():
+            # Corpo chunked o senza lunghezza: non si può riusare la connessione
+            self.close_connection = True
+            self.server.stats.record('bad_request')
+            self._send(*_json_response(HTTPStatus.LENGTH_REQUIRED, {'error': "Content-Length richiesto"}))
+            return
+        if int(length) > self.server.max_body:
+            self.close_connection = True
+            self.server.stats.record('bad_request')
+            self._send(*_json_response(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                                       {'error': f"corpo oltre {self.server.max_body} byte"}))
+            return
+
+        try:
+            contract_data = json.loads(self.rfile.read(int(length)))
+        except ValueError as e:
+            self.server.stats.record('bad_request')
+            self._send(*_json_response(HTTPStatus.BAD_REQUEST, {'error': f"JSON non valido: {e}"}))
+            return
+        if not isinstance(contract_data, dict):
+            self.server.stats.record('bad_request')
+            self._send(*_json_response(HTTPStatus.BAD_REQUEST, {'error': "contract_data deve essere un oggetto JSON"}))
+            return
+        self._send(*self.server.render(contract_data))
+
+    def _discard_body(self):
+        length = self.headers.get('Content-Length')
+        if length and length.isdigit():
+            self.rfile.read(int(length))
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: Dict[str, str]):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Una riga per richiesta solo in modalità verbose (i test di carico restano puliti)
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Server HTTP di rendering contratti Kobak")
+    parser.add_argument('--host', default='127.0.0.1', help="Indirizzo di ascolto (default: solo locale)")
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=None, help="Processi di rendering (default: numero di CPU)")
+    parser.add_argument('--queue', type=int, default=None, help="Richieste in coda oltre i worker (default: 2 * workers)")
+    parser.add_argument('--timeout', type=float, default=30.0, help="Secondi massimi per render (default: 30)")
+    parser.add_argument('--verbose', action='store_true', help="Log di ogni richiesta")
+    args = parser.parse_args(argv)
+
+    server = RenderServer((args.host, args.port), workers=args.workers, queue_size=args.queue,
+                          render_timeout=args.timeout, verbose=args.verbose)
+    host, port = server.server_address[:2]
+    print(f"✓ Render server su http://{host}:{port} ({server.workers} worker, capacità {server.capacity})")
+    # SIGTERM (systemd, docker stop) come Ctrl+C: chiude il server e il pool dei worker
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,57 @@
+"""
+Tabelle fpdf2 a blocchi, per righe in streaming.
+
+fpdf2 disegna una tabella solo alla chiusura del blocco `with pdf.table()`,
+tenendo in memoria tutte le righe. Per tabelle lunghe add_zebra_table la
+spezza in blocchi consecutivi di poche righe: ogni blocco successivo al primo
+è una ContinuationTable, che non ridisegna l'intestazione in cima al blocco
+(la tabella prosegue sulla stessa pagina) ma la ripete normalmente a ogni
+salto pagina.
+
+Le varianti Layout* servono al dry-run: stessa impaginazione, nessuna cella disegnata.
+"""
+from dataclasses import replace
+
+from fpdf.table import Table
+
+
+class ContinuationTable(Table):
+    """
+    Tabella che prosegue quella precedente: le righe di intestazione
+    iniziali vengono saltate finché si resta sulla pagina di partenza.
+
+    Le intestazioni non contano nei controlli di salto pagina (incluso
+    quello che fpdf2 fa prima della prima riga di dati): come nella tabella
+    intera, il blocco va a capo solo se non ci sta la riga successiva.
+    """
+
+    def __init__(self, fpdf, *args, **kwargs):
+        super().__init__(fpdf, *args, **kwargs)
+        self._start_page = fpdf.page
+        self._rendered_rows = 0
+
+    def _compute_rows_info(self):
+        for i, row_info in enumerate(super()._compute_rows_info()):
+            if i < self._num_heading_rows:
+                row_info = replace(row_info, pagebreak_height=0)
+            yield row_info
+
+    def _render_table_row(self, i, row_layout_info, cell_x_positions, **kwargs):
+        self._rendered_rows += 1
+        if self._rendered_rows <= self._num_heading_rows and self._fpdf.page == self._start_page:
+            return
+        super()._render_table_row(i, row_layout_info, cell_x_positions, **kwargs)
+
+
+class LayoutTable(Table):
+    """
+    Tabella in modalità dry-run: calcola altezze delle righe e salti pagina
+    come fpdf2, ma non disegna le celle.
+    """
+
+    def _render_table_row(self, i, row_layout_info, cell_x_positions, **kwargs):
+        self._fpdf.ln(row_layout_info.height)
+
+
+class LayoutContinuationTable(ContinuationTable, LayoutTable):
+    """ContinuationTable in modalità dry-run"""
@@ -0,0 +1,106 @@
+"""
+Cache di processo delle misure di testo (line-wrap di multi_cell).
+
+Etichette e valori si ripetono molto tra un documento e l'altro: il risultato
+del wrapping viene memorizzato con chiave font, stile, dimensione, larghezza,
+interlinea e testo, così le misure ripetute diventano lookup in un dizionario.
+
+Per le righe di tabella è disponibile anche un wrapping veloce basato sulle
+tabelle delle larghezze dei glifi (GlyphWidthTable), senza passare da multi_cell.
+"""
+from typing import Dict, Hashable, Tuple
+
+from generators.lru_cache import LRUCache
+
+
+class TextMetricsCache(LRUCache):
+    """
+    Cache LRU thread-safe delle righe prodotte dal wrapping di un testo.
+    Valori: tuple di stringhe, una per riga.
+    """
+
+    def __init__(self, max_entries: int = 8192):
+        super().__init__(max_entries)
+
+
+# Cache di default usata da KobakPDF._wrap_text_lines
+TEXT_METRICS_CACHE = TextMetricsCache()
+
+
+class GlyphWidthTable:
+    """
+    Larghezze dei glifi di un font (in millesimi di em), precalcolate una
+    volta per processo: misurare una stringa diventa una somma di lookup.
+    """
+    __slots__ = ('widths', '_cw')
+
+    def __init__(self, font):
+        self._cw = font.cw
+        # Font core: dict carattere -> larghezza; TTF: lista indicizzata per codepoint
+        self.widths: Dict[str, float] = dict(font.cw) if isinstance(font.cw, dict) else {}
+
+    def char_width(self, char: str) -> float:
+        width = self.widths.get(char)
+        if width is None:
+            code = ord(char)
+            width = self._cw[code] if code < len(self._cw) else 0
+            self.widths[char] = width
+        return width
+
+    def text_width(self, text: str) -> float:
+        widths = self.widths
+        try:
+            return sum(map(widths.__getitem__, text))
+        except KeyError:
+            return sum(map(self.char_width, text))
+
+
+_GLYPH_TABLES: Dict[Hashable, GlyphWidthTable] = {}
+
+
+def glyph_width_table(font) -> GlyphWidthTable:
+    """Tabella delle larghezze condivisa per font (chiave: fontkey + file TTF)"""
+    key = (font.fontkey, getattr(font, 'ttffile', None))
+    table = _GLYPH_TABLES.get(key)
+    if table is None:
+        table = _GLYPH_TABLES[key] = GlyphWidthTable(font)
+    return table
+
+
+def wrap_text(text: str, max_width: float, table: GlyphWidthTable) -> Tuple[str, ...]:
+    """
+    Spezza il testo in righe larghe al massimo max_width (stesse unità della
+    tabella), a capo sulle parole e sui caratteri per le parole troppo lunghe.
+    """
+    max_width += 1e-6
+    space_width = table.char_width(' ')
+    lines = []
+    for paragraph in text.split('\n'):
+        line, line_width = None, 0.0
+        for word in paragraph.split(' '):
+            word_width = table.text_width(word)
+            if line is not None:
+                if line_width + space_width + word_width <= max_width:
+                    line += ' ' + word
+                    line_width += space_width + word_width
+                    continue
+                lines.append(line)
+            # Parola a inizio riga: se non entra, spezza per caratteri
+            while word_width > max_width and len(word) > 1:
+                cut, cut_width = 0, 0.0
+                for char in word:
+                    char_width = table.char_width(char)
+                    if cut and cut_width + char_width > max_width:
+                        break
+                    cut += 1
+                    cut_width += char_width
+                lines.append(word[:cut])
+                word = word[cut:]
+                word_width -= cut_width
+            line, line_width = word, word_width
+        lines.append(line)
+    # Come multi_cell: la riga vuota lasciata da un "\n" o da uno spazio
+    # andato a capo in fondo al testo non viene emessa
+    if len(lines) > 1 and not lines[-1]:
+        lines.pop()
+    return tuple(lines)
@@ -0,0 +1,183 @@
+"""
+Tracing opzionale dei componenti KobakPDF.
+
+Con il tracing attivo ogni componente pubblico add_* (più header/footer)
+produce uno Span con tempo, pagine attraversate e byte aggiunti ai content
+stream; gli span vanno a un sink (memoria, JSON lines o callback).
+
+Il tracing si attiva per istanza sostituendo i metodi con wrapper a livello
+di istanza: da disattivato non esiste nessun wrapper, quindi costo zero.
+
+    sink = MemorySink()
+    pdf.enable_tracing(sink)
+    pdf.generate_contract(data, None)
+    print(sink.summary())
+"""
+import functools
+import json
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, IO, Iterable, List, NamedTuple, Optional, Union
+
+from fpdf import FPDF
+
+# Metodi tracciati oltre ai componenti add_*
+TRACED_METHODS = ('header', 'footer')
+
+
+class Span(NamedTuple):
+    """
+    Misura di una chiamata di componente.
+
+    depth: livello di annidamento (0 = chiamata di primo livello)
+    start_ms: inizio rispetto all'attivazione del tracing
+    pages_crossed: pagine aggiunte durante la chiamata
+    bytes_added: byte aggiunti ai content stream (figli inclusi)
+    """
+    name: str
+    document: Optional[str]
+    depth: int
+    start_ms: float
+    duration_ms: float
+    page_start: int
+    page_end: int
+    pages_crossed: int
+    bytes_added: int
+
+
+# ==================== SINK ====================
+
+class MemorySink:
+    """Conserva gli span in memoria (test, diagnostica interattiva)"""
+
+    def __init__(self):
+        self.spans: List[Span] = []
+
+    def emit(self, span: Span):
+        self.spans.append(span)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Totali per nome di span: chiamate, tempo totale e massimo, byte"""
+        totals: Dict[str, Dict[str, float]] = {}
+        for span in self.spans:
+            entry = totals.setdefault(span.name, {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'bytes': 0})
+            entry['calls'] += 1
+            entry['total_ms'] += span.duration_ms
+            entry['max_ms'] = max(entry['max_ms'], span.duration_ms)
+            entry['bytes'] += span.bytes_added
+        return dict(sorted(totals.items(), key=lambda item: -item[1]['total_ms']))
+
+    def clear(self):
+        self.spans.clear()
+
+
+class JsonLinesSink:
+    """Scrive uno span per riga in formato JSON su file (append) o stream di testo"""
+
+    def __init__(self, dest: Union[str, IO[str]]):
+        self._owned = isinstance(dest, str)
+        self._stream = open(dest, 'a', encoding='utf-8') if self._owned else dest
+
+    def emit(self, span: Span):
+        self._stream.write(json.dumps(span._asdict()) + '\n')
+
+    def close(self):
+        if self._owned:
+            self._stream.close()
+        else:
+            self._stream.flush()
+
+
+class CallbackSink:
+    """Passa ogni span a una funzione (es. esportatore verso un sistema di metriche)"""
+
+    def __init__(self, callback: Callable[[Span], Any]):
+        self.callback = callback
+
+    def emit(self, span: Span):
+        self.callback(span)
+
+
+# ==================== TRACER ====================
+
+def _content_length(pdf: FPDF, page: int) -> int:
+    if page < 1:
+        return 0
+    contents = pdf.pages[page].contents
+    # Dopo output() i content stream vengono finalizzati: nessuna misura
+    return len(contents) if isinstance(contents, bytearray) else 0
+
+
+class Tracer:
+    """Stato del tracing di un documento: sink, annidamento e origine dei tempi"""
+
+    def __init__(self, pdf: FPDF, sink, document: Optional[str] = None):
+        self.pdf = pdf
+        self.sink = CallbackSink(sink) if callable(sink) and not hasattr(sink, 'emit') else sink
+        self.document = document
+        self.depth = 0
+        self.origin = time.perf_counter()
+        self.wrapped: List[str] = []
+
+    @contextmanager
+    def span(self, name: str):
+        """Span manuale (es. sezioni di un piano di rendering)"""
+        pdf = self.pdf
+        page_start = pdf.page
+        bytes_start = _content_length(pdf, page_start)
+        depth = self.depth
+        self.depth += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self.depth = depth
+            page_end = pdf.page
+            bytes_added = sum(_content_length(pdf, page) for page in range(max(page_start, 1), page_end + 1))
+            self.sink.emit(Span(
+                name, self.document, depth, (start - self.origin) * 1000, duration * 1000,
+                page_start, page_end, page_end - page_start, max(0, bytes_added - bytes_start),
+            ))
+
+    def wrap(self, name: str, method: Callable) -> Callable:
+        span = self.span
+
+        @functools.wraps(method)
+        def traced(*args, **kwargs):
+            with span(name):
+                return method(*args, **kwargs)
+        return traced
+
+
+def traced_method_names(pdf_class: type, extra: Iterable[str] = ()) -> List[str]:
+    """Componenti add_* definiti nelle classi Kobak (sotto FPDF) più header/footer"""
+    names = set(TRACED_METHODS) | set(extra)
+    for cls in pdf_class.__mro__:
+        if cls is FPDF or not issubclass(cls, FPDF):
+            continue
+        names.update(name for name, value in vars(cls).items()
+                     if name.startswith('add_') and callable(value))
+    return sorted(names)
+
+
+def install_tracing(pdf: FPDF, sink, document: Optional[str] = None,
+                    extra_methods: Iterable[str] = ()) -> Tracer:
+    """Sostituisce i componenti dell'istanza con wrapper tracciati"""
+    uninstall_tracing(pdf)
+    tracer = Tracer(pdf, sink, document)
+    for name in traced_method_names(type(pdf), extra_methods):
+        setattr(pdf, name, tracer.wrap(name, getattr(pdf, name)))
+        tracer.wrapped.append(name)
+    pdf._tracer = tracer
+    return tracer
+
+
+def uninstall_tracing(pdf: FPDF):
+    """Rimuove i wrapper: l'istanza torna a usare direttamente i metodi di classe"""
+    tracer = getattr(pdf, '_tracer', None)
+    if tracer is None:
+        return
+    for name in tracer.wrapped:
+        pdf.__dict__.pop(name, None)
+    pdf._tracer = None
@@ -0,0 +1,24 @@
+"""merge_pdfs con PDF nei profili di output standard e compatto"""
+import io
+
+from generators.assembly import merge_pdfs
+from generators.base_pdf import KobakPDF
+from generators.pdf_objects import PdfReader, ref
+
+
+def _document(text, profile):
+    pdf = KobakPDF()
+    pdf.set_output_profile(profile)
+    pdf.add_page()
+    pdf.cell(0, 10, text)
+    return bytes(pdf.output())
+
+
+def test_merge_compact_and_standard():
+    out = io.BytesIO()
+    report = merge_pdfs([_document("Uno", 'compact'), _document("Due", 'standard')], out)
+    assert (report.documents, report.pages) == (2, 2)
+    reader = PdfReader(io.BytesIO(out.getvalue()))
+    root = reader.object(ref(reader.trailer, b'/Root')[0])
+    pages = reader.object(ref(root.body, b'/Pages')[0])
+    assert b'/Count 2' in pages.body
@@ -0,0 +1,58 @@
+"""generate_contracts_batch: gli errori dei worker diventano BatchResult"""
+import os
+
+from generators.kobak_contract_pdf import KobakContractPDF, generate_contracts_batch, sample_contract_data
+
+
+class CrashingContractPDF(KobakContractPDF):
+    """Termina il processo worker sui contratti con 'crash'"""
+
+    def generate_contract(self, contract_data, output_path):
+        if contract_data.get('crash'):
+            os._exit(1)
+        return super().generate_contract(contract_data, output_path)
+
+
+def _contracts(*overrides):
+    return [dict(sample_contract_data(), **override) for override in overrides]
+
+
+def _run(contracts, tmp_path, **kwargs):
+    return list(generate_contracts_batch(
+        contracts, str(tmp_path / "contratto_{index}.pdf"), max_workers=1, max_in_flight=1, **kwargs
+    ))
+
+
+def test_unpicklable_record_is_reported(tmp_path):
+    results = _run(_contracts({}, {'callback': lambda: None}, {}), tmp_path)
+    assert [result.index for result in results] == [0, 1, 2]
+    assert [result.ok for result in results] == [True, False, True]
+
+
+def test_batch_continues_after_worker_crash(tmp_path):
+    for ordered in (True, False):
+        results = _run(_contracts({}, {'crash': True}, {}), tmp_path,
+                       ordered=ordered, pdf_class=CrashingContractPDF)
+        assert [result.index for result in results] == [0, 1, 2]
+        assert [result.ok for result in results] == [True, False, True]
+        assert 'BrokenProcessPool' in results[1].error
+        assert (tmp_path / "contratto_2.pdf").read_bytes().startswith(b'%PDF-')
+
+
+def test_output_path_errors_are_reported(tmp_path):
+    def path_for(index, contract_data):
+        if index == 2:
+            raise RuntimeError("percorso non disponibile")
+        return str(tmp_path / f"contratto_{index}.pdf")
+
+    for ordered in (True, False):
+        results = list(generate_contracts_batch(
+            [sample_contract_data(), None, sample_contract_data(), sample_contract_data()],
+            path_for, max_workers=1, max_in_flight=1, ordered=ordered,
+        ))
+        assert [result.index for result in results] == [0, 1, 2, 3]
+        assert [result.ok for result in results] == [True, False, False, True]
+        assert 'RuntimeError' in results[2].error
+
+    results = _run([sample_contract_data(), None, sample_contract_data()], tmp_path)
+    assert [result.ok for result in results] == [True, False, True]
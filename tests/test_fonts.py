@@ -0,0 +1,33 @@
+"""Font TTF del registro: stili disponibili prima del primo set_font"""
+from pathlib import Path
+
+import pytest
+
+from generators.base_pdf import KobakPDF
+from generators.fonts import register_font
+
+DEJAVU = Path('/usr/share/fonts/truetype/dejavu')
+
+pytestmark = pytest.mark.skipif(not (DEJAVU / 'DejaVuSans-Bold.ttf').is_file(),
+                                reason="font DejaVu non installati")
+
+
+@pytest.fixture(scope='module')
+def family():
+    register_font('DejaVuTest', DEJAVU / 'DejaVuSans.ttf', bold=DEJAVU / 'DejaVuSans-Bold.ttf')
+    return 'DejaVuTest'
+
+
+def test_zebra_table_headings_are_first_bold_use(family):
+    pdf = KobakPDF(font=family)
+    pdf.add_page()
+    pdf.add_zebra_table(['Città', 'Τηλέφωνο'], [['Élysées', '1']])
+    assert bytes(pdf.output()).startswith(b'%PDF-')
+
+
+def test_add_table_headings_are_first_bold_use(family):
+    pdf = KobakPDF(font=family)
+    pdf.add_page()
+    pdf.add_table([['1', '2']], headers=['A', 'B'])
+    assert {f"{family.lower()}{style}" for style in ('', 'B', 'I', 'BI')} <= set(pdf.fonts)
+    assert bytes(pdf.output()).startswith(b'%PDF-')
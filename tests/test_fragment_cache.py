@@ -0,0 +1,53 @@
+"""Frammenti su più pagine con local_context aperti ai salti pagina"""
+from contextlib import nullcontext
+
+import pytest
+
+from generators.base_pdf import KobakPDF
+from generators.fragment_cache import FragmentCache
+
+ROWS = [[f"Riga {i}", str(i), "pz", f"{i},00", f"{i * 2},00"] for i in range(100)]
+
+
+def _render(cache, outer):
+    """Tabella lunga dentro un local_context; senza cache disegnata dal vivo"""
+    pdf = KobakPDF()
+    pdf.set_compression(False)
+    pdf.add_page()
+
+    def table():
+        with pdf.local_context(draw_color=(200, 0, 0), line_width=0.6):
+            pdf.add_zebra_table(["A", "B", "C", "D", "E"], ROWS)
+        pdf.cell(0, 8, "Dopo la tabella")
+
+    hit = False
+    with pdf.local_context(text_color=(0, 0, 200)) if outer else nullcontext():
+        if cache is None:
+            table()
+        else:
+            hit = pdf.render_cached_fragment('tabella', table, cache=cache)
+    pdf.cell(0, 8, "Fine")
+    return hit, pdf
+
+
+def _assert_balanced(pdf):
+    for page in pdf.pages.values():
+        depth = 0
+        for line in bytes(page.contents).splitlines():
+            depth += (line == b'q') - (line == b'Q')
+            assert depth >= 0
+        assert depth == 0
+
+
+@pytest.mark.parametrize('outer', [False, True])
+def test_nested_state_at_page_break_is_cached(outer):
+    cache = FragmentCache()
+    _, live = _render(None, outer)
+    first_hit, first = _render(cache, outer)
+    second_hit, second = _render(cache, outer)
+
+    assert (first_hit, second_hit) == (False, True)
+    assert live.page > 2
+    for pdf in (live, first, second):
+        _assert_balanced(pdf)
+        assert (pdf.page, round(pdf.y, 3)) == (live.page, round(live.y, 3))
@@ -0,0 +1,45 @@
+"""append_pages: riferimenti rinumerati solo fuori dalle stringhe"""
+import io
+
+import pytest
+
+from generators.base_pdf import KobakPDF
+from generators.incremental import append_pages
+
+# pypdf non è fra le dipendenze: serve solo a rileggere il risultato
+PdfReader = pytest.importorskip('pypdf').PdfReader
+
+URI = "https://example.com/rif/99 0 R"
+
+
+def _original(profile='standard'):
+    pdf = KobakPDF()
+    pdf.set_output_profile(profile)
+    pdf.add_page()
+    pdf.cell(0, 10, "Contratto")
+    return bytes(pdf.output())
+
+
+def _firma(pdf):
+    pdf.add_page()
+    pdf.cell(0, 10, "Firmato")
+    pdf.link(10, 10, 50, 10, URI)
+
+
+def test_reference_like_text_in_strings_is_kept():
+    updated = append_pages(_original(), _firma)
+    reader = PdfReader(io.BytesIO(updated))
+    assert len(reader.pages) == 2
+    page = reader.pages[1]
+    assert "Firmato" in page.extract_text()
+    assert page.get('/Parent').get_object()['/Count'] == 2
+    assert [annot.get_object()['/A']['/URI'] for annot in page['/Annots']] == [URI]
+
+
+@pytest.mark.parametrize('profile', ['standard', 'compact'])
+def test_append_to_each_output_profile(profile):
+    updated = append_pages(append_pages(_original(profile), _firma), _firma)
+    reader = PdfReader(io.BytesIO(updated), strict=True)
+    texts = [page.extract_text() for page in reader.pages]
+    assert ["Contratto" in texts[0], "Firmato" in texts[1], "Firmato" in texts[2]] == [True] * 3
+    assert reader.trailer['/Root']['/Pages']['/Count'] == 3
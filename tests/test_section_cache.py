@@ -0,0 +1,43 @@
+"""Chiavi della cache delle sezioni (RenderPlan.render con cache)"""
+import pytest
+
+from generators.base_pdf import KobakPDF
+from generators.fragment_cache import FragmentCache
+from generators.kobak_contract_pdf import KobakContractPDF
+from generators.render_plan import _freeze, compile_spec
+
+PLAN = compile_spec({
+    "sections": [
+        {"name": "giorni", "components": [
+            {"component": "page"},
+            {"component": "cell", "args": [0, 5, {"template": "Giorni: {value}"}]},
+        ]},
+    ]
+})
+
+
+def _render(value, cache):
+    pdf = KobakPDF()
+    pdf.set_compression(False)
+    PLAN.render(pdf, {'value': value}, cache=cache)
+    return bytes(pdf.output())
+
+
+@pytest.mark.parametrize('first, second', [(30, 30.0), (1, True), (0, False), (30.0, 30)])
+def test_equal_but_different_scalars_have_different_keys(first, second):
+    assert _freeze(first) != _freeze(second)
+    assert _freeze({'a': [first]}) != _freeze({'a': [second]})
+
+
+@pytest.mark.parametrize('first, second', [(30, 30.0), (1, True)])
+def test_cached_section_shows_current_value(first, second):
+    cache = FragmentCache()
+    _render(first, cache)
+    assert _render(first, cache).count(f"Giorni: {first}".encode()) == 1
+    warm = _render(second, cache)
+    assert f"Giorni: {second}".encode() in warm
+    assert f"Giorni: {first})".encode() not in warm
+
+
+def test_contract_section_cache_is_opt_in():
+    assert KobakContractPDF.section_cache is None
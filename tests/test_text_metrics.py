@@ -0,0 +1,40 @@
+"""wrap_text (righe di tabella veloci) uguale al wrapping di multi_cell"""
+import random
+
+import pytest
+
+from generators.base_pdf import KobakPDF
+
+WORDS = ['a', 'IVA', 'Noleggio', 'bagno', 'chimico', 'supercalifragilistichespiralidoso', '22%', 'è', '', 'x' * 40]
+SEPARATORS = [' ', ' ', ' ', '  ', '\n']
+
+
+def _random_texts(count, seed=7):
+    rng = random.Random(seed)
+    for _ in range(count):
+        parts = []
+        for _ in range(rng.randint(0, 12)):
+            parts += [rng.choice(WORDS), rng.choice(SEPARATORS)]
+        if rng.random() < 0.5:
+            parts = parts[:-1]
+        yield ''.join(parts), rng.choice([15, 20, 30, 45, 60])
+
+
+@pytest.fixture(scope='module')
+def pdf():
+    pdf = KobakPDF()
+    pdf.add_page()
+    pdf.set_font('helvetica', '', 8)
+    return pdf
+
+
+@pytest.mark.parametrize('text', ['', '\n', '\n\n', ' ', 'a ', 'a \n', 'a\n\n', 'x' * 40 + '  ',
+                                  'chimico a    bagno       IVA ', 'Noleggio   \nNoleggio 22%  '])
+def test_trailing_space_and_newline(pdf, text):
+    assert pdf._fast_wrap_lines(text, 20) == tuple(pdf.multi_cell(20, 4, text, dry_run=True, output='LINES'))
+
+
+def test_random_texts_match_multi_cell(pdf):
+    for text, width in _random_texts(2000):
+        expected = tuple(pdf.multi_cell(width, 4, text, dry_run=True, output='LINES'))
+        assert pdf._fast_wrap_lines(text, width) == expected, (text, width)
@@ -0,0 +1,23 @@
+"""Impaginazione di add_zebra_table a blocchi uguale alla tabella intera"""
+import pytest
+
+from generators.base_pdf import KobakPDF
+
+HEADERS = ["DESCRIZIONE", "QTÀ", "UNITÀ", "PREZZO", "TOTALE"]
+ROWS = [[f"Riga {i}", str(i), "pz", f"{i},00", f"{i * 2},00"] for i in range(120)]
+
+
+def _layout(chunk_size, dry_run=False):
+    pdf = KobakPDF()
+    if dry_run:
+        pdf.enable_dry_run()
+    pdf.add_page()
+    pdf.add_zebra_table(HEADERS, ROWS, chunk_size=chunk_size)
+    return pdf.page, round(pdf.y, 3)
+
+
+# 7, 11, 13, 33: blocchi che iniziano con spazio per una sola riga a fine pagina
+@pytest.mark.parametrize('chunk_size', [7, 11, 13, 33, 64])
+@pytest.mark.parametrize('dry_run', [False, True])
+def test_chunks_paginate_like_single_table(chunk_size, dry_run):
+    assert _layout(chunk_size, dry_run) == _layout(len(ROWS), dry_run)
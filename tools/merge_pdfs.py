@@ -0,0 +1,46 @@
+"""
+Unisce i PDF generati (es. i contratti del giorno) in un unico file per la
+tipografia: font, logo e pagine statiche comuni vengono scritti una volta
+sola e ogni documento ha il suo segnalibro.
+
+Uso:
+    python -m tools.merge_pdfs -o stampa_2024-01-20.pdf contratti/*.pdf
+    python -m tools.merge_pdfs -o stampa.pdf --from-dir contratti/ --no-outline
+
+(dalla cartella del progetto, come modulo: così generators è importabile)
+"""
+import argparse
+import sys
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from generators.assembly import merge_pdfs
+
+
+def _sources(files: List[str], directory: Optional[str]) -> Iterator[Path]:
+    for name in files:
+        yield Path(name)
+    if directory:
+        # Ordine per nome (i batch numerano i file: contratto_00001.pdf, ...)
+        yield from sorted(Path(directory).glob('*.pdf'))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Unisce PDF KobakPDF in un unico file di stampa")
+    parser.add_argument('files', nargs='*', help="PDF da unire, nell'ordine")
+    parser.add_argument('-o', '--output', required=True, help="File PDF di uscita")
+    parser.add_argument('--from-dir', default=None, help="Aggiunge i PDF della cartella, in ordine di nome")
+    parser.add_argument('--no-outline', action='store_true', help="Nessun segnalibro per documento")
+    args = parser.parse_args(argv)
+
+    if not args.files and not args.from_dir:
+        parser.error("nessun PDF in ingresso")
+    output = Path(args.output).resolve()
+    sources = (path for path in _sources(args.files, args.from_dir) if path.resolve() != output)
+    report = merge_pdfs(sources, output, outline=not args.no_outline)
+    print(f"✓ {output}: {report.summary()}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())